@@ -9,7 +9,9 @@
 
 
 import sys
+import time
 from collections import defaultdict
+from hashlib import md5
 import logging
 log = logging.getLogger("zen.ApplyDataMap")
 
@@ -36,6 +38,11 @@ CLASSIFIER_CLASS = '/Classifier'
 
 _notAscii = dict.fromkeys(range(128,256), u'?')
 
+# seconds after which a datamap is compared with the model again even if
+# it is identical to the last one applied
+SNAPSHOT_MAX_AGE = 24 * 60 * 60
+SNAPSHOT_MAX_ENTRIES = 20000
+
 
 def isSameData(x, y):
     """
@@ -53,11 +60,79 @@ def isSameData(x, y):
     return x == y
 
 
+def _fingerprint(objmap):
+    """
+    Return a digest of the data of an ObjectMap, or None if it has no
+    modname to compare.
+    """
+    modname = getattr(objmap, 'modname', None)
+    if not modname:
+        return None
+    try:
+        data = repr((modname, objmap.classname, sorted(objmap.items())))
+    except Exception:
+        return None
+    return md5(data).digest()
+
+
+class DataMapSnapshots(object):
+    """
+    Fingerprints of the datamaps last applied to each device, used to skip
+    datamaps identical to the last ones applied without loading the objects
+    they describe.
+
+    Each entry is recorded with a token: the device's last change time and,
+    for relationship maps, the ids in the relationship.  An entry is only
+    used while its token is unchanged, and for at most maxAge seconds after
+    the map was last compared with the model.
+    """
+
+    def __init__(self, maxAge=SNAPSHOT_MAX_AGE, maxEntries=SNAPSHOT_MAX_ENTRIES):
+        self.maxAge = maxAge
+        self.maxEntries = maxEntries
+        # key -> (token, time recorded, fingerprint, component fingerprints)
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, token):
+        """
+        Return the fingerprint and component fingerprints recorded for key
+        with token, or None.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        entryToken, recorded, fingerprint, components = entry
+        if entryToken != token or time.time() - recorded > self.maxAge:
+            del self._entries[key]
+            return None
+        return fingerprint, components
+
+    def set(self, key, token, fingerprint, components=None):
+        if key not in self._entries and len(self._entries) >= self.maxEntries:
+            self._entries.clear()
+        self._entries[key] = (token, time.time(), fingerprint, components)
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+_snapshots = DataMapSnapshots()
+
+
 class ApplyDataMap(object):
 
     def __init__(self, datacollector=None):
         self.datacollector = datacollector
         self.num_obj_changed=0
+        self.snapshots = _snapshots
+        self._pendingSnapshot = None
+        self._blocked = False
         self._dmd = None
         if datacollector:
             self._dmd = getattr(datacollector, 'dmd', None)
@@ -152,6 +227,8 @@ class ApplyDataMap(object):
                 return False
 
         changed = False
+        self._pendingSnapshot = None
+        self._blocked = False
 
         if hasattr(datamap, "parentId") or hasattr(datamap, "compname"):
             if getattr(datamap, "parentId", None):
@@ -180,18 +257,23 @@ class ApplyDataMap(object):
             else:
                 tobj = device
 
+            snapshotKey = self._snapshotKey(device, tobj, datamap)
             if hasattr(datamap, "relname"):
                 logname = datamap.relname
-                changed = self._updateRelationship(tobj, datamap)
+                changed = self._updateRelationship(tobj, datamap, snapshotKey)
             elif hasattr(datamap, 'modname'):
                 logname = datamap.compname
-                changed = self._updateObject(tobj, datamap)
+                changed = self._updateObjectMap(tobj, datamap, snapshotKey)
             else:
                 log.warn("plugin returned unknown map skipping")
 
         if changed:
             device.setLastChange()
 
+        if self._pendingSnapshot is not None and not self._blocked:
+            self._recordSnapshot(device, tobj, datamap, *self._pendingSnapshot)
+        self._pendingSnapshot = None
+
         log.debug(
             "_applyDataMap for Device %s will modify %d objects for %s",
             device.getId(),
@@ -201,8 +283,79 @@ class ApplyDataMap(object):
         return changed
 
 
-    def _updateRelationship(self, device, relmap):
+    def _snapshotKey(self, device, tobj, datamap):
+        """
+        Return the key of the snapshot of datamap, or None if snapshots
+        can't be used for it.
+        """
+        if self.snapshots is None:
+            return None
+        base = aq_base(device)
+        if getattr(base, '_p_oid', None) is None or \
+                getattr(base, '_lastChange', None) is None:
+            return None
+        path = '' if tobj is device else '/'.join(tobj.getPrimaryPath())
+        if hasattr(datamap, 'relname'):
+            return base._p_oid, path, 'relname', datamap.relname
+        try:
+            attributes = tuple(sorted(n for n, v in datamap.items()))
+        except Exception:
+            return None
+        return base._p_oid, path, 'modname', datamap.modname, attributes
+
+    def _snapshotToken(self, device, rel=None):
+        token = (aq_base(device)._lastChange,)
+        if rel is not None:
+            token += (hash(frozenset(rel.objectIdsAll())),)
+        return token
+
+    def _recordSnapshot(self, device, tobj, datamap, key, fingerprint, components):
+        rel = None
+        if hasattr(datamap, 'relname'):
+            rel = getattr(tobj, datamap.relname, None)
+            if rel is None:
+                return
+        self.snapshots.set(key, self._snapshotToken(device, rel),
+                           fingerprint, components)
+
+    def _updateObjectMap(self, obj, objmap, snapshotKey=None):
+        """Update an object using an objmap unless the objmap is the same
+        as the one last applied to it.
+        """
+        if snapshotKey is None:
+            return self._updateObject(obj, objmap)
+        fingerprint = _fingerprint(objmap)
+        if fingerprint is None:
+            return self._updateObject(obj, objmap)
+        known = self.snapshots.get(snapshotKey, self._snapshotToken(obj.device()))
+        if known is not None and known[0] == fingerprint:
+            log.debug("objmap for %s unchanged since last applied, skipping",
+                      obj.id)
+            return False
+        self._pendingSnapshot = (snapshotKey, fingerprint, None)
+        return self._updateObject(obj, objmap)
+
+    def _relmapFingerprints(self, relmap):
+        fingerprints = []
+        for objmap in relmap:
+            fingerprint = None
+            if hasattr(objmap, 'id'):
+                fingerprint = _fingerprint(objmap)
+            if fingerprint is None:
+                return None, None
+            fingerprints.append(fingerprint)
+        digest = md5(repr((relmap.relname, relmap.compname,
+                           getattr(relmap, 'parentId', ''))))
+        for fingerprint in fingerprints:
+            digest.update(fingerprint)
+        return digest.digest(), fingerprints
+
+    def _updateRelationship(self, device, relmap, snapshotKey=None):
         """Add/Update/Remote objects to the target relationship.
+
+        If snapshotKey is given, objects whose objmaps are the same as the
+        ones last applied are not updated, and nothing is done if the whole
+        relmap is the same as the one last applied.
         """
         changed = False
         rname = relmap.relname
@@ -212,17 +365,45 @@ class ApplyDataMap(object):
                           relmap.relname, device.id, device.__class__, device.zPythonClass)
             return changed
         relids = set(rel.objectIdsAll())
+
+        fingerprints = known = components = None
+        if snapshotKey is not None:
+            relFingerprint, fingerprints = self._relmapFingerprints(relmap)
+        if fingerprints is not None:
+            token = (aq_base(device.device())._lastChange, hash(frozenset(relids)))
+            snapshot = self.snapshots.get(snapshotKey, token)
+            if snapshot is not None:
+                if snapshot[0] == relFingerprint:
+                    log.debug("relmap %s on %s unchanged since last applied, skipping",
+                              rname, device.id)
+                    return changed
+                known = snapshot[1]
+            components = {}
+            self._pendingSnapshot = (snapshotKey, relFingerprint, components)
+
         seenids = defaultdict(int)
-        for objmap in relmap:
+        for i, objmap in enumerate(relmap):
             from Products.ZenModel.ZenModelRM import ZenModelRM
             if hasattr(objmap, 'modname') and hasattr(objmap, 'id'):
                 objmap_id = objmap.id
                 seenids[objmap_id] += 1
                 if seenids[objmap_id] > 1:
                     objmap_id = objmap.id = "%s_%s" % (objmap_id, seenids[objmap_id])
+                if components is not None:
+                    components[objmap_id] = fingerprints[i]
                 if objmap_id in relids:
                     obj = rel._getOb(objmap_id)
 
+                    # Skip objects whose objmap has not changed since it
+                    # was last applied, without loading them.
+                    cls = obj.__class__
+                    if known is not None and \
+                            known.get(objmap_id) == fingerprints[i] and \
+                            objmap.modname == cls.__module__ and \
+                            objmap.classname in ('', cls.__name__):
+                        relids.discard(objmap_id)
+                        continue
+
                     # Handle the possibility of objects changing class by
                     # recreating them. Ticket #5598.
                     existing_modname = ''
@@ -271,6 +452,7 @@ class ApplyDataMap(object):
                 except Exception: pass
                 msg = "Deletion Blocked: %s '%s' on %s" % (
                         obj.meta_type, objname,obj.device().id)
+                self._blocked = True
                 log.warn(msg)
                 if obj.sendEventWhenBlocked():
                     self.logEvent(device, obj, Change_Remove_Blocked,
@@ -311,6 +493,7 @@ class ApplyDataMap(object):
                 except Exception: pass
                 msg = "Update Blocked: %s '%s' on %s" % (
                         obj.meta_type, objname ,device.id)
+            self._blocked = True
             log.warn(msg)
             if obj.sendEventWhenBlocked():
                 self.logEvent(device, obj,Change_Set_Blocked,msg,Event.Warning)
@@ -417,6 +600,7 @@ class ApplyDataMap(object):
             except Exception: pass
             msg = "Add Blocked: %s '%s' on %s" % (
                     objtype, id, realdevice.id)
+            self._blocked = True
             log.warn(msg)
             if realdevice.sendEventWhenBlocked():
                 self.logEvent(realdevice, id, Change_Add_Blocked,
@@ -0,0 +1,205 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+__doc__ = """PluginProcessPool
+
+Runs the preprocess and process methods of modeler plugins in a pool of
+worker processes, so that plugins with heavy processing do not hold up the
+reactor of zenmodeler.  Plugins opt in by setting processInWorker; the
+device proxy, the plugin's results and the DataMaps it returns must all be
+picklable.  Results not processed by a worker within the timeout, e.g.
+because the worker died, are processed in zenmodeler instead, and the
+pool is replaced.
+"""
+
+import time
+import logging
+import traceback
+import multiprocessing
+import cPickle as pickle
+
+from twisted.internet import defer, reactor
+
+log = logging.getLogger('zen.PluginProcessPool')
+
+# seconds a worker is given to process the results of a plugin
+DEFAULT_TIMEOUT = 300
+
+# plugins created in this worker process, by module path
+_plugins = {}
+
+
+class PluginProcessError(Exception):
+    """
+    A plugin failed in a worker process.
+    """
+
+    def __init__(self, message, traceback=''):
+        Exception.__init__(self, message)
+        self.traceback = traceback
+
+
+def _processInWorker(data):
+    """
+    Run in a worker process: process the results of a plugin.
+
+    @param data: pickled plugin loader, device proxy and results
+    @type data: string
+    @return: success flag, the pickled DataMaps (or the error message and
+        traceback on failure), and the seconds spent processing
+    @rtype: tuple
+    """
+    start = time.time()
+    try:
+        loader, device, results = pickle.loads(data)
+        plugin = _plugins.get(loader.modPath)
+        if plugin is None:
+            plugin = _plugins[loader.modPath] = loader.create()
+        pluginLog = logging.getLogger('zen.ZenModeler')
+        datamaps = []
+        results = plugin.preprocess(results, pluginLog)
+        if results:
+            datamaps = plugin.process(device, results, pluginLog)
+        payload = pickle.dumps(datamaps, pickle.HIGHEST_PROTOCOL)
+        return True, payload, time.time() - start
+    except BaseException as ex:
+        # the pool only calls back with a result, never with an error
+        return False, (str(ex), traceback.format_exc()), time.time() - start
+
+
+class _Task(object):
+    """
+    Results of a plugin sent to a worker.
+    """
+
+    def __init__(self, data, pool):
+        self.data = data
+        self.pool = pool
+        self.deferred = defer.Deferred()
+        self.result = None
+        self.timeoutCall = None
+
+
+class PluginProcessPool(object):
+    """
+    Pool of worker processes running modeler plugins.
+
+    @param workers: number of worker processes
+    @type workers: int
+    @param maxTasksPerChild: number of plugin runs before a worker is
+        replaced by a new one
+    @type maxTasksPerChild: int
+    @param timeout: seconds a worker is given to process the results of a
+        plugin
+    @type timeout: float
+    """
+
+    def __init__(self, workers, maxTasksPerChild=100, timeout=DEFAULT_TIMEOUT):
+        self._workers = workers
+        self._maxTasksPerChild = maxTasksPerChild
+        self._timeout = timeout
+        self._pool = None
+        self._pending = set()
+        self._shutdownTrigger = None
+
+    def _getPool(self):
+        # fork the workers only when they are first needed
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(
+                self._workers, maxtasksperchild=self._maxTasksPerChild)
+            if self._shutdownTrigger is None:
+                self._shutdownTrigger = reactor.addSystemEventTrigger(
+                    'before', 'shutdown', self.close)
+        return self._pool
+
+    def process(self, loader, device, results):
+        """
+        Process the results of a plugin in a worker process.
+
+        @param loader: loader of the plugin
+        @type loader: PluginLoader
+        @param device: device proxy the results were collected from
+        @type device: DeviceProxy
+        @param results: results collected by the plugin
+        @return: a Deferred firing with the DataMaps returned by the plugin
+            and the seconds spent processing them, or None if the
+            arguments cannot be sent to a worker
+        """
+        try:
+            data = pickle.dumps((loader, device, results),
+                                pickle.HIGHEST_PROTOCOL)
+        except Exception as ex:
+            log.debug("Unable to send %s results to a worker: %s",
+                      loader.pluginName, ex)
+            return None
+
+        task = _Task(data, self._getPool())
+
+        def done(reply):
+            # called in a thread of the pool
+            reactor.callFromThread(self._finished, task, reply)
+
+        self._pending.add(task)
+        task.result = task.pool.apply_async(_processInWorker, (data,),
+                                            callback=done)
+        task.timeoutCall = reactor.callLater(self._timeout, self._timedOut,
+                                             task)
+        task.deferred.addCallback(self._unpack)
+        return task.deferred
+
+    def _finished(self, task, reply):
+        if task not in self._pending:
+            # already processed in zenmodeler
+            return
+        self._pending.discard(task)
+        if task.timeoutCall.active():
+            task.timeoutCall.cancel()
+        task.deferred.callback(reply)
+
+    def _timedOut(self, task):
+        if task not in self._pending:
+            return
+        if task.result.ready():
+            # the callback is on its way, unless the pool failed the task
+            try:
+                reply = task.result.get(0)
+            except Exception as ex:
+                reply = False, (str(ex), traceback.format_exc()), 0
+            self._finished(task, reply)
+            return
+        log.warning("No worker processed plugin results within %s seconds; "
+                    "processing them in zenmodeler and replacing the workers",
+                    self._timeout)
+        self._recycle(task.pool)
+
+    def _recycle(self, pool):
+        """
+        Replace a pool that lost a worker, processing the results sent to
+        it in zenmodeler.
+        """
+        if pool is self._pool:
+            self._pool = None
+        pool.terminate()
+        for task in [t for t in self._pending if t.pool is pool]:
+            self._pending.discard(task)
+            if task.timeoutCall.active():
+                task.timeoutCall.cancel()
+            task.deferred.callback(_processInWorker(task.data))
+
+    def _unpack(self, reply):
+        success, payload, elapsed = reply
+        if not success:
+            message, tb = payload
+            raise PluginProcessError(message, tb)
+        return pickle.loads(payload), elapsed
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
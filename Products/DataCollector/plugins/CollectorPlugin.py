@@ -33,6 +33,9 @@ class CollectorPlugin(object):
     modname = ""
     classname = ""
     weight = 1
+    # run preprocess and process in a zenmodeler worker process; the
+    # results and the returned DataMaps must be picklable
+    processInWorker = False
     deviceProperties = ('id',
                         'manageIp',
                         '_snmpLastCollection',
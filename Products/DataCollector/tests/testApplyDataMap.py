@@ -147,6 +147,45 @@ class ApplyDataMapTest(BaseTestCase):
 
         self.assertEquals(1, len(device.os.interfaces))
 
+    def testUnchangedRelmapSkipped(self):
+        import transaction
+        from Products.DataCollector.ApplyDataMap import DataMapSnapshots
+        from Products.DataCollector.plugins.DataMaps import ObjectMap
+        device = self.dmd.Devices.createInstance('testDevice')
+        transaction.savepoint()
+        self.adm.snapshots = DataMapSnapshots()
+
+        def relmap(speed=100):
+            return RelationshipMap("interfaces", "os", "Products.ZenModel.IpInterface",
+                                   [{'id': 'eth%d' % i, 'speed': speed if i == 0 else 100}
+                                    for i in range(3)])
+
+        updated = []
+        updateObject = self.adm._updateObject
+        def spy(obj, objmap):
+            updated.append(obj.id)
+            return updateObject(obj, objmap)
+        self.adm._updateObject = spy
+
+        self.assertTrue(self.adm._applyDataMap(device, relmap(), commit=False))
+        self.assertEquals(3, len(device.os.interfaces))
+        del updated[:]
+
+        self.assertFalse(self.adm._applyDataMap(device, relmap(), commit=False))
+        self.assertEquals(updated, [])
+
+        # only the changed component is updated
+        self.assertTrue(self.adm._applyDataMap(device, relmap(1000), commit=False))
+        self.assertEquals(updated, ['eth0'])
+        self.assertEquals(device.os.interfaces.eth0.speed, 1000)
+
+        # a change made outside of modeling invalidates the snapshot
+        del updated[:]
+        device.os.interfaces._delObject('eth2')
+        self.assertTrue(self.adm._applyDataMap(device, relmap(1000), commit=False))
+        self.assertEquals(3, len(device.os.interfaces))
+
+
 def test_suite():
     from unittest import TestSuite, makeSuite
     suite = TestSuite()
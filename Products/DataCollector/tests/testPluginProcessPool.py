@@ -0,0 +1,147 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+import unittest
+import cPickle as pickle
+from twisted.internet.task import Clock
+from Products.DataCollector import PluginProcessPool as pool
+from Products.DataCollector.plugins.CollectorPlugin import CollectorPlugin
+from Products.DataCollector.plugins.DataMaps import ObjectMap
+
+
+class SquarePlugin(CollectorPlugin):
+    processInWorker = True
+
+    def preprocess(self, results, log):
+        return [int(r) for r in results]
+
+    def process(self, device, results, log):
+        return ObjectMap({'id': device.id, 'squares': [r * r for r in results]})
+
+
+class BrokenPlugin(CollectorPlugin):
+
+    def process(self, device, results, log):
+        raise ValueError("cannot process %s" % device.id)
+
+
+class ExitingPlugin(CollectorPlugin):
+
+    def process(self, device, results, log):
+        raise SystemExit(1)
+
+
+class FakeResult(object):
+    """
+    Result of a task whose worker died.
+    """
+
+    def ready(self):
+        return False
+
+
+class FakePool(object):
+
+    def __init__(self):
+        self.tasks = []
+        self.terminated = False
+
+    def apply_async(self, func, args, callback):
+        self.tasks.append((args, callback))
+        return FakeResult()
+
+    def terminate(self):
+        self.terminated = True
+
+
+class FakeLoader(object):
+
+    def __init__(self, pluginClass):
+        self.pluginClass = pluginClass
+        self.modPath = pluginClass.__name__
+        self.pluginName = pluginClass.__name__
+
+    def create(self):
+        return self.pluginClass()
+
+
+class FakeDevice(object):
+
+    def __init__(self, id):
+        self.id = id
+
+
+class PluginProcessPoolTest(unittest.TestCase):
+
+    def tearDown(self):
+        pool._plugins.clear()
+        pool.reactor = self.reactor
+
+    def setUp(self):
+        self.reactor = pool.reactor
+
+    def run_plugin(self, pluginClass, results):
+        data = pickle.dumps((FakeLoader(pluginClass), FakeDevice('dev1'), results))
+        return pool._processInWorker(data)
+
+    def testProcess(self):
+        success, payload, elapsed = self.run_plugin(SquarePlugin, ['2', '3'])
+        self.assertTrue(success)
+        self.assertTrue(elapsed >= 0)
+        om = pickle.loads(payload)
+        self.assertEqual(om.id, 'dev1')
+        self.assertEqual(om.squares, [4, 9])
+        # the plugin is created once per worker
+        plugin = pool._plugins['SquarePlugin']
+        self.run_plugin(SquarePlugin, ['4'])
+        self.assertTrue(pool._plugins['SquarePlugin'] is plugin)
+
+    def testFailure(self):
+        success, payload, elapsed = self.run_plugin(BrokenPlugin, ['x'])
+        self.assertFalse(success)
+        message, tb = payload
+        self.assertEqual(message, 'cannot process dev1')
+        self.assertTrue('ValueError' in tb)
+        self.assertRaises(pool.PluginProcessError,
+                          pool.PluginProcessPool(1)._unpack,
+                          (success, payload, elapsed))
+
+    def testFailureAlwaysReturned(self):
+        success, payload, elapsed = self.run_plugin(ExitingPlugin, ['x'])
+        self.assertFalse(success)
+        self.assertTrue('SystemExit' in payload[1])
+
+    def testTimeoutProcessesInZenModeler(self):
+        clock = pool.reactor = Clock()
+        processPool = pool.PluginProcessPool(2, timeout=60)
+        fakePool = processPool._pool = FakePool()
+        results = []
+        for values in (['2'], ['3']):
+            d = processPool.process(FakeLoader(SquarePlugin),
+                                    FakeDevice('dev1'), values)
+            d.addCallback(results.append)
+        self.assertEqual(2, len(fakePool.tasks))
+        clock.advance(59)
+        self.assertEqual([], results)
+        # a worker was lost: both results are processed here, and the
+        # workers replaced
+        clock.advance(1)
+        self.assertTrue(fakePool.terminated)
+        self.assertTrue(processPool._pool is None)
+        self.assertEqual([[4], [9]],
+                         sorted(datamaps.squares for datamaps, elapsed in results))
+        self.assertEqual([], clock.getDelayedCalls())
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(PluginProcessPoolTest))
+    return suite
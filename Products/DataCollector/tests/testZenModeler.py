@@ -0,0 +1,126 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+import collections
+import logging
+import unittest
+from optparse import Values
+
+from twisted.internet import defer
+
+from Products.DataCollector.zenmodeler import ZenModeler
+
+
+class FakeDevice(object):
+
+    skipModelMsg = ''
+
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeModelerService(object):
+
+    def __init__(self):
+        self.requests = []
+
+    def callRemote(self, method, names, checkStatus):
+        d = defer.Deferred()
+        self.requests.append((names, d))
+        return d
+
+
+class FakeDriver(object):
+
+    result = None
+
+    def next(self):
+        return self.result
+
+
+class PrefetchModeler(ZenModeler):
+
+    def __init__(self, devices, parallel, prefetch):
+        # only what filling the collection slots uses
+        self.log = logging.getLogger('zen.ZenModeler')
+        self.options = Values({'parallel': parallel, 'prefetch': prefetch,
+                               'checkStatus': False})
+        self.service = FakeModelerService()
+        self.services = {'ModelerService': self.service}
+        self.clients = []
+        self.prefetched = collections.deque()
+        self.pendingNewClients = False
+        self.devicegen = iter(devices)
+
+    def collectDevice(self, device):
+        self.clients.append(device)
+
+    def checkStop(self, unused=None):
+        pass
+
+
+class ZenModelerPrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.names = ['dev%d' % i for i in range(10)]
+        self.modeler = PrefetchModeler(self.names, parallel=2, prefetch=3)
+        self.driver = FakeDriver()
+
+    def fill(self, missing=()):
+        """
+        Run fillCollectionSlots, answering every config request with the
+        devices requested, except the missing ones.
+        """
+        for d in self.modeler.fillCollectionSlots(self.driver):
+            names, remote = self.modeler.service.requests[-1]
+            self.driver.result = [FakeDevice(name) for name in names
+                                  if name not in missing]
+            remote.callback(self.driver.result)
+
+    def clientIds(self):
+        return [device.id for device in self.modeler.clients]
+
+    def prefetchedIds(self):
+        return [device.id for device in self.modeler.prefetched]
+
+    def testBatchFillsSlots(self):
+        self.fill()
+        # one request for the free slots and the devices to prefetch
+        self.assertEqual([self.names[:5]],
+                         [names for names, d in self.modeler.service.requests])
+        self.assertEqual(['dev0', 'dev1'], self.clientIds())
+        self.assertEqual(['dev2', 'dev3', 'dev4'], self.prefetchedIds())
+
+    def testFreedSlotFilledFromPrefetched(self):
+        self.fill()
+        self.modeler.clients.pop(0)
+        self.fill()
+        self.assertEqual(['dev1', 'dev2'], self.clientIds())
+        # the prefetched devices are topped up
+        self.assertEqual(['dev5'], self.modeler.service.requests[-1][0])
+        self.assertEqual(['dev3', 'dev4', 'dev5'], self.prefetchedIds())
+
+    def testMissingDevicesSkipped(self):
+        self.fill(missing=['dev1', 'dev2', 'dev4'])
+        self.assertEqual(['dev0', 'dev3'], self.clientIds())
+        self.assertEqual(['dev5', 'dev6', 'dev7'], self.prefetchedIds())
+
+    def testDeletedDevicesDropped(self):
+        self.fill()
+        self.modeler.remote_deleteDevices(['dev3'])
+        self.modeler.remote_deleteDevice('dev4')
+        self.assertEqual(['dev2'], self.prefetchedIds())
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(ZenModelerPrefetchTest))
+    return suite
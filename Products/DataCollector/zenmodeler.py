@@ -37,6 +37,8 @@ from Products.ZenEvents.ZenEventClasses import Heartbeat, Error
 from Products.Zuul.utils import safe_hasattr as hasattr
 from Products.ZenUtils.metricwriter import ThresholdNotifier
 from Products.DataCollector import Classifier
+from Products.DataCollector.PluginProcessPool import PluginProcessPool, \
+    DEFAULT_TIMEOUT as DEFAULT_PROCESS_TIMEOUT
 from Products.ZenCollector.interfaces import IEventService
 from Products.ZenCollector.daemon import parseWorkerOptions, addWorkerOptions
 
@@ -60,10 +62,11 @@ import os
 import sys
 import traceback
 from random import randint
-from itertools import chain
+from itertools import chain, islice
 
 defaultPortScanTimeout = 5
 defaultParallel = 1
+defaultPrefetch = 10
 defaultProtocol = "ssh"
 defaultPort = 22
 
@@ -111,8 +114,17 @@ class ZenModeler(PBDaemon):
         self.clients = []
         self.finished = []
         self.devicegen = None
+        # device configs fetched ahead of free collection slots
+        self.prefetched = collections.deque()
         self.counters = collections.Counter()
         self.configFilter = None
+        # plugin name -> [runs, seconds spent processing results]
+        self.pluginTimes = collections.defaultdict(lambda: [0, 0.0])
+        self.processPool = None
+        if self.options.processWorkers > 0 and not self.options.debug:
+            self.processPool = PluginProcessPool(
+                self.options.processWorkers,
+                timeout=self.options.processWorkerTimeout)
 
         # Make sendEvent() available to plugins
         zope.component.provideUtility(self, IEventService)
@@ -225,6 +237,7 @@ class ZenModeler(PBDaemon):
         for loader in device.plugins:
             try:
                 plugin= loader.create()
+                plugin._pluginLoader = loader
                 self.log.debug( "Loaded plugin %s" % plugin.name() )
                 plugins.append( plugin )
                 valid_loaders.append( loader )
@@ -632,9 +645,22 @@ class ZenModeler(PBDaemon):
                     self.log.debug("Plugin %s results = %s", plugin.name(), results)
                     datamaps = []
                     try:
-                        results = plugin.preprocess(results, self.log)
-                        if results:
-                            datamaps = plugin.process(device, results, self.log)
+                        processed = None
+                        loader = getattr(plugin, '_pluginLoader', None)
+                        if (self.processPool is not None and loader is not None
+                            and getattr(plugin, 'processInWorker', False)):
+                            processed = self.processPool.process(
+                                loader, device, results)
+                        if processed is not None:
+                            yield processed
+                            datamaps, elapsed = driver.next()
+                        else:
+                            start = time.time()
+                            results = plugin.preprocess(results, self.log)
+                            if results:
+                                datamaps = plugin.process(device, results, self.log)
+                            elapsed = time.time() - start
+                        self._recordPluginTime(plugin.name(), elapsed)
                         if datamaps:
                             pluginStats.setdefault(plugin.name(), plugin.weight)
 
@@ -659,7 +685,8 @@ class ZenModeler(PBDaemon):
                         self.log.error( info )
                         evt[ 'summary' ]= info
 
-                        info= traceback.format_exc()
+                        # failures in a worker process carry their traceback
+                        info= getattr(ex, 'traceback', None) or traceback.format_exc()
                         self.log.error( info )
                         evt[ 'message' ]= info
                         self.sendEvent( evt )
@@ -720,6 +747,29 @@ class ZenModeler(PBDaemon):
         d = drive(processClient)
         d.addBoth(processClientFinished)
 
+    def _recordPluginTime(self, pluginName, elapsed):
+        times = self.pluginTimes[pluginName]
+        times[0] += 1
+        times[1] += elapsed
+
+    def _reportPluginTimes(self):
+        """
+        Log the time spent processing the results of each plugin during
+        the cycle, slowest first.
+        """
+        if not self.pluginTimes:
+            return
+        ranked = sorted(self.pluginTimes.iteritems(),
+                        key=lambda item: item[1][1], reverse=True)
+        total = sum(secs for runs, secs in self.pluginTimes.itervalues())
+        self.log.info("Plugin processing time: %0.2f seconds", total)
+        for name, (runs, secs) in ranked[:10]:
+            self.log.info("  %s: %0.2f seconds over %d devices", name, secs, runs)
+        for name, (runs, secs) in ranked[10:]:
+            self.log.debug("  %s: %0.2f seconds over %d devices", name, secs, runs)
+        self.rrdStats.gauge('pluginProcessTime', total)
+        self.pluginTimes.clear()
+
     def savePluginData(self, deviceName, pluginName, dataType, data):
         filename = "/tmp/%s.%s.%s.pickle.gz" % (deviceName, pluginName, dataType)
         try:
@@ -828,7 +878,7 @@ class ZenModeler(PBDaemon):
         @type unused: string
         """
         if self.pendingNewClients or self.clients: return
-        if self._devicegen_has_items: return
+        if self.prefetched or self._devicegen_has_items: return
 
         if self.start:
             runTime = time.time() - self.start
@@ -839,40 +889,58 @@ class ZenModeler(PBDaemon):
             self.rrdStats.gauge('cycleTime', runTime)
             self.rrdStats.gauge('devices', devices)
             self.rrdStats.gauge('timedOut', timedOut)
+            self._reportPluginTimes()
             if not self.options.cycle:
                 self.stop()
             self.finished = []
 
+    def _prefetchSize(self):
+        """
+        Return the number of device configs to have on hand: enough to
+        fill every free collection slot, plus --prefetch more.
+        """
+        free = max(self.options.parallel - len(self.clients), 0)
+        return free + self.options.prefetch
+
+    def _collectPrefetched(self):
+        """
+        Start collecting from prefetched devices until every collection
+        slot is in use.
+        """
+        while len(self.clients) < self.options.parallel and self.prefetched:
+            device = self.prefetched.popleft()
+            if device.skipModelMsg:
+                self.log.info(device.skipModelMsg)
+            else:
+                self.collectDevice(device)
+
     def fillCollectionSlots(self, driver):
         """
-        An iterator which either returns a device to collect or
+        An iterator which fills the free collection slots with devices,
+        fetching their configs in batches ahead of demand, or
         calls checkStop()
         @param driver: driver object
         @type driver: driver object
         """
         count = len(self.clients)
-        while count < self.options.parallel and self._devicegen_has_items \
-            and not self.pendingNewClients:
+        self._collectPrefetched()
+        while len(self.prefetched) < self._prefetchSize() \
+            and self._devicegen_has_items and not self.pendingNewClients:
             self.pendingNewClients = True
             try:
-                device = self.devicegen.next()
-                yield self.config().callRemote('getDeviceConfig', [device],
+                names = list(islice(self.devicegen,
+                                    self._prefetchSize() - len(self.prefetched)))
+                yield self.config().callRemote('getDeviceConfig', names,
                                             self.options.checkStatus)
-                # just collect one device, and let the timer add more
-                devices = driver.next()
-                if devices:
-                    d = devices[0]
-                    if d.skipModelMsg:
-                        self.log.info(d.skipModelMsg)
-                    else:
-                        self.collectDevice(d)
-                else:
-                    self.log.info("Device %s not returned is it down?", device)
-            except StopIteration:
-                self.devicegen = None
+                devices = driver.next() or []
+                returned = set(d.id for d in devices)
+                for device in names:
+                    if device not in returned:
+                        self.log.info("Device %s not returned is it down?", device)
+                self.prefetched.extend(devices)
             finally:
                 self.pendingNewClients = False
-            break
+            self._collectPrefetched()
         update = len(self.clients)
         if update != count and update != 1:
             self.log.info('Running %d clients', update)
@@ -932,6 +1000,20 @@ class ZenModeler(PBDaemon):
         self.parser.add_option('--parallel', dest='parallel',
                 type='int', default=defaultParallel,
                 help="Number of devices to collect from in parallel")
+        self.parser.add_option('--prefetch', dest='prefetch',
+                type='int', default=defaultPrefetch,
+                help="Number of device configs to fetch ahead of "
+                     "free collection slots")
+        self.parser.add_option('--processworkers', dest='processWorkers',
+                type='int', default=0,
+                help="Number of worker processes running the plugins that "
+                     "support it, 0 to run every plugin in zenmodeler")
+        self.parser.add_option('--processworkertimeout',
+                dest='processWorkerTimeout', type='float',
+                default=DEFAULT_PROCESS_TIMEOUT,
+                help="Seconds a worker process is given to process the "
+                     "results of a plugin before they are processed in "
+                     "zenmodeler")
         self.parser.add_option('--cycletime',
                 dest='cycletime', type='int',
                 help="Run collection every x minutes")
@@ -1119,6 +1201,7 @@ class ZenModeler(PBDaemon):
         self.log.debug("getDeviceList returned %s devices", len(deviceList))
         self.log.debug("getDeviceList returned %s devices", deviceList)
         self.devicegen = iter(deviceList)
+        self.prefetched.clear()
         d = drive(self.fillCollectionSlots)
         d.addErrback(self.fillError)
         yield d
@@ -1149,6 +1232,7 @@ class ZenModeler(PBDaemon):
         """
         # we fetch the device list before every scan
         self.log.debug("Asynch deleteDevice %s" % device)
+        self._forgetPrefetched([device])
 
     def remote_deleteDevices(self, devices):
         """
@@ -1160,6 +1244,15 @@ class ZenModeler(PBDaemon):
         """
         # we fetch the device list before every scan
         self.log.debug("Asynch deleteDevices {0}".format(len(devices)))
+        self._forgetPrefetched(devices)
+
+    def _forgetPrefetched(self, devices):
+        """
+        Drop the prefetched configs of deleted devices.
+        """
+        devices = set(devices)
+        self.prefetched = collections.deque(
+            d for d in self.prefetched if d.id not in devices)
 
 
 if __name__ == '__main__':
@@ -1,26 +1,58 @@
 ##############################################################################
-# 
+#
 # Copyright (C) Zenoss, Inc. 2011, all rights reserved.
-# 
+#
 # This content is made available according to terms specified in
 # License.zenoss under the directory where your Zenoss product is installed.
-# 
+#
 ##############################################################################
 
 
-from Products.ZenUtils.FileCache import FileCache
+import logging
 import os
 
+from Products.ZenUtils.FileCache import FileCache
+from Products.ZenUtils.IndexedFileCache import IndexedFileCache
+
+log = logging.getLogger('zen.DeviceConfigCache')
+
+CACHE_FILENAME = 'configs.cache'
+
+
 class DeviceConfigCache(object):
+    """
+    Stores the config proxies of each monitor in a single indexed file,
+    basepath/<monitor>/configs.cache.  Config proxies are only unpickled
+    when asked for.
+    """
+
     def __init__(self, basepath):
         self.basepath = basepath
+        self._caches = {}
 
     def _getFileCache(self, monitor):
-        return FileCache(os.path.join(self.basepath, monitor))
+        cache = self._caches.get(monitor)
+        if cache is None:
+            path = os.path.join(self.basepath, monitor)
+            cache = IndexedFileCache(os.path.join(path, CACHE_FILENAME))
+            self._importLegacyCache(path, cache)
+            self._caches[monitor] = cache
+        return cache
+
+    def _importLegacyCache(self, path, cache):
+        # Earlier versions stored one pickle file per device.
+        if not os.path.isdir(path):
+            return
+        legacy = FileCache(path)
+        if legacy:
+            items = legacy.items()
+            cache.update(items)
+            legacy.clear()
+            log.info("Imported %d cached configs from %s", len(items), path)
 
     def cacheConfigProxies(self, prefs, configs):
-        for cfg in configs:
-            self.updateConfigProxy(prefs, cfg)
+        cache = self._getFileCache(prefs.options.monitor)
+        cache.update((cfg.configId, cfg) for cfg in configs)
 
     def updateConfigProxy(self, prefs, config):
         cache = self._getFileCache(prefs.options.monitor)
@@ -40,10 +72,15 @@ class DeviceConfigCache(object):
         if cfgids:
             ret = []
             for cfgid in cfgids:
-                if cfgid in cache:
-                    config = cache[cfgid]
-                    if config:
-                        ret.append(config)
+                config = cache.get(cfgid, None)
+                if config:
+                    ret.append(config)
             return ret
         else:
             return filter(None, cache.values())
+
+    def compact(self, prefs):
+        """
+        Drop superseded configs from the monitor's cache file.
+        """
+        self._getFileCache(prefs.options.monitor).compact()
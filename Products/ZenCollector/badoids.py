@@ -0,0 +1,112 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+"""
+Helpers for SNMP collectors to find the OIDs a device fails to answer and
+to remember them across restarts.
+"""
+
+import logging
+
+from twisted.internet import defer
+
+from Products.ZenUtils.IndexedFileCache import IndexedFileCache
+from Products.ZenUtils.Utils import zenPath
+
+log = logging.getLogger('zen.collector.badoids')
+
+
+@defer.inlineCallbacks
+def isolateBadOids(oidChunks, fetchChunks):
+    """
+    Fetch chunks of OIDs, splitting every chunk that fails in two and
+    fetching the halves again until the failing OIDs are found.  Isolating
+    k bad OIDs out of n takes O(k log n) requests.
+
+    @param oidChunks: lists of OIDs to fetch in one request each
+    @type oidChunks: sequence
+    @param fetchChunks: called with a list of chunks; returns a Deferred
+        firing with the chunks that failed as a whole
+    @type fetchChunks: callable
+    @return: Deferred firing with the set of OIDs that failed on their own
+    """
+    bad = set()
+    oidChunks = [list(c) for c in oidChunks if c]
+    while oidChunks:
+        failed = yield fetchChunks(oidChunks)
+        oidChunks = []
+        for oidChunk in failed:
+            if len(oidChunk) == 1:
+                bad.update(oidChunk)
+            else:
+                middle = len(oidChunk) // 2
+                oidChunks.append(oidChunk[:middle])
+                oidChunks.append(oidChunk[middle:])
+        if oidChunks:
+            log.debug("Bisecting %d failed chunks", len(failed))
+    defer.returnValue(bad)
+
+
+class BadOidStore(object):
+    """
+    Remembers the bad OIDs of each device across daemon restarts.
+
+    Every save appends the OIDs of the device to the file, so the file is
+    compacted once most of it holds superseded OIDs; this is checked every
+    COMPACT_CHECK_SAVES saves.
+    """
+
+    COMPACT_CHECK_SAVES = 100
+
+    def __init__(self, filename):
+        self._cache = IndexedFileCache(filename)
+        self._saves = 0
+
+    def get(self, deviceId):
+        """
+        @return: the bad OIDs last saved for the device
+        @rtype: set
+        """
+        try:
+            return set(self._cache.get(deviceId, ()))
+        except Exception:
+            log.warn("Unable to read bad OIDs of %s", deviceId)
+            return set()
+
+    def save(self, deviceId, oids):
+        if oids:
+            self._cache[deviceId] = sorted(oids)
+        elif deviceId in self._cache:
+            del self._cache[deviceId]
+        else:
+            return
+        self._saves += 1
+        if self._saves >= self.COMPACT_CHECK_SAVES:
+            self._saves = 0
+            if self._cache.shouldCompact():
+                log.debug("Compacting %s", self._cache.filename)
+                self._cache.compact()
+
+
+_stores = {}
+
+def getBadOidStore(collectorName, options):
+    """
+    Return the bad OID store shared by the tasks of a collector daemon.
+    """
+    name = '%s-badoids' % getattr(options, 'monitor', 'localhost')
+    workerId = getattr(options, 'workerid', 0)
+    if workerId:
+        name = '%s-%s' % (name, workerId)
+    filename = zenPath('var', collectorName, '%s.cache' % name)
+    store = _stores.get(filename)
+    if store is None:
+        store = _stores[filename] = BadOidStore(filename)
+    return store
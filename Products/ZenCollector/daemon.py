@@ -39,6 +39,23 @@ from Products.ZenUtils import metrics
 log = logging.getLogger("zen.daemon")
 
 
+def _metadataArgs(metadata):
+    """
+    Return the writeMetric arguments held in a metric's metadata.
+    """
+    metadata = metadata or {}
+    try:
+        return {
+            'contextKey': metadata['contextKey'],
+            'contextId': metadata['contextId'],
+            'deviceId': metadata['deviceId'],
+            'contextUUID': metadata['contextUUID'],
+            'deviceUUID': metadata.get('deviceUUID'),
+        }
+    except KeyError as e:
+        raise Exception("Missing necessary metadata: %s" % e.message)
+
+
 class DummyListener(object):
     zope.interface.implements(IConfigurationListener)
 
@@ -211,6 +228,9 @@ class CollectorDaemon(RRDDaemon):
         self._statService.addStatistic("taskCount", "GAUGE")
         self._statService.addStatistic("queuedTasks", "GAUGE")
         self._statService.addStatistic("missedRuns", "GAUGE")
+        self._statService.addStatistic("metricQueueLength", "GAUGE")
+        self._statService.addStatistic("metricSpillBytes", "GAUGE")
+        self._statService.addStatistic("droppedMetrics", "DERIVE")
         zope.component.provideUtility(self._statService, IStatisticsService)
 
         self._deviceGuids = {}
@@ -391,21 +411,79 @@ class CollectorDaemon(RRDDaemon):
             self._threshold_notifier.notify(contextUUID, contextId, metric,
                     timestamp, value, threshEventData)
 
+    def writeMetrics(self, batch):
+        """
+        Writes many metrics to the metric publisher at once.  The metric
+        names, derivatives and threshold checks of the whole batch are
+        computed in one pass and the metrics are handed to the publisher
+        in a single call.
+
+        @param batch: dictionaries of the keyword arguments of writeMetric;
+                      a 'metadata' entry may be given instead of contextKey,
+                      contextId, deviceId, contextUUID and deviceUUID, as
+                      for writeMetricWithMetadata
+        @type batch: sequence
+        @return: a deferred that fires when the metrics get published
+        """
+        now = int(time.time())
+        ensure_prefix = metrics.ensure_prefix
+        derivative = self._derivative_tracker.derivative
+        published = []
+        checked = []
+        for entry in batch:
+            try:
+                if 'metadata' in entry:
+                    entry = dict(entry)
+                    entry.update(_metadataArgs(entry.pop('metadata')))
+                metric = entry['metric']
+                value = entry['value']
+                metricType = entry['metricType']
+                timestamp = entry.get('timestamp', 'N')
+                timestamp = now if timestamp == 'N' else timestamp
+                contextId = entry['contextId']
+                contextUUID = entry.get('contextUUID')
+                deviceId = entry.get('deviceId')
+                tags = {
+                    'contextUUID': contextUUID,
+                    'key': entry['contextKey']
+                }
+                metric_name = metric
+                if deviceId:
+                    tags['device'] = deviceId
+                    metric_name = ensure_prefix(deviceId, metric_name)
+                raw_value = value
+
+                if metricType in ('COUNTER', 'DERIVE'):
+                    min = entry.get('min', 'U')
+                    if metricType == 'COUNTER' and min == 'U':
+                        # COUNTER implies only positive derivatives are valid.
+                        min = 0
+                    value = derivative("%s:%s" % (contextUUID, metric),
+                                       (float(value), timestamp),
+                                       min, entry.get('max', 'U'))
+            except Exception as e:
+                self.log.exception("Failed to write metric %s: %s",
+                                   entry.get('metric'), e)
+                continue
+
+            published.append((metric_name, raw_value, timestamp, tags))
+            if value is not None:
+                checked.append((contextUUID, contextId, metric,
+                                timestamp, value,
+                                entry.get('threshEventData', {})))
+
+        d = defer.maybeDeferred(self._metric_writer.write_metrics, published)
+        # check for threshold breaches and send events when needed
+        d.addCallback(lambda result: self._threshold_notifier.notifyBatch(checked))
+        return d
+
     def writeMetricWithMetadata(self, metric, value, metricType, timestamp='N',
             min='U', max='U', threshEventData={}, metadata=None):
 
-        metadata = metadata or {}
-        try:
-            key = metadata['contextKey']
-            contextId = metadata['contextId']
-            deviceId = metadata['deviceId']
-            contextUUID = metadata['contextUUID']
-        except KeyError as e:
-            raise Exception("Missing necessary metadata: %s" % e.message)
-        deviceUUID = metadata.get('deviceUUID')
-        return self.writeMetric(key, metric, value, metricType, contextId,
-                timestamp, min, max, threshEventData, deviceId, contextUUID,
-                deviceUUID)
+        args = _metadataArgs(metadata)
+        return self.writeMetric(args['contextKey'], metric, value, metricType,
+                args['contextId'], timestamp, min, max, threshEventData,
+                args['deviceId'], args['contextUUID'], args['deviceUUID'])
 
     @deprecated
     def writeRRD(self, path, value, rrdType, rrdCommand=None, cycleTime=None,
@@ -793,6 +871,17 @@ class CollectorDaemon(RRDDaemon):
             stat = self._statService.getStatistic("missedRuns")
             stat.value = self._scheduler.missedRuns
 
+            # Metric publisher statistics
+            publisher = self.publisher()
+            stat = self._statService.getStatistic("metricQueueLength")
+            stat.value = publisher.queueLength
+
+            stat = self._statService.getStatistic("metricSpillBytes")
+            stat.value = publisher.spillBytes
+
+            stat = self._statService.getStatistic("droppedMetrics")
+            stat.value = publisher.droppedMetrics
+
             self._statService.postStatistics(self.rrdStats)
 
     def _displayStatistics(self, verbose=False):
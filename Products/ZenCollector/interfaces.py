@@ -437,6 +437,16 @@ class IDataService(zope.interface.Interface):
         """
         pass
 
+    def writeMetrics(self, batch):
+        """
+        Write many metrics at once, e.g. the values of a collection cycle.
+
+        @param batch: dictionaries of the keyword arguments of writeMetric
+        @type batch: sequence
+        @return: a deferred that fires when the metrics have been published
+        """
+        pass
+
     def writeRRD(self, path, value, rrdType, rrdCommand=None, cycleTime=None,
                  min='U', max='U', threshEventData=None, timestamp='N', allowStaleDatapoint=True):
         """
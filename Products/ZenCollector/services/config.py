@@ -225,6 +225,61 @@ class CollectorConfigService(HubService, ThresholdMixin):
                 self.log.debug('Invalidation: Skipping remote call to delete device {0} from collector {1}'.format(devid, self.instance))
 
 
+    @onUpdate(None) # Matches all
+    def invalidateCachedConfigs(self, object, event):
+        """
+        Drop the cached device configs a change may affect: those of the
+        changed device, or all of them when the change is not to a device.
+        Subclasses whose configs only depend on the model opt in to caching
+        by listing getDeviceConfigs in cachedMethods.
+        """
+        if not self.cachedMethods:
+            return
+        cache = self.resultCache
+        if not len(cache):
+            # still stops the configs being built from being cached
+            cache.invalidate()
+            return
+        device = self._changedDevice(object)
+        if device is None:
+            cache.invalidate()
+        else:
+            cache.invalidateDevice(device.id, self._collectorDevice(device))
+
+    @onDelete(Device)
+    def invalidateDeletedDeviceConfigs(self, object, event):
+        self.resultCache.invalidateDevice(object.id,
+                                          self._collectorDevice(object))
+
+    def _changedDevice(self, object):
+        """
+        Return the device an object belongs to, or None if it does not
+        belong to a single device.
+        """
+        while object is not None:
+            if isinstance(object, Device):
+                return object
+            if isinstance(object, DeviceClass):
+                return None
+            object = aq_parent(object)
+        return None
+
+    def _collectorDevice(self, device):
+        """
+        Is the device monitored by this collector, or was it until lately?
+        """
+        try:
+            if device.perfServer.getRelatedId() == self.instance:
+                return True
+        except Exception:
+            return True
+        monitors = self.dmd.Monitors
+        return monitors.getPreviousCollectorForDevice(device.id) == self.instance
+
+    def getCachedDevices(self, method, args, kw):
+        deviceNames = args[0] if args else kw.get('deviceNames')
+        return frozenset(deviceNames) if deviceNames else None
+
     @translateError
     def remote_getConfigProperties(self):
         return self._prefs.propertyItems()
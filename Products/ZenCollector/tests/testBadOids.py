@@ -0,0 +1,87 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from twisted.internet import defer
+
+from Products.ZenCollector.badoids import isolateBadOids, BadOidStore
+
+
+class TestIsolateBadOids(unittest.TestCase):
+
+    def isolate(self, oids, bad, chunkSize):
+        requests = []
+        def fetchChunks(chunks):
+            requests.extend(chunks)
+            return defer.succeed([c for c in chunks if bad.intersection(c)])
+        chunks = [oids[i:i + chunkSize] for i in xrange(0, len(oids), chunkSize)]
+        found = []
+        isolateBadOids(chunks, fetchChunks).addCallback(found.append)
+        return found[0], requests
+
+    def testNoBadOids(self):
+        oids = ['1.%d' % i for i in xrange(100)]
+        found, requests = self.isolate(oids, set(), 40)
+        self.assertEqual(found, set())
+        self.assertEqual(len(requests), 3)
+
+    def testBisection(self):
+        oids = ['1.%d' % i for i in xrange(64)]
+        bad = set(['1.5', '1.50'])
+        found, requests = self.isolate(oids, bad, 64)
+        self.assertEqual(found, bad)
+        # one request, then two per level for each bad oid
+        self.assertTrue(len(requests) <= 1 + 2 * 2 * 6)
+
+
+class TestBadOidStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'badoids.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testPersisted(self):
+        store = BadOidStore(self.filename)
+        store.save('device1', set(['1.2', '1.3']))
+        store.save('device2', set(['1.4']))
+        store.save('device2', set())
+
+        store = BadOidStore(self.filename)
+        self.assertEqual(store.get('device1'), set(['1.2', '1.3']))
+        self.assertEqual(store.get('device2'), set())
+
+    def testCompacted(self):
+        store = BadOidStore(self.filename)
+        store.COMPACT_CHECK_SAVES = 10
+        store._cache.COMPACT_MIN_BYTES = 0
+        store.save('device1', set('1.%d' % i for i in range(100)))
+        size = os.path.getsize(self.filename)
+        # flapping OIDs
+        for i in range(100):
+            store.save('device2', set(['2.%d' % (i % 2)]))
+        self.assertTrue(os.path.getsize(self.filename) < 2 * size)
+        self.assertEqual(store.get('device1'),
+                         set('1.%d' % i for i in range(100)))
+        self.assertEqual(store.get('device2'), set(['2.1']))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestIsolateBadOids))
+    suite.addTest(makeSuite(TestBadOidStore))
+    return suite
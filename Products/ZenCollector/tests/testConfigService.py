@@ -0,0 +1,64 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+import Globals
+
+from twisted.internet import defer
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+from Products.ZenCollector.services.config import CollectorConfigService
+from Products.ZenHub.ResultCache import ResultCache
+from Products.ZenHub.services.SnmpPerformanceConfig import SnmpPerformanceConfig
+from Products.ZenHub.services.ZenStatusConfig import ZenStatusConfig
+
+
+class CachingConfigService(SnmpPerformanceConfig):
+
+    def __init__(self, dmd, instance):
+        # only what the invalidation handlers use
+        self.dmd = dmd
+        self.instance = instance
+        self.resultCache = ResultCache()
+
+
+class TestConfigService(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestConfigService, self).afterSetUp()
+        self.dmd.Monitors.getPerformanceMonitor('localhost')
+        self.device = self.dmd.Devices.createInstance('dev1')
+        self.device.setPerformanceMonitor('localhost')
+        self.service = CachingConfigService(self.dmd, 'localhost')
+        cache = self.service.resultCache
+        cache.call('dev1', frozenset(['dev1']), lambda: defer.succeed('dev1'))
+        cache.call('dev2', frozenset(['dev2']), lambda: defer.succeed('dev2'))
+        cache.call('all', None, lambda: defer.succeed('all'))
+
+    def testCachingOptIn(self):
+        self.assertEquals((), CollectorConfigService.cachedMethods)
+        self.assertEquals((), ZenStatusConfig.cachedMethods)
+        self.assertEquals(('getDeviceConfigs',),
+                          SnmpPerformanceConfig.cachedMethods)
+
+    def testNonDeviceChangeClearsCache(self):
+        self.assertEquals(3, len(self.service.resultCache))
+        self.service.invalidateCachedConfigs(self.dmd.Devices, None)
+        self.assertEquals(0, len(self.service.resultCache))
+
+    def testDeviceChange(self):
+        self.service.invalidateCachedConfigs(self.device.os, None)
+        self.assertEquals(1, len(self.service.resultCache))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestConfigService))
+    return suite
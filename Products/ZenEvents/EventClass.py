@@ -175,7 +175,7 @@ class EventClass(EventClassPropertyMixin, Organizer, ManagedEntity, ZenPackable)
         return insts
 
 
-    def lookup(self, evt, device):
+    def lookup(self, evt, device, find=None):
         """
         Given an event, return an event class organizer object
 
@@ -183,6 +183,9 @@ class EventClass(EventClassPropertyMixin, Organizer, ManagedEntity, ZenPackable)
         @type evt: dictionary
         @parameter device: device object
         @type device: DMD device
+        @parameter find: callable returning the candidate mappings for an
+            eventClassKey; defaults to self.find
+        @type find: callable
         @return: an event class that matches the mapping
         @rtype: EventClassInst
         """
@@ -203,7 +206,7 @@ class EventClass(EventClassPropertyMixin, Organizer, ManagedEntity, ZenPackable)
 
         log.debug("No event class specified, searching for eventClassKey %s",
                   eventClassKey)
-        evtcls = self.find(eventClassKey)
+        evtcls = (find or self.find)(eventClassKey)
         log.debug("Found the following event classes that matched key %s: %s",
                   eventClassKey, evtcls)
 
@@ -82,6 +82,56 @@ def transformsavepoint(errorCallback=lambda :None):
         except Exception:
             log.exception("Error rolling back transaction after transform")
 
+
+class CompiledCache(object):
+    """
+    Per-process cache of compiled rules, transforms and regex patterns.
+
+    Entries are keyed by the mapping (its oid, or its physical path if it
+    has not been committed yet) and the kind of source, and remember the
+    source text they were compiled from.  When the ZODB object changes and
+    its source no longer matches, the stale entry is recompiled on the
+    next lookup.
+    """
+
+    def __init__(self):
+        self._cache = {}
+
+    def _key(self, obj, kind):
+        return (obj._p_oid or obj.getPhysicalPath(), kind)
+
+    def get(self, obj, kind, source):
+        """
+        Return the compiled object for source, or None if it is not cached
+        or was compiled from different source text.
+        """
+        entry = self._cache.get(self._key(obj, kind))
+        if entry is not None and entry[0] == source:
+            return entry[1]
+        return None
+
+    def set(self, obj, kind, source, compiled):
+        self._cache[self._key(obj, kind)] = (source, compiled)
+        return compiled
+
+    def regex(self, obj, kind, pattern, flags=0):
+        """
+        Return a compiled regex pattern, compiling it on a cache miss.
+        """
+        compiled = self.get(obj, kind, pattern)
+        if compiled is None:
+            compiled = self.set(obj, kind, pattern, re.compile(pattern, flags))
+        return compiled
+
+    def clear(self):
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+compiledCache = CompiledCache()
+
+
 class EventClassPropertyMixin(object):
 
     transform = ''
@@ -275,7 +325,13 @@ Transform:
             startTime = time.time()
             errorCallback = partial(self.sendTransformException, eventclass, evt)
             with transformsavepoint(errorCallback):
-                exec(eventclass.transform, variables_and_funcs)
+                code = compiledCache.get(eventclass, 'transform', eventclass.transform)
+                if code is None:
+                    # compile here so compile errors are reported against
+                    # this frame by sendTransformException
+                    code = compiledCache.set(eventclass, 'transform', eventclass.transform,
+                                             compile(eventclass.transform, "<string>", "exec"))
+                exec(code, variables_and_funcs)
             endTime = time.time()
 
             if endTime - startTime > MAX_TRANSFORM_TIME:
@@ -438,7 +494,7 @@ class EventClassInst(EventClassPropertyMixin, ZenModelRM, EventView,
         Apply the event dict regex to extract additional values from the event.
         """
         if self.regex:
-            m = re.search(self.regex, evt.message)
+            m = compiledCache.regex(self, 'extraction', self.regex).search(evt.message)
             if m: evt.updateFromDict(m.groupdict())
         return evt
 
@@ -478,14 +534,18 @@ class EventClassInst(EventClassPropertyMixin, ZenModelRM, EventView,
         if self.rule:
             try:
                 log.debug("eval rule:%s", self.rule)
-                value = eval(self.rule, {'evt':evt, 'dev':device, 'device': device})
+                code = compiledCache.get(self, 'rule', self.rule)
+                if code is None:
+                    code = compiledCache.set(self, 'rule', self.rule,
+                                             compile(self.rule, "<string>", "eval"))
+                value = eval(code, {'evt':evt, 'dev':device, 'device': device})
             except Exception, e:
                 logging.warn("EventClassInst: %s rule failure: %s",
                             self.getDmdKey(), e)
         else:
             try:
                 log.debug("regex='%s' message='%s'", self.regex, evt.message)
-                value = re.search(self.regex, evt.message, re.I)
+                value = compiledCache.regex(self, 'match', self.regex, re.I).search(evt.message)
             except sre_constants.error: pass
         return value
 
@@ -10,6 +10,10 @@
 
 import Globals
 
+import time
+
+from Acquisition import aq_base
+
 from Products.ZenUtils.guid.interfaces import IGlobalIdentifier
 from Products.ZenUtils.guid.guid import GUIDManager
 
@@ -18,12 +22,67 @@ from Products.ZenModel.NotificationSubscription import NotificationSubscriptionM
 import logging
 log = logging.getLogger("zen.notificationdao")
 
+DEFAULT_SYNC_INTERVAL = 5.0
+
+
+def _serial(obj):
+    # load the object's current state, as its state may have been
+    # invalidated by a sync, to get the serial of its last change
+    obj = aq_base(obj)
+    activate = getattr(obj, '_p_activate', None)
+    if activate is not None:
+        activate()
+    return getattr(obj, '_p_serial', None)
+
+
+class _IndexedNotification(object):
+    """
+    A notification, and whether it is active until the next boundary of
+    its maintenance windows.
+    """
+
+    def __init__(self, notification):
+        self.notification = notification
+        self.active = False
+        self.activeUntil = 0
+
+    def isActive(self, now):
+        if now >= self.activeUntil:
+            notification = self.notification
+            self.active = notification.isActive()
+            boundaries = [window.nextEvent(now)
+                          for window in notification.windows()
+                          if window.enabled]
+            boundaries = [b for b in boundaries if b is not None]
+            # a boundary already passed means that the window has not been
+            # started or ended yet; check again on the next signal
+            self.activeUntil = min(boundaries) if boundaries else float('inf')
+        return self.active
+
 
 class NotificationDao(object):
-    def __init__(self, dmd):
+    """
+    Finds the notifications subscribed to signals.
+
+    The notifications are indexed by GUID.  The database is synced at most
+    every syncInterval seconds, and the index is rebuilt when a notification
+    or its maintenance windows were changed since it was built.  Whether a
+    notification is active is only checked again at the next boundary of
+    its maintenance windows.
+    """
+
+    syncInterval = DEFAULT_SYNC_INTERVAL
+
+    _index = None
+    _indexed = ()
+    _watched = ()
+    _nextSync = 0
+
+    def __init__(self, dmd, syncInterval=DEFAULT_SYNC_INTERVAL):
         self.dmd = dmd
         self.notification_manager = self.dmd.getDmdRoot(NotificationSubscriptionManager.root)
         self.guidManager = GUIDManager(dmd)
+        self.syncInterval = syncInterval
 
     def getNotifications(self):
         self.dmd._p_jar.sync()
@@ -39,19 +98,49 @@ class NotificationDao(object):
         @param signal: The signal for which to get subscribers.
         @type signal: protobuf zep.Signal
         """
+        now = time.time()
+        self._refreshIndex(now)
         active_matching_notifications = []
-        for notification in self.getNotifications():
-            if notification.isActive():
-                if self.notificationSubscribesToSignal(notification, signal):
-                    active_matching_notifications.append(notification)
-                    log.debug('Found matching notification: %s' % notification)
-                else:
-                    log.debug('Notification "%s" does not subscribe to this signal.' % notification)
+        for entry in self._index.get(signal.subscriber_uuid, ()):
+            notification = entry.notification
+            if entry.isActive(now):
+                active_matching_notifications.append(notification)
+                log.debug('Found matching notification: %s' % notification)
             else:
                 log.debug('Notification "%s" is not active.' % notification)
 
         return active_matching_notifications
 
+    def _refreshIndex(self, now):
+        if self._index is not None and now < self._nextSync:
+            return
+        self._nextSync = now + self.syncInterval
+        notifications = self.getNotifications()
+        indexed = [aq_base(n) for n in notifications]
+        if self._index is not None and indexed == self._indexed \
+                and all(_serial(obj) == serial
+                        for obj, serial in self._watched):
+            return
+        log.debug('Indexing %d notifications', len(notifications))
+        index = {}
+        watched = []
+        for notification in notifications:
+            guid = self.notificationGuid(notification)
+            if guid:
+                index.setdefault(guid, []).append(
+                    _IndexedNotification(notification))
+            watched.append(notification)
+            windows = getattr(aq_base(notification), 'windows', None)
+            if windows is not None:
+                watched.append(windows)
+                watched.extend(notification.windows())
+        self._index = index
+        self._indexed = indexed
+        self._watched = [(obj, _serial(obj)) for obj in watched]
+
+    def notificationGuid(self, notification):
+        return IGlobalIdentifier(notification).getGUID()
+
     def notificationSubscribesToSignal(self, notification, signal):
         """
         Determine if the notification matches the specified signal.
@@ -63,5 +152,5 @@ class NotificationDao(object):
 
         @rtype boolean
         """
-        return signal.subscriber_uuid == IGlobalIdentifier(notification).getGUID()
+        return signal.subscriber_uuid == self.notificationGuid(notification)
 
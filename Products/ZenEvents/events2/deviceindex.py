@@ -0,0 +1,268 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+"""
+In-process index of device identities used by zeneventd to resolve the
+device of an event to its uuid without catalog searches.
+"""
+
+import logging
+
+from metrology import Metrology
+
+from Products.ZenModel.Device import Device
+from Products.ZenUtils.IpUtil import isip, ipToDecimal
+from Products.Zuul.interfaces import ICatalogTool
+
+log = logging.getLogger("zen.eventd")
+
+_LOCALHOST_IPV4 = (ipToDecimal('126.255.255.255'), ipToDecimal('128.0.0.0'))
+_LOCALHOST_IPV6 = ipToDecimal('::1')
+
+# maximum number of unresolvable identifiers remembered
+MAX_NEGATIVE_ENTRIES = 10000
+
+
+def _ipDecimal(identifier, ipAddress):
+    try:
+        ip_address = next(i for i in (ipAddress, identifier) if isip(i))
+        return ipToDecimal(ip_address)
+    except Exception:
+        return None
+
+
+def _isLocalhost(ip_decimal):
+    return (_LOCALHOST_IPV4[0] < ip_decimal < _LOCALHOST_IPV4[1] or
+            ip_decimal == _LOCALHOST_IPV6)
+
+
+class DeviceIdentityIndex(object):
+    """
+    Maps device ids, titles, manage IPs and interface IPs to device uuids.
+
+    The index is warmed from the global catalog and answers
+    Manager.findDeviceUuid with dictionary lookups.  Entries are checked
+    against the device they resolve to (which event processing loads
+    anyway), refreshed for devices whose objects are invalidated, and
+    identifiers not found in the catalog are remembered until the catalog
+    membership changes or a device changes to match them.
+    """
+
+    def __init__(self, manager, trackInvalidations=True):
+        self._manager = manager
+        self._trackInvalidations = trackInvalidations
+        self._warmed = False
+        self._hits = Metrology.meter("DeviceIdentityIndexHits")
+        self._misses = Metrology.meter("DeviceIdentityIndexMisses")
+        self.clear()
+
+    def clear(self):
+        self._byId = {}
+        self._byName = {}
+        self._byIp = {}
+        # uuid -> (id, lowercased title, manage ip as decimal)
+        self._keys = {}
+        # device oid -> uuid
+        self._oids = {}
+        # interface ip as decimal -> uuid
+        self._byInterfaceIp = {}
+        # (identifier, ipAddress) pairs the catalog could not resolve ->
+        # ip as decimal
+        self._negative = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _catalog(self):
+        return ICatalogTool(self._manager.dmd.Devices).catalog
+
+    def _membershipOids(self):
+        catalog = self._catalog()._catalog
+        oids = set([catalog._p_oid])
+        length = getattr(catalog, '_length', None)
+        if length is not None:
+            oids.add(length._p_oid)
+        return oids
+
+    def warm(self):
+        """
+        Load the identity of every device from the global catalog.
+        """
+        self.clear()
+        catalog = self._catalog()
+        ipIndex = catalog._catalog.getIndex('ipAddress')
+        brains = ICatalogTool(self._manager.dmd.Devices).search(
+            types=Device, filterPermissions=False)
+        for brain in brains:
+            ip = ipIndex.getEntryForObject(brain.getRID())
+            uuid = self._manager.uuidFromBrain(brain)
+            self._record(uuid, brain.id, brain.name, long(ip) if ip else None)
+            if uuid and self._trackInvalidations:
+                # the device is only a ghost; its oid needs no loading
+                oid = brain._unrestrictedGetObject()._p_oid
+                if oid:
+                    self._oids[oid] = uuid
+        self._warmed = True
+        log.info("Indexed identities of %d devices", len(self))
+
+    def _record(self, uuid, id, name, ip):
+        if not uuid:
+            return
+        self._forget(uuid)
+        name = name.lower() if name else None
+        self._keys[uuid] = (id, name, ip)
+        if id:
+            self._byId[id] = uuid
+        if name:
+            self._byName[name] = uuid
+        if ip is not None:
+            self._byIp[ip] = uuid
+
+    def _recordDevice(self, device):
+        uuid = self._manager.getElementUuid(device)
+        ip = device.getManageIp()
+        ip = ip.partition('/')[0] if ip else None
+        self._record(uuid, device.id, device.titleOrId(),
+                     ipToDecimal(ip) if ip else None)
+        if self._trackInvalidations and device._p_oid:
+            self._oids[device._p_oid] = uuid
+        return uuid
+
+    def _forget(self, uuid):
+        keys = self._keys.pop(uuid, None)
+        if keys is None:
+            return
+        for index, key in zip((self._byId, self._byName, self._byIp), keys):
+            if key is not None and index.get(key) == uuid:
+                del index[key]
+
+    def _lookup(self, identifier, ip_decimal):
+        uuid = self._byId.get(identifier)
+        if uuid is None and identifier:
+            uuid = self._byName.get(identifier.lower())
+        if uuid is None and ip_decimal is not None:
+            uuid = self._byIp.get(ip_decimal)
+            if uuid is None:
+                uuid = self._byInterfaceIp.get(ip_decimal)
+        return uuid
+
+    def _matches(self, uuid, device, identifier, ip_decimal):
+        if identifier == device.id:
+            return True
+        title = device.titleOrId()
+        if identifier and title and title.lower() == identifier.lower():
+            return True
+        if ip_decimal is not None:
+            if self._byInterfaceIp.get(ip_decimal) == uuid:
+                return True
+            ip = device.getManageIp()
+            ip = ip.partition('/')[0] if ip else None
+            return bool(ip) and ipToDecimal(ip) == ip_decimal
+        return False
+
+    def findDeviceUuid(self, identifier, ipAddress):
+        """
+        Return the uuid of the device identified by identifier (an id,
+        title or IP address) or ipAddress, or None if there is none.
+        """
+        if not self._warmed:
+            self.warm()
+        ip_decimal = _ipDecimal(identifier, ipAddress)
+        uuid = self._lookup(identifier, ip_decimal)
+        if uuid is not None:
+            device = self._manager.getElementByUuid(uuid)
+            if device is not None and \
+                    self._matches(uuid, device, identifier, ip_decimal):
+                self._hits.mark()
+                if self._trackInvalidations and device._p_oid:
+                    self._oids[device._p_oid] = uuid
+                return uuid
+            # the entry is stale; re-read what is left of the device
+            self._forget(uuid)
+            if device is not None:
+                self._recordDevice(device)
+        elif (identifier, ipAddress) in self._negative:
+            self._hits.mark()
+            return None
+
+        self._misses.mark()
+        uuid = self._resolve(identifier, ipAddress, ip_decimal)
+        if uuid is None and self._trackInvalidations:
+            if len(self._negative) >= MAX_NEGATIVE_ENTRIES:
+                self._negative.clear()
+            self._negative[(identifier, ipAddress)] = ip_decimal
+        return uuid
+
+    def _resolve(self, identifier, ipAddress, ip_decimal):
+        device_brains, devices = self._manager._findDevices(identifier, ipAddress, limit=1)
+        if device_brains:
+            return self._recordDevice(device_brains[0].getObject())
+        if devices:
+            device = devices[0]
+            uuid = self._recordDevice(device)
+            if ip_decimal is not None and not _isLocalhost(ip_decimal):
+                self._byInterfaceIp[ip_decimal] = uuid
+            return uuid
+
+    def invalidate(self, oids):
+        """
+        Apply changes polled from the storage (None if unknown).
+        """
+        if not self._warmed:
+            return
+        if oids is None:
+            self.warm()
+            return
+        if not oids:
+            return
+        if not self._membershipOids().isdisjoint(oids):
+            # objects were added or removed: previously unresolvable
+            # identifiers and interface addresses may now resolve elsewhere
+            self._negative.clear()
+            self._byInterfaceIp.clear()
+        changed = []
+        for oid in oids:
+            uuid = self._oids.pop(oid, None)
+            if uuid is not None:
+                device = self._manager.getElementByUuid(uuid)
+                self._forget(uuid)
+                if device is not None:
+                    self._recordDevice(device)
+                    changed.append(self._keys.get(uuid))
+        if changed and self._negative:
+            self._forgetNegative(changed)
+
+    def _forgetNegative(self, changed):
+        """
+        Forget the unresolvable identifiers that the changed devices, given
+        by their keys, may now resolve.
+        """
+        ids = set()
+        names = set()
+        ips = set()
+        for keys in changed:
+            if keys is not None:
+                id, name, ip = keys
+                ids.add(id)
+                names.add(name)
+                ips.add(ip)
+        ips.discard(None)
+        for entry, ip_decimal in self._negative.items():
+            identifier = entry[0]
+            if identifier in ids or ip_decimal in ips or \
+                    (identifier and identifier.lower() in names):
+                del self._negative[entry]
+
+    def stats(self):
+        return {
+            'devices': len(self._keys),
+            'hits': self._hits.count,
+            'misses': self._misses.count,
+        }
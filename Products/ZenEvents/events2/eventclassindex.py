@@ -0,0 +1,206 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+"""
+In-memory index of event class mappings (EventClassInst objects) by
+eventClassKey.  zeneventd uses it in place of EventClass.find so an event
+lookup costs a dictionary access instead of a catalog query, a traversal
+per mapping and a sort.
+"""
+
+import logging
+from collections import defaultdict
+
+log = logging.getLogger("zen.eventd")
+
+DEFAULT_MAPPING_KEY = "defaultmapping"
+
+
+def _sortKey(entry):
+    path, mapping = entry
+    return (mapping.sequence, path)
+
+
+class EventClassIndex(object):
+    """
+    Keeps, for every eventClassKey, the mappings with that key sorted by
+    sequence number followed by the default mappings -- the same candidate
+    list EventClass.find returns.  Mappings are tracked by oid so they can
+    be updated individually when they change.
+    """
+
+    def __init__(self):
+        # oid -> (path, eventClassKey, mapping)
+        self._mappings = {}
+        # eventClassKey -> {oid: (path, mapping)}
+        self._members = defaultdict(dict)
+        # eventClassKey -> candidate mappings, default mappings included
+        self._candidates = {}
+        # keys whose candidate lists must be rebuilt
+        self._dirty = set()
+
+    def __len__(self):
+        return len(self._mappings)
+
+    def __contains__(self, oid):
+        return oid in self._mappings
+
+    def clear(self):
+        self._mappings.clear()
+        self._members.clear()
+        self._candidates.clear()
+        self._dirty.clear()
+
+    def add(self, oid, path, mapping):
+        """
+        Add a mapping, or re-read the key of a mapping already indexed.
+        """
+        self.remove(oid)
+        key = mapping.eventClassKey
+        self._mappings[oid] = (path, key, mapping)
+        self._members[key][oid] = (path, mapping)
+        self._dirty.add(key)
+
+    def remove(self, oid):
+        entry = self._mappings.pop(oid, None)
+        if entry is not None:
+            path, key, mapping = entry
+            members = self._members.get(key)
+            if members is not None:
+                members.pop(oid, None)
+                if not members:
+                    del self._members[key]
+            self._dirty.add(key)
+
+    def touch(self, oid):
+        """
+        Mark a mapping as changed; its key and sequence number are read
+        again before the next lookup.
+        """
+        entry = self._mappings.get(oid)
+        if entry is not None:
+            path, key, mapping = entry
+            self.add(oid, path, mapping)
+
+    def _refreshCandidates(self):
+        if DEFAULT_MAPPING_KEY in self._dirty:
+            # every candidate list ends with the default mappings
+            self._candidates.clear()
+        else:
+            for key in self._dirty:
+                self._candidates.pop(key, None)
+        self._dirty.clear()
+        self._candidates[DEFAULT_MAPPING_KEY] = self._sorted(DEFAULT_MAPPING_KEY)
+
+    def _sorted(self, key):
+        members = self._members.get(key)
+        if not members:
+            return ()
+        return tuple(mapping for path, mapping in
+                     sorted(members.itervalues(), key=_sortKey))
+
+    def find(self, eventClassKey):
+        """
+        Return the mappings for eventClassKey in sequence number order,
+        followed by the default mappings.
+
+        @parameter eventClassKey: event class key
+        @type eventClassKey: string
+        @return: candidate event class mappings
+        @rtype: tuple of EventClassInst
+        """
+        if self._dirty:
+            self._refreshCandidates()
+        try:
+            return self._candidates[eventClassKey]
+        except KeyError:
+            pass
+        defaults = self._candidates.get(DEFAULT_MAPPING_KEY, ())
+        if eventClassKey not in self._members:
+            # don't grow the cache for keys without mappings
+            return defaults
+        candidates = self._sorted(eventClassKey) + defaults
+        self._candidates[eventClassKey] = candidates
+        return candidates
+
+
+class CatalogEventClassIndex(EventClassIndex):
+    """
+    EventClassIndex loaded from the eventClassSearch catalog of the Events
+    organizer and kept current from the ZODB invalidations passed to
+    invalidate().
+    """
+
+    def __init__(self, events):
+        super(CatalogEventClassIndex, self).__init__()
+        self._events = events
+        self._built = False
+
+    def _catalog(self):
+        return self._events._getCatalog()._catalog
+
+    def _membershipOids(self, catalog):
+        # The catalog length changes whenever a mapping is cataloged or
+        # uncataloged (added, removed, moved, renamed or re-keyed).
+        oids = set([catalog._p_oid])
+        length = getattr(catalog, '_length', None)
+        if length is not None:
+            oids.add(length._p_oid)
+        return oids
+
+    def _load(self, path):
+        try:
+            mapping = self._events.getObjByPath(path)
+        except (AttributeError, KeyError):
+            log.debug("Unable to load event class mapping %s", path)
+            return
+        self.add(mapping._p_oid, path, mapping)
+
+    def build(self):
+        """
+        Load every mapping in the catalog.
+        """
+        self.clear()
+        for path in self._catalog().uids.keys():
+            self._load(path)
+        self._built = True
+        log.info("Indexed %d event class mappings", len(self))
+
+    def _syncMembership(self):
+        paths = set(self._catalog().uids.keys())
+        known = dict((path, oid) for oid, (path, key, mapping)
+                     in self._mappings.iteritems())
+        for path in set(known) - paths:
+            self.remove(known[path])
+        for path in paths - set(known):
+            self._load(path)
+
+    def invalidate(self, oids):
+        """
+        Apply changes polled from the storage (None if unknown).
+        """
+        if not self._built:
+            return
+        if oids is None:
+            self.build()
+            return
+        if not oids:
+            return
+        catalog = self._catalog()
+        if not self._membershipOids(catalog).isdisjoint(oids):
+            self._syncMembership()
+        for oid in oids:
+            if oid in self._mappings:
+                self.touch(oid)
+
+    def find(self, eventClassKey):
+        if not self._built:
+            self.build()
+        return super(CatalogEventClassIndex, self).find(eventClassKey)
@@ -15,6 +15,8 @@ from Products.ZenModel.IpAddress import IpAddress
 from Products.ZenModel.DeviceComponent import DeviceComponent
 from Products.ZenModel.DataRoot import DataRoot
 from Products.ZenEvents.events2.proxy import ZepRawEventProxy, EventProxy
+from Products.ZenEvents.events2.eventclassindex import CatalogEventClassIndex
+from Products.ZenEvents.events2.deviceindex import DeviceIdentityIndex
 from Products.ZenUtils.guid.interfaces import IGUIDManager, IGlobalIdentifier
 from Products.ZenUtils.IpUtil import isip, ipToDecimal
 from Products.ZenUtils.FunctionCache import FunctionCache
@@ -24,6 +26,8 @@ from zope.component import getUtility, getUtilitiesFor
 from Acquisition import aq_chain
 from Products.ZenEvents import ZenEventClasses
 from itertools import ifilterfalse
+from contextlib import contextmanager
+from functools import wraps
 
 from zenoss.protocols.jsonformat import to_dict
 from zenoss.protocols.protobufs.model_pb2 import DEVICE, COMPONENT
@@ -58,6 +62,26 @@ class EventLoggerAdapter(logging.LoggerAdapter):
                                             msg=msg)
         return msg, kwargs
 
+_MISSING = object()
+
+def batchcached(f):
+    """
+    Remember the results of a Manager lookup for the duration of the
+    current batch (see Manager.batch), so events for the same element
+    within a batch are resolved once.
+    """
+    @wraps(f)
+    def wrapper(self, *args):
+        cache = self._batchCache
+        if cache is None:
+            return f(self, *args)
+        key = (f,) + args
+        value = cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = cache[key] = f(self, *args)
+        return value
+    return wrapper
+
 class Manager(object):
     """
     Provides lookup access to processing pipes and performs caching.
@@ -70,8 +94,25 @@ class Manager(object):
 
     def __init__(self, dmd):
         self.dmd = dmd
+        self._batchCache = None
+        self._storage = self._getInvalidationStorage()
         self._initCatalogs()
 
+    def _getInvalidationStorage(self):
+        """
+        Return the storage invalidated oids can be polled from, or None.
+        """
+        try:
+            storage = self.dmd._p_jar.db().storage
+        except AttributeError:
+            return None
+        if not hasattr(storage, 'poll_invalidations'):
+            log.debug("Storage %r does not report invalidations", storage)
+            return None
+        # the first poll only establishes a starting point
+        storage.poll_invalidations()
+        return storage
+
     def _initCatalogs(self):
         self._guidManager = IGUIDManager(self.dmd)
 
@@ -83,8 +124,42 @@ class Manager(object):
             DEVICE: self._devices,
         }
 
+        self._eventClassIndex = None
+        if self._storage is not None:
+            self._eventClassIndex = CatalogEventClassIndex(self._events)
+        self._deviceIndex = DeviceIdentityIndex(
+            self, trackInvalidations=self._storage is not None)
+
     def reset(self):
         self._initCatalogs()
+        if self._batchCache is not None:
+            self._batchCache.clear()
+
+    @contextmanager
+    def batch(self):
+        """
+        Share element lookups between the events processed in the block.
+        """
+        self._batchCache = {}
+        try:
+            yield
+        finally:
+            self._batchCache = None
+
+    def sync(self):
+        """
+        Sync the dmd connection and apply the changes it picked up to the
+        event class and device identity indexes.
+        """
+        # poll before syncing so every polled change is visible once the
+        # indexes re-read the objects
+        changes = None
+        if self._storage is not None:
+            changes = self._storage.poll_invalidations()
+        self.dmd._p_jar.sync()
+        if self._storage is not None:
+            self._eventClassIndex.invalidate(changes)
+            self._deviceIndex.invalidate(changes)
 
     def getEventClassOrganizer(self, eventClassName):
         try:
@@ -97,9 +172,14 @@ class Manager(object):
         """
         Find a Device's EventClass
         """
+        find = None
+        if self._eventClassIndex is not None:
+            find = self._eventClassIndex.find
         return self._events.lookup(eventContext.eventProxy,
-                                   eventContext.deviceObject)
+                                   eventContext.deviceObject,
+                                   find=find)
 
+    @batchcached
     def getElementByUuid(self, uuid):
         """
         Get a Device/Component by UUID
@@ -206,7 +286,7 @@ class Manager(object):
 
         return device_brains, devices
 
-    @FunctionCache("findDeviceUuid", cache_miss_marker=-1, default_timeout=300)
+    @batchcached
     def findDeviceUuid(self, identifier, ipAddress):
         """
         This will return the device's
@@ -215,18 +295,14 @@ class Manager(object):
         @type  ipaddress: string
         @param ipaddress: The known ipaddress of the device
         """
-        device_brains, devices = self._findDevices(identifier, ipAddress, limit=1)
-        if device_brains:
-            return self.uuidFromBrain(device_brains[0])
-        if devices:
-            return self.getElementUuid(devices[0])
-        return None
+        return self._deviceIndex.findDeviceUuid(identifier, ipAddress)
 
     def findDevice(self, identifier, ipAddress):
         uuid = self.findDeviceUuid(identifier, ipAddress)
         if uuid:
             return self.getElementByUuid(uuid)
 
+    @batchcached
     def getUuidsOfPath(self, node):
         """
         Looks up all the UUIDs in the tree path of an Organizer
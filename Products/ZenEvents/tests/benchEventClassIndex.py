@@ -0,0 +1,90 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+"""
+Measure EventClassIndex lookups per second against a synthetic tree of
+event class mappings.
+
+    python benchEventClassIndex.py --mappings 50000 --keys 5000
+"""
+
+import random
+import time
+from optparse import OptionParser
+
+from Products.ZenEvents.events2.eventclassindex import EventClassIndex
+
+
+class SyntheticMapping(object):
+
+    def __init__(self, eventClassKey, sequence, message):
+        self.eventClassKey = eventClassKey
+        self.sequence = sequence
+        self.message = message
+
+    def match(self, evt, device):
+        return evt.message == self.message
+
+
+class SyntheticEvent(object):
+
+    def __init__(self, eventClassKey, message):
+        self.eventClassKey = eventClassKey
+        self.message = message
+
+
+def buildIndex(mappings, keys, defaults):
+    index = EventClassIndex()
+    for i in xrange(mappings):
+        key = 'key%d' % (i % keys)
+        path = '/zport/dmd/Events/Synthetic/%d/instances/m%d' % (i % 100, i)
+        index.add(i, path, SyntheticMapping(key, i // keys, 'message%d' % i))
+    for i in xrange(defaults):
+        path = '/zport/dmd/Events/instances/default%d' % i
+        index.add(mappings + i, path,
+                  SyntheticMapping('defaultmapping', i, 'default%d' % i))
+    return index
+
+
+def lookup(index, evt):
+    for mapping in index.find(evt.eventClassKey):
+        if mapping.match(evt, None):
+            return mapping
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--mappings', type='int', default=50000)
+    parser.add_option('--keys', type='int', default=5000)
+    parser.add_option('--defaults', type='int', default=20)
+    parser.add_option('--lookups', type='int', default=200000)
+    options, args = parser.parse_args()
+
+    start = time.time()
+    index = buildIndex(options.mappings, options.keys, options.defaults)
+    print "Indexed %d mappings over %d keys in %.2fs" % (
+        len(index), options.keys, time.time() - start)
+
+    events = []
+    for i in xrange(options.lookups):
+        n = random.randrange(options.mappings)
+        events.append(SyntheticEvent('key%d' % (n % options.keys),
+                                     'message%d' % n))
+
+    start = time.time()
+    for evt in events:
+        lookup(index, evt)
+    elapsed = time.time() - start
+    print "%d lookups in %.2fs: %d lookups/s" % (
+        options.lookups, elapsed, options.lookups / elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+from Products.ZenEvents.EventClassInst import compiledCache
+
+
+class MockEvent(object):
+
+    def __init__(self, message):
+        self.message = message
+
+
+class TestCompiledCache(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestCompiledCache, self).afterSetUp()
+        compiledCache.clear()
+        org = self.dmd.Events.createOrganizer('/Test/Cache')
+        self.inst = org.createInstance('cachetest')
+
+    def testRuleIsCompiledOnce(self):
+        self.inst.rule = "evt.message == 'up'"
+        self.assertTrue(self.inst.match(MockEvent('up'), None))
+        code = compiledCache.get(self.inst, 'rule', self.inst.rule)
+        self.assertIsNotNone(code)
+        self.assertFalse(self.inst.match(MockEvent('down'), None))
+        self.assertIs(compiledCache.get(self.inst, 'rule', self.inst.rule), code)
+
+    def testRuleChangeRecompiles(self):
+        self.inst.rule = "evt.message == 'up'"
+        self.assertTrue(self.inst.match(MockEvent('up'), None))
+        self.inst.rule = "evt.message == 'down'"
+        self.assertFalse(self.inst.match(MockEvent('up'), None))
+        self.assertTrue(self.inst.match(MockEvent('down'), None))
+        self.assertIsNone(compiledCache.get(self.inst, 'rule', "evt.message == 'up'"))
+
+    def testRegexMatch(self):
+        self.inst.regex = "link (?P<state>up|down)"
+        self.assertTrue(self.inst.match(MockEvent('LINK UP'), None))
+        pattern = compiledCache.get(self.inst, 'match', self.inst.regex)
+        self.assertIsNotNone(pattern)
+        self.inst.regex = "link gone"
+        self.assertFalse(self.inst.match(MockEvent('LINK UP'), None))
+        self.assertIsNot(compiledCache.get(self.inst, 'match', self.inst.regex), pattern)
+
+    def testBadRegexDoesNotMatch(self):
+        self.inst.regex = "link (up"
+        self.assertFalse(self.inst.match(MockEvent('link (up'), None))
+        self.assertIsNone(compiledCache.get(self.inst, 'match', self.inst.regex))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestCompiledCache))
+    return suite
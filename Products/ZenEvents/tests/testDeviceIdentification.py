@@ -8,6 +8,8 @@
 ##############################################################################
 
 
+import transaction
+
 from Products.ZenEvents.events2.processing import Manager
 from Products.ZenUtils.guid.interfaces import IGlobalIdentifier
 from Products.ZenTestCase.BaseTestCase import BaseTestCase
@@ -36,6 +38,52 @@ class DeviceIdTest(BaseTestCase):
         test('dev', '10.10.10.3', "failed to find by interface's secondary IP")
         test('dev', '10.10.10.4', "failed missing IP test", None)
 
+    def testIdentityIndexFollowsChanges(self):
+        device = self.dmd.Devices.createInstance('indexeddevice')
+        device.setManageIp('10.10.20.1')
+        device.setTitle('Indexed Device')
+        device_uuid = IGlobalIdentifier(device).getGUID()
+
+        manager = Manager(self.dmd)
+        self.assertEquals(manager.findDeviceUuid('indexeddevice', ''), device_uuid)
+        self.assertEquals(manager.findDeviceUuid('indexed device', ''), device_uuid)
+        hits = manager._deviceIndex.stats()['hits']
+        self.assertEquals(manager.findDeviceUuid('dev', '10.10.20.1'), device_uuid)
+        self.assertEquals(manager._deviceIndex.stats()['hits'], hits + 1)
+
+        # a stale entry must not resolve once the device has moved on
+        device.setManageIp('10.10.20.2')
+        self.assertEquals(manager.findDeviceUuid('dev', '10.10.20.1'), None)
+        self.assertEquals(manager.findDeviceUuid('dev', '10.10.20.2'), device_uuid)
+
+    def testStaleEntryNotVerifiedByOtherInterface(self):
+        device = self.dmd.Devices.createInstance('ifacedevice')
+        device.os.addIpInterface('eth0', False)
+        device.os.interfaces()[0].addIpAddress('10.10.30.2')
+        other = self.dmd.Devices.createInstance('otherdevice')
+        device_uuid = IGlobalIdentifier(device).getGUID()
+        other_uuid = IGlobalIdentifier(other).getGUID()
+
+        manager = Manager(self.dmd)
+        self.assertEquals(manager.findDeviceUuid('dev', '10.10.30.2'), device_uuid)
+        # an id left behind by a device that has since been renamed
+        manager._deviceIndex._byId['renamed'] = other_uuid
+        self.assertEquals(manager.findDeviceUuid('renamed', '10.10.30.2'),
+                          device_uuid)
+
+    def testUnresolvedIdentifierFollowsDeviceChanges(self):
+        device = self.dmd.Devices.createInstance('untrackeddevice')
+        device_uuid = IGlobalIdentifier(device).getGUID()
+        transaction.savepoint()
+
+        manager = Manager(self.dmd)
+        manager._deviceIndex.warm()
+        self.assertEquals(manager.findDeviceUuid('Renamed Device', ''), None)
+        # warmed but never looked up, the device is still followed
+        device.setTitle('Renamed Device')
+        manager._deviceIndex.invalidate([device._p_oid])
+        self.assertEquals(manager.findDeviceUuid('renamed device', ''), device_uuid)
+
 def test_suite():
     from unittest import TestSuite, makeSuite
     tests = []
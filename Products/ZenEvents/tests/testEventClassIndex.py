@@ -0,0 +1,79 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+from Products.ZenEvents.events2.eventclassindex import EventClassIndex
+
+
+class MockMapping(object):
+
+    def __init__(self, eventClassKey, sequence):
+        self.eventClassKey = eventClassKey
+        self.sequence = sequence
+
+
+class TestEventClassIndex(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestEventClassIndex, self).afterSetUp()
+        self.index = EventClassIndex()
+        self.default = MockMapping('defaultmapping', 0)
+        self.index.add('d', '/Events/d', self.default)
+
+    def testFindSortsBySequence(self):
+        second = MockMapping('linkDown', 1)
+        first = MockMapping('linkDown', 0)
+        self.index.add('a', '/Events/a', second)
+        self.index.add('b', '/Events/b', first)
+        self.assertEqual(self.index.find('linkDown'), (first, second, self.default))
+
+    def testUnknownKeyReturnsDefaults(self):
+        self.assertEqual(self.index.find('noSuchKey'), (self.default,))
+        self.assertEqual(self.index.find('defaultmapping'), (self.default,))
+        self.assertFalse('noSuchKey' in self.index._candidates)
+
+    def testRemove(self):
+        mapping = MockMapping('linkDown', 0)
+        self.index.add('a', '/Events/a', mapping)
+        self.assertEqual(self.index.find('linkDown'), (mapping, self.default))
+        self.index.remove('a')
+        self.assertEqual(self.index.find('linkDown'), (self.default,))
+        self.assertEqual(len(self.index), 1)
+
+    def testTouchReadsChangedKeyAndSequence(self):
+        first = MockMapping('linkDown', 0)
+        second = MockMapping('linkDown', 1)
+        self.index.add('a', '/Events/a', first)
+        self.index.add('b', '/Events/b', second)
+        self.assertEqual(self.index.find('linkDown'), (first, second, self.default))
+
+        first.sequence = 2
+        self.index.touch('a')
+        self.assertEqual(self.index.find('linkDown'), (second, first, self.default))
+
+        second.eventClassKey = 'linkUp'
+        self.index.touch('b')
+        self.assertEqual(self.index.find('linkDown'), (first, self.default))
+        self.assertEqual(self.index.find('linkUp'), (second, self.default))
+
+    def testDefaultMappingChangeUpdatesAllCandidates(self):
+        mapping = MockMapping('linkDown', 0)
+        self.index.add('a', '/Events/a', mapping)
+        self.index.find('linkDown')
+        other = MockMapping('defaultmapping', 1)
+        self.index.add('e', '/Events/e', other)
+        self.assertEqual(self.index.find('linkDown'), (mapping, self.default, other))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestEventClassIndex))
+    return suite
@@ -0,0 +1,133 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import time
+import unittest
+
+from zenoss.protocols.protobufs.zep_pb2 import Signal
+
+from Products.ZenEvents.NotificationDao import NotificationDao
+
+
+class MockWindow(object):
+
+    enabled = True
+
+    def __init__(self, boundary):
+        self.boundary = boundary
+
+    def nextEvent(self, now):
+        return self.boundary
+
+
+class MockNotification(object):
+
+    _p_serial = 'serial1'
+
+    def __init__(self, guid, enabled=True, windows=()):
+        self.guid = guid
+        self.enabled = enabled
+        self._windows = list(windows)
+        self.checks = 0
+
+    def windows(self):
+        return self._windows
+
+    def isActive(self):
+        self.checks += 1
+        return self.enabled
+
+
+class MockNotificationDao(NotificationDao):
+
+    def __init__(self, notifications):
+        self.notifications = notifications
+        self.syncs = 0
+        self.syncInterval = 60
+
+    def getNotifications(self):
+        self.syncs += 1
+        return self.notifications
+
+    def notificationGuid(self, notification):
+        return notification.guid
+
+
+def createSignal(subscriber_uuid):
+    signal = Signal()
+    signal.subscriber_uuid = subscriber_uuid
+    return signal
+
+
+class NotificationDaoTest(unittest.TestCase):
+
+    def testMatchByGuid(self):
+        notifications = [MockNotification('a'), MockNotification('b'),
+                         MockNotification('c', enabled=False)]
+        dao = MockNotificationDao(notifications)
+        self.assertEqual([notifications[1]],
+                         dao.getSignalNotifications(createSignal('b')))
+        self.assertEqual([], dao.getSignalNotifications(createSignal('c')))
+        self.assertEqual([], dao.getSignalNotifications(createSignal('x')))
+        # only the notifications subscribed to a signal are checked
+        self.assertEqual(0, notifications[0].checks)
+
+    def testSyncInterval(self):
+        notification = MockNotification('a')
+        dao = MockNotificationDao([notification])
+        for i in range(10):
+            dao.getSignalNotifications(createSignal('a'))
+        self.assertEqual(1, dao.syncs)
+        dao.notifications = []
+        dao._nextSync = 0
+        self.assertEqual([], dao.getSignalNotifications(createSignal('a')))
+        self.assertEqual(2, dao.syncs)
+
+    def testActiveUntilWindowBoundary(self):
+        window = MockWindow(time.time() + 3600)
+        notification = MockNotification('a', windows=[window])
+        dao = MockNotificationDao([notification])
+        for i in range(10):
+            dao.getSignalNotifications(createSignal('a'))
+        self.assertEqual(1, notification.checks)
+        # the window is due to start or end, but has not been yet
+        window.boundary = time.time() - 1
+        dao._index['a'][0].activeUntil = 0
+        dao.getSignalNotifications(createSignal('a'))
+        dao.getSignalNotifications(createSignal('a'))
+        self.assertEqual(3, notification.checks)
+
+    def testChangedNotification(self):
+        notification = MockNotification('a')
+        dao = MockNotificationDao([notification])
+        dao.getSignalNotifications(createSignal('a'))
+        # changed elsewhere, and already loaded again by another reader
+        notification._p_serial = 'serial2'
+        notification.guid = 'b'
+        dao._nextSync = 0
+        self.assertEqual([], dao.getSignalNotifications(createSignal('a')))
+        self.assertEqual([notification],
+                         dao.getSignalNotifications(createSignal('b')))
+
+    def testDisabledNotification(self):
+        notification = MockNotification('a')
+        dao = MockNotificationDao([notification])
+        self.assertEqual([notification],
+                         dao.getSignalNotifications(createSignal('a')))
+        notification.enabled = False
+        notification._p_serial = 'serial2'
+        dao._nextSync = 0
+        self.assertEqual([], dao.getSignalNotifications(createSignal('a')))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(NotificationDaoTest))
+    return suite
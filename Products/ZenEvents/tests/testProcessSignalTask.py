@@ -124,8 +124,8 @@ class MockNotificationDao(NotificationDao):
     def getNotifications(self):
         return self.notifications
 
-    def notificationSubscribesToSignal(self, notification, signal):
-        return signal.subscriber_uuid == notification.guid
+    def notificationGuid(self, notification):
+        return notification.guid
 
 class MockAction(TargetableAction):
     """
@@ -299,6 +299,31 @@ evt.device = '%s'
         processed = self._processEvent(event)
         self.assertEqual(STATUS_SUPPRESSED, processed.event.status)
 
+    def testBatchProcessing(self):
+        """
+        Events processed as a batch come back in order, with dropped events
+        reported by their DropEvent.
+        """
+        self.dmd.Events.createOrganizer('/Perf/Filesystem')
+        self.dmd.Events.Perf.Filesystem.transform = \
+            'if evt.summary == "drop me": evt._action="drop"'
+
+        events = []
+        for summary in ('first', 'drop me', 'third'):
+            event = Event()
+            event.actor.element_identifier = 'localhost'
+            event.actor.element_type_id = DEVICE
+            event.severity = SEVERITY_ERROR
+            event.event_class = '/Perf/Filesystem'
+            event.summary = summary
+            events.append(event)
+
+        results = self.processor.processMessages(events)
+        self.assertEqual(3, len(results))
+        self.assertEqual('first', results[0].event.summary)
+        self.assert_(isinstance(results[1], DropEvent))
+        self.assertEqual('third', results[2].event.summary)
+
 
 def test_suite():
     from unittest import TestSuite, makeSuite
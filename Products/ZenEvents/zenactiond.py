@@ -29,7 +29,8 @@ from Products.ZenEvents.Event import Event
 from Products.ZenMessaging.queuemessaging.QueueConsumer import QueueConsumer
 from Products.ZenMessaging.queuemessaging.interfaces import IQueueConsumerTask
 from Products.ZenEvents.ZenEventClasses import Warning as SEV_WARNING
-from Products.ZenEvents.NotificationDao import NotificationDao
+from Products.ZenEvents.NotificationDao import NotificationDao, \
+    DEFAULT_SYNC_INTERVAL
 from zope.component import getUtility, getUtilitiesFor
 from zope.component.interfaces import ComponentLookupError
 from zope.interface import implements
@@ -212,6 +213,10 @@ class ZenActionD(ZCmdBase):
             dest='maintenceWindowBatchSize', default=20, type="int",
             help="How many devices update per one transaction on maintenance windows execution")
 
+        self.parser.add_option('--notificationsyncseconds', dest="notificationSyncSeconds", type="float",
+                               default=DEFAULT_SYNC_INTERVAL,
+                               help='Seconds between checks for changed notifications (default: %.1f)' % \
+                                       DEFAULT_SYNC_INTERVAL)
         self.parser.add_option("--workerid", dest='workerid', type='int', default=None,
                                help="ID of the worker instance.")
 
@@ -222,7 +227,7 @@ class ZenActionD(ZCmdBase):
         for name, action in getUtilitiesFor(IAction):
             action.configure(options_dict)
 
-        dao = NotificationDao(self.dmd)
+        dao = NotificationDao(self.dmd, self.options.notificationSyncSeconds)
         task = ISignalProcessorTask(dao)
 
         if self.options.workerid == 0 and (self.options.daemon or self.options.cycle):
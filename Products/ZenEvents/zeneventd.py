@@ -24,7 +24,7 @@ import time
 from datetime import datetime, timedelta
 
 import Globals
-from zope.component import getUtility, provideUtility, adapter
+from zope.component import getUtility, queryUtility, provideUtility, adapter
 
 from zope.interface import implements, implementer
 from zope.component.event import objectEventNotify
@@ -86,12 +86,7 @@ class EventPipelineProcessor(object):
             self.nextSync = datetime.now()
             self.syncInterval = timedelta(0,0,500000)
 
-    def processMessage(self, message):
-        """
-        Handles a queue message, can call "acknowledge" on the Queue Consumer
-        class when it is done with the message
-        """
-
+    def _syncIfNeeded(self):
         if self.SYNC_EVERY_EVENT:
             doSync = True
         else:
@@ -101,27 +96,88 @@ class EventPipelineProcessor(object):
             self.nextSync = currentTime + self.syncInterval
 
         if doSync:
-            self.dmd._p_jar.sync()
+            self._manager.sync()
+
+    def _createContext(self, message):
+        # extract event from message body
+        zepevent = ZepRawEvent()
+        zepevent.event.CopyFrom(message)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Received event: %s", to_dict(zepevent.event))
+
+        return EventContext(log, zepevent)
+
+    def _applyPipe(self, pipe, eventContext):
+        eventContext = pipe(eventContext)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('After pipe %s, event context is %s' % ( pipe.name, to_dict(eventContext.zepRawEvent) ))
+        if eventContext.event.status == STATUS_DROPPED:
+            raise DropEvent('Dropped by %s' % pipe, eventContext.event)
+        return eventContext
+
+    def processMessage(self, message):
+        """
+        Handles a queue message, can call "acknowledge" on the Queue Consumer
+        class when it is done with the message
+        """
+        self._syncIfNeeded()
+        return self._processEvent(message)
+
+    def processMessages(self, messages):
+        """
+        Handles a batch of queue messages.  Each pipe is run over every
+        event in the batch before the next pipe starts, and element lookups
+        are shared between the events of the batch.
+
+        @return: a list with, for each message in order, the ZepRawEvent to
+            publish or the DropEvent raised for it
+        """
+        self._syncIfNeeded()
+        results = [None] * len(messages)
+        with self._manager.batch():
+            contexts = []
+            for i, message in enumerate(messages):
+                try:
+                    contexts.append((i, self._createContext(message)))
+                except Exception as e:
+                    results[i] = self._failureEvent(message, e)
+
+            for pipe in self._pipes:
+                remaining = []
+                for i, eventContext in contexts:
+                    try:
+                        eventContext = self._applyPipe(pipe, eventContext)
+                    except DropEvent as e:
+                        results[i] = e
+                    except AttributeError:
+                        # connection to zope was lost - process this event
+                        # again on its own, which resets and retries
+                        try:
+                            results[i] = self._processEvent(messages[i])
+                        except DropEvent as e:
+                            results[i] = e
+                    except Exception as e:
+                        results[i] = self._failureEvent(messages[i], e)
+                    else:
+                        remaining.append((i, eventContext))
+                contexts = remaining
 
+            for i, eventContext in contexts:
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("Publishing event: %s", to_dict(eventContext.zepRawEvent))
+                results[i] = eventContext.zepRawEvent
+        return results
+
+    def _processEvent(self, message):
         try:
             retry = True
             processed = False
             while not processed:
                 try:
-                    # extract event from message body
-                    zepevent = ZepRawEvent()
-                    zepevent.event.CopyFrom(message)
-                    if log.isEnabledFor(logging.DEBUG):
-                        log.debug("Received event: %s", to_dict(zepevent.event))
-
-                    eventContext = EventContext(log, zepevent)
+                    eventContext = self._createContext(message)
 
                     for pipe in self._pipes:
-                        eventContext = pipe(eventContext)
-                        if log.isEnabledFor(logging.DEBUG):
-                            log.debug('After pipe %s, event context is %s' % ( pipe.name, to_dict(eventContext.zepRawEvent) ))
-                        if eventContext.event.status == STATUS_DROPPED:
-                            raise DropEvent('Dropped by %s' % pipe, eventContext.event)
+                        eventContext = self._applyPipe(pipe, eventContext)
 
                     processed = True
 
@@ -139,31 +195,42 @@ class EventPipelineProcessor(object):
             # we want these to propagate out
             raise
         except Exception as e:
-            log.info("Failed to process event, forward original raw event: %s", to_dict(zepevent.event))
-            # Pipes and plugins may raise ProcessingException's for their own reasons - only log unexpected
-            # exceptions of other type (will insert stack trace in log)
-            if not isinstance(e, ProcessingException):
-                log.exception(e)
+            return self._failureEvent(message, e)
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Publishing event: %s", to_dict(eventContext.zepRawEvent))
 
-            # construct wrapper event to report this event processing failure (including content of the
-            # original event)
-            origzepevent = ZepRawEvent()
-            origzepevent.event.CopyFrom(message)
-            failReportEvent = dict(
-                uuid = guid.generate(),
-                created_time = int(time.time()*1000),
-                fingerprint='|'.join(['zeneventd', 'processMessage', repr(e)]),
-                # Don't send the *same* event class or we trash and and crash endlessly
-                eventClass='/',
-                summary='Internal exception processing event: %r' % e,
-                message='Internal exception processing event: %r/%s' % (e, to_dict(origzepevent.event)),
-                severity=4,
-            )
-            zepevent = ZepRawEvent()
-            zepevent.event.CopyFrom(from_dict(Event, failReportEvent))
-            eventContext = EventContext(log, zepevent)
-            eventContext.eventProxy.device = 'zeneventd'
-            eventContext.eventProxy.component = 'processMessage'
+        return eventContext.zepRawEvent
+
+    def _failureEvent(self, message, e):
+        """
+        Build the event reporting that message could not be processed.
+        """
+        log.info("Failed to process event, forward original raw event: %s", to_dict(message))
+        # Pipes and plugins may raise ProcessingException's for their own reasons - only log unexpected
+        # exceptions of other type (will insert stack trace in log)
+        if not isinstance(e, ProcessingException):
+            log.exception(e)
+
+        # construct wrapper event to report this event processing failure (including content of the
+        # original event)
+        origzepevent = ZepRawEvent()
+        origzepevent.event.CopyFrom(message)
+        failReportEvent = dict(
+            uuid = guid.generate(),
+            created_time = int(time.time()*1000),
+            fingerprint='|'.join(['zeneventd', 'processMessage', repr(e)]),
+            # Don't send the *same* event class or we trash and and crash endlessly
+            eventClass='/',
+            summary='Internal exception processing event: %r' % e,
+            message='Internal exception processing event: %r/%s' % (e, to_dict(origzepevent.event)),
+            severity=4,
+        )
+        zepevent = ZepRawEvent()
+        zepevent.event.CopyFrom(from_dict(Event, failReportEvent))
+        eventContext = EventContext(log, zepevent)
+        eventContext.eventProxy.device = 'zeneventd'
+        eventContext.eventProxy.component = 'processMessage'
 
         if log.isEnabledFor(logging.DEBUG):
             log.debug("Publishing event: %s", to_dict(eventContext.zepRawEvent))
@@ -186,12 +253,26 @@ class BaseQueueConsumerTask(object):
 
 class TwistedQueueConsumerTask(BaseQueueConsumerTask):
 
-    def __init__(self, processor):
+    def __init__(self, processor, batchSize=1):
         BaseQueueConsumerTask.__init__(self, processor)
         self.queue = self._queueSchema.getQueue(QUEUE_RAW_ZEN_EVENTS)
+        self.batchSize = batchSize
+        self._batch = []
+        self._flushCall = None
 
-    @defer.inlineCallbacks
     def processMessage(self, message):
+        if self.batchSize <= 1:
+            return self._processSingleMessage(message)
+        self._batch.append(message)
+        if len(self._batch) >= self.batchSize:
+            return self._flushBatch()
+        if self._flushCall is None:
+            # process whatever has arrived once the reactor is done
+            # delivering the messages it has already read
+            self._flushCall = reactor.callLater(0, self._flushBatch)
+
+    @defer.inlineCallbacks
+    def _processSingleMessage(self, message):
         try:
             hydrated = hydrateQueueMessage(message, self._queueSchema)
         except Exception as e:
@@ -217,14 +298,76 @@ class TwistedQueueConsumerTask(BaseQueueConsumerTask):
                 log.exception(e)
                 yield self.queueConsumer.reject(message)
 
+    @defer.inlineCallbacks
+    def _flushBatch(self):
+        """
+        Process the queued messages as one batch, publish the results and
+        then acknowledge the whole batch.
+        """
+        if self._flushCall is not None:
+            if self._flushCall.active():
+                self._flushCall.cancel()
+            self._flushCall = None
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+
+        toAck = []
+        messages = []
+        hydrated = []
+        for message in batch:
+            try:
+                hydrated.append(hydrateQueueMessage(message, self._queueSchema))
+            except Exception as e:
+                log.error("Failed to hydrate raw event: %s", e)
+                toAck.append(message)
+            else:
+                messages.append(message)
+
+        try:
+            results = self.processor.processMessages(hydrated)
+        except Exception as e:
+            log.exception(e)
+            for message in messages:
+                yield self.queueConsumer.reject(message)
+            results = []
+            messages = []
+
+        for message, result in zip(messages, results):
+            if isinstance(result, DropEvent):
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug('%s - %s' % (result.message, to_dict(result.event)))
+                toAck.append(message)
+                continue
+            try:
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("Publishing event: %s", to_dict(result))
+                yield self.queueConsumer.publishMessage(EXCHANGE_ZEP_ZEN_EVENTS,
+                    self._routing_key(result), result, declareExchange=False)
+            except Exception as e:
+                log.exception(e)
+                yield self.queueConsumer.reject(message)
+            else:
+                toAck.append(message)
+
+        for message in toAck:
+            yield self.queueConsumer.acknowledge(message)
+
 
 class EventDTwistedWorker(object):
     def __init__(self, dmd):
         super(EventDTwistedWorker, self).__init__()
         self._amqpConnectionInfo = getUtility(IAMQPConnectionInfo)
         self._queueSchema = getUtility(IQueueSchema)
-        self._consumer_task = TwistedQueueConsumerTask(EventPipelineProcessor(dmd))
+        batchSize = 1
+        config = queryUtility(IDaemonConfig, 'zeneventd_config')
+        if config is not None:
+            batchSize = getattr(config.getConfig(), 'batchSize', 1)
+        self._consumer_task = TwistedQueueConsumerTask(EventPipelineProcessor(dmd),
+                                                       batchSize=batchSize)
         self._consumer = QueueConsumer(self._consumer_task, dmd)
+        if batchSize > 1:
+            self._consumer.setPrefetch(batchSize)
 
     def run(self):
         reactor.callWhenRunning(self._start)
@@ -288,6 +431,10 @@ class ZenEventD(ZCmdBase):
                     help='Sets the number of messages each worker gets from the queue at any given time. Default is 1. '
                     'Change this only if event processing is deemed slow. Note that increasing the value increases the '
                     'probability that events will be processed out of order.')
+        self.parser.add_option('--batchsize', dest='batchSize', default=1,
+                    type="int",
+                    help='Sets the number of queued events processed together as one batch. Each pipe runs over '
+                    'the whole batch and device lookups are shared between its events. Default is 1 (no batching).')
         self.parser.add_option('--maxpickle', dest='maxpickle', default=100, type="int",
                     help='Sets the number of pickle files in var/zeneventd/failed_transformed_events.')
         self.parser.add_option('--pickledir', dest='pickledir', default=zenPath('var/zeneventd/failed_transformed_events'),
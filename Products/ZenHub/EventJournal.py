@@ -0,0 +1,252 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__ = """EventJournal
+
+Append-only journal of the changes made to an event queue, replayed to
+restore the queued events after a restart.
+
+The journal is kept in segment files named <name>.<number>.log.  Each
+segment starts with a checkpoint followed by a snapshot of the queued
+events; every later change to the queues is appended as a record.  Once a
+segment has grown to twice the size of its snapshot, the journal is
+compacted into a new segment and the older segments are removed.
+
+Records are written to the segment as they are made, so they survive the
+daemon dying, and synced to disk at most every syncInterval seconds.
+Removing events from a queue is only recorded once they have been sent:
+after a crash a few events may be sent twice, but none are lost.
+"""
+
+import os
+import re
+import time
+import zlib
+import struct
+import logging
+import cPickle as pickle
+
+log = logging.getLogger("zen.EventJournal")
+
+# record types
+CHECKPOINT = 1
+SNAPSHOT = 2
+APPEND = 3
+POP = 4
+EXTENDLEFT = 5
+RETIRE = 6
+
+# length and crc32 of the data, record type
+_HEADER = struct.Struct('!IIB')
+
+# compact the journal only once a segment holds this many bytes
+DEFAULT_COMPACT_BYTES = 16 * 1024 * 1024
+
+
+class EventJournal(object):
+    """
+    Journal of the event queues of one kind.
+
+    Queues are identified by a generation number, as the daemon replaces
+    its queues by new ones each time it sends the queued events.
+
+    @param path: directory holding the segments
+    @type path: string
+    @param name: name of the segments
+    @type name: string
+    @param syncInterval: most seconds between syncs to disk
+    @type syncInterval: float
+    @param compactBytes: segment size below which it is never compacted
+    @type compactBytes: int
+    """
+
+    def __init__(self, path, name, syncInterval=1.0,
+                 compactBytes=DEFAULT_COMPACT_BYTES):
+        self.path = path
+        self.name = name
+        self.syncInterval = syncInterval
+        self.compactBytes = compactBytes
+        self._segmentPattern = re.compile(r'^%s\.(\d+)\.log$' % re.escape(name))
+        self._segment = 0
+        self._file = None
+        self._bytes = 0
+        self._snapshotBytes = 0
+        self._dirty = False
+        self._lastSync = time.time()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _segmentFile(self, number):
+        return os.path.join(self.path, '%s.%08d.log' % (self.name, number))
+
+    def _segments(self):
+        segments = []
+        for filename in os.listdir(self.path):
+            match = self._segmentPattern.match(filename)
+            if match:
+                segments.append(int(match.group(1)))
+        return sorted(segments)
+
+    def load(self, queueFactory):
+        """
+        Replay the journal.
+
+        @param queueFactory: creates an empty event queue to replay the
+            records of a queue into
+        @type queueFactory: callable
+        @return: the queued events, oldest first, and the highest generation
+            of the journaled queues
+        @rtype: tuple
+        """
+        segments = self._segments()
+        if not segments:
+            return [], 0
+        self._segment = segments[-1]
+        filename = self._segmentFile(self._segment)
+        with open(filename, 'rb') as f:
+            data = f.read()
+        queues = {}
+        generation = 0
+        offset = 0
+        while offset + _HEADER.size <= len(data):
+            length, crc, kind = _HEADER.unpack_from(data, offset)
+            start = offset + _HEADER.size
+            payload = data[start:start + length]
+            if len(payload) < length or zlib.crc32(payload) & 0xffffffff != crc:
+                break
+            try:
+                args = pickle.loads(payload)
+            except Exception:
+                break
+            offset = start + length
+            if kind == CHECKPOINT:
+                queues.clear()
+                continue
+            gen = args[0]
+            generation = max(generation, gen)
+            if kind == RETIRE:
+                queues.pop(gen, None)
+                continue
+            queue = queues.get(gen)
+            if queue is None:
+                queue = queues[gen] = queueFactory()
+            if kind == APPEND:
+                queue.append(args[1])
+            elif kind == POP:
+                for i in xrange(min(args[1], len(queue))):
+                    queue.popleft()
+            elif kind in (SNAPSHOT, EXTENDLEFT):
+                queue.extendleft(args[1])
+        if offset < len(data):
+            log.warning("Ignoring %d damaged bytes at the end of %s",
+                        len(data) - offset, filename)
+        events = []
+        for gen in sorted(queues):
+            events.extend(queues[gen])
+        return events, generation
+
+    def compact(self, snapshots):
+        """
+        Start a new segment holding the given queues, and remove the older
+        segments.
+
+        @param snapshots: generation and events of each queue
+        @type snapshots: list of tuples
+        """
+        number = self._segment + 1
+        filename = self._segmentFile(number)
+        tmpFilename = filename + '.tmp'
+        with open(tmpFilename, 'wb') as f:
+            size = self._writeRecord(f, CHECKPOINT, ())
+            for generation, events in snapshots:
+                size += self._writeRecord(f, SNAPSHOT, (generation, list(events)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmpFilename, filename)
+        self._close()
+        for old in self._segments():
+            if old < number:
+                try:
+                    os.remove(self._segmentFile(old))
+                except OSError as ex:
+                    log.warning("Unable to remove %s: %s", self._segmentFile(old), ex)
+        self._segment = number
+        self._bytes = self._snapshotBytes = size
+        self._dirty = False
+        self._lastSync = time.time()
+
+    def shouldCompact(self):
+        """
+        Is the current segment big enough to be compacted?
+        """
+        return self._bytes > max(self.compactBytes, 2 * self._snapshotBytes)
+
+    def append(self, generation, event):
+        self._record(APPEND, (generation, event))
+
+    def extendleft(self, generation, events):
+        self._record(EXTENDLEFT, (generation, list(events)))
+
+    def retire(self, generation):
+        """
+        Record that a queue is no longer used.
+        """
+        self._record(RETIRE, (generation,))
+
+    def pop(self, generation, count=1):
+        """
+        Record that the oldest events of a queue have been sent.
+        """
+        self._record(POP, (generation, count))
+
+    def _record(self, kind, args):
+        self._write(kind, args)
+        self._maybeSync()
+
+    def _writeRecord(self, f, kind, args):
+        data = pickle.dumps(args, pickle.HIGHEST_PROTOCOL)
+        f.write(_HEADER.pack(len(data), zlib.crc32(data) & 0xffffffff, kind))
+        f.write(data)
+        return _HEADER.size + len(data)
+
+    def _write(self, kind, args):
+        if self._file is None:
+            self._file = open(self._segmentFile(self._segment), 'ab')
+        self._bytes += self._writeRecord(self._file, kind, args)
+        # hand the record to the OS, so that it survives the daemon dying
+        self._file.flush()
+        self._dirty = True
+
+    def _maybeSync(self):
+        if time.time() - self._lastSync >= self.syncInterval:
+            self.sync()
+
+    def sync(self):
+        """
+        Write the journal to disk.
+        """
+        if self._dirty and self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._dirty = False
+        self._lastSync = time.time()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        """
+        Sync and close the current segment; it is opened again by the next
+        record.
+        """
+        self.sync()
+        self._close()
@@ -14,9 +14,15 @@ import logging
 import time
 import socket
 from Products.ZenUtils.deprecated import deprecated
+from Products.ZenHub.ResultCache import ResultCache
 
 class HubService(pb.Referenceable):
 
+    # Remote methods whose result only depends on their arguments and the
+    # model: when the service runs in zenhub workers, zenhub reuses their
+    # results until the service drops them from its resultCache.
+    cachedMethods = ()
+
     def __init__(self, dmd, instance):
         self.log = logging.getLogger('zen.hub')
         self.fqdn = socket.getfqdn()
@@ -27,6 +33,7 @@ class HubService(pb.Referenceable):
         self.listenerOptions = {}
         self.callTime = 0
         self.methodPriorityMap = {}
+        self.resultCache = ResultCache()
 
     def getPerformanceMonitor(self):
         return self.dmd.Monitors.getPerformanceMonitor(self.instance)
@@ -84,6 +91,16 @@ class HubService(pb.Referenceable):
             return self.methodPriorityMap[methodName]
         return 1
 
+    def getCachedDevices(self, method, args, kw):
+        """
+        Return the ids of the devices the result of a call to one of the
+        cachedMethods is built from.
+
+        @return: the device ids, or None for all the devices of the collector
+        @rtype: frozenset
+        """
+        return None
+
     def sendEvents(self, events):
         map(self.sendEvent, events)
 
@@ -26,6 +26,7 @@ from hashlib import sha1
 from itertools import chain
 from functools import partial
 from Products.ZenHub.metricpublisher import publisher
+from Products.ZenHub.EventJournal import EventJournal
 from twisted.cred import credentials
 from twisted.internet import reactor, defer, task
 from twisted.internet.error import ConnectionLost, ReactorNotRunning, AlreadyCalled
@@ -141,26 +142,57 @@ class FakeRemote:
         return defer.fail(ex)
 
 
+def _fieldHash(name, value):
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    else:
+        value = str(value)
+    return int(sha1(name + '\0' + value).hexdigest(), 16)
+
+
 class DefaultFingerprintGenerator(object):
     """
     Generates a fingerprint using a checksum of properties of the event.
+
+    Each property is hashed on its own and the fingerprint is the sum of
+    the hashes, so the properties need not be sorted, and the hashes of the
+    string properties that recur across events (device, component,
+    eventClass, ...) are cached.
     """
     implements(ICollectorEventFingerprintGenerator)
 
     weight = 100
 
-    _IGNORE_FIELDS = ('rcvtime','firstTime','lastTime')
+    _IGNORE_FIELDS = frozenset(('rcvtime','firstTime','lastTime'))
+
+    # the cache of property hashes is cleared once it holds this many
+    _MAX_CACHED_FIELDS = 100000
+
+    _MASK = (1 << 160) - 1
+
+    def __init__(self):
+        self._fieldHashes = {}
 
     def generate(self, event):
-        fields = []
-        for k, v in sorted(event.iteritems()):
-            if k not in DefaultFingerprintGenerator._IGNORE_FIELDS:
-                if isinstance(v, unicode):
-                    v = v.encode('utf-8')
-                else:
-                    v = str(v)
-                fields.extend((k,v))
-        return sha1('|'.join(fields)).hexdigest()
+        ignore = self._IGNORE_FIELDS
+        cache = self._fieldHashes
+        total = 0
+        for item in event.iteritems():
+            name, value = item
+            if name in ignore:
+                continue
+            if isinstance(value, basestring):
+                fieldHash = cache.get(item)
+                if fieldHash is None:
+                    if len(cache) >= self._MAX_CACHED_FIELDS:
+                        cache.clear()
+                    fieldHash = cache[item] = _fieldHash(name, value)
+            else:
+                fieldHash = _fieldHash(name, value)
+            total += fieldHash
+        return '%040x' % (total & self._MASK)
 
 
 def _load_utilities(utility_class):
@@ -278,14 +310,22 @@ class DeDupingEventQueue(BaseEventQueue):
     de-duplication of events (when an event with the same fingerprint is
     seen, the 'count' field of the event is incremented by one instead of
     sending an additional event).
+
+    The fingerprints of the events removed from the queue are remembered,
+    so that putting them back with extendleft does not compute them again.
+    Queues replacing one another can share the remembered fingerprints.
     """
 
-    def __init__(self, maxlen):
+    def __init__(self, maxlen, popped_fingerprints=None):
         super(DeDupingEventQueue, self).__init__(maxlen)
         self.default_fingerprinter = DefaultFingerprintGenerator()
         self.fingerprinters = \
             _load_utilities(ICollectorEventFingerprintGenerator)
         self.queue = collections.OrderedDict()
+        # fingerprint and event by id of the event
+        if popped_fingerprints is None:
+            popped_fingerprints = {}
+        self.popped_fingerprints = popped_fingerprints
 
     def _event_fingerprint(self, event):
         for fingerprinter in self.fingerprinters:
@@ -325,38 +365,48 @@ class DeDupingEventQueue(BaseEventQueue):
 
     def popleft(self):
         try:
-            return self.queue.popitem(last=False)[1]
+            fingerprint, event = self.queue.popitem(last=False)
         except KeyError:
             # Re-raise KeyError as IndexError for common interface across
             # queues.
             raise IndexError()
+        popped = self.popped_fingerprints
+        if len(popped) >= 2 * self.maxlen:
+            # the events were not put back; forget them
+            popped.clear()
+        popped[id(event)] = (fingerprint, event)
+        return event
+
+    def _popped_fingerprint(self, event):
+        entry = self.popped_fingerprints.pop(id(event), None)
+        if entry is not None and entry[1] is event:
+            return entry[0]
+        return self._event_fingerprint(event)
 
     def extendleft(self, events):
         # Attempt to de-duplicate with events currently in queue
         events_to_add = []
         for event in events:
-            fingerprint = self._event_fingerprint(event)
+            fingerprint = self._popped_fingerprint(event)
             if fingerprint in self.queue:
                 current_event = self.queue[fingerprint]
                 current_event['count'] = current_event.get('count', 1) + 1
                 current_event['firstTime'] = self._first_time(current_event, event)
             else:
-                events_to_add.append(event)
+                events_to_add.append((fingerprint, event))
 
         if not events_to_add:
-            return events_to_add
+            return []
         available = self.maxlen - len(self.queue)
         if not available:
-            return events_to_add
+            return [event for fingerprint, event in events_to_add]
         to_discard = 0
         if available < len(events_to_add):
             to_discard = len(events_to_add) - available
         old_queue, self.queue = self.queue, collections.OrderedDict()
-        for event in events_to_add[to_discard:]:
-            self.queue[self._event_fingerprint(event)] = event
-        for fingerprint, event in old_queue.iteritems():
-            self.queue[fingerprint] = event
-        return events_to_add[:to_discard]
+        self.queue.update(events_to_add[to_discard:])
+        self.queue.update(old_queue.iteritems())
+        return [event for fingerprint, event in events_to_add[:to_discard]]
 
     def __len__(self):
         return len(self.queue)
@@ -365,27 +415,160 @@ class DeDupingEventQueue(BaseEventQueue):
         return self.queue.itervalues()
 
 
+class PersistentEventQueue(BaseEventQueue):
+    """
+    Event queue which records every change made to an in-memory event queue
+    in an EventJournal, so that the queued events survive a restart.
+    """
+
+    def __init__(self, queue, journal, generation):
+        super(PersistentEventQueue, self).__init__(queue.maxlen)
+        self.queue = queue
+        self.journal = journal
+        self.generation = generation
+
+    def append(self, event):
+        if not 'rcvtime' in event:
+            event['rcvtime'] = time.time()
+        # journal the event before de-duplication updates its count, so
+        # that replaying it de-duplicates it the same way
+        self.journal.append(self.generation, event)
+        return self.queue.append(event)
+
+    def popleft(self):
+        # the event is only forgotten by the journal once it has been sent
+        return self.queue.popleft()
+
+    def acknowledge(self, count):
+        """
+        Record that the oldest popped events have been sent.
+        """
+        if count:
+            self.journal.pop(self.generation, count)
+
+    def extendleft(self, events):
+        discarded = self.queue.extendleft(events)
+        if events:
+            self.journal.extendleft(self.generation, events)
+        return discarded
+
+    def retire(self):
+        """
+        Forget the events of this queue once it has been replaced.
+        """
+        self.journal.retire(self.generation)
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __iter__(self):
+        return iter(self.queue)
+
+
 class EventQueueManager(object):
 
     CLEAR_FINGERPRINT_FIELDS = ('device','component','eventKey','eventClass')
 
-    def __init__(self, options, log):
+    # journal name and attribute of the queues kept in a journal
+    JOURNALED_QUEUES = (('events', 'event_queue'),
+                        ('perf_events', 'perf_event_queue'))
+
+    def __init__(self, options, log, journalPath=None):
+        """
+        @param journalPath: directory to journal the queued events in, so
+            they survive a restart; None to only queue them in memory
+        @type journalPath: string
+        """
         self.options = options
         self.transformers = _load_utilities(ICollectorEventTransformer)
         self.log = log
         self.discarded_events = 0
         # TODO: Do we want to limit the size of the clear event dictionary?
         self.clear_events_count = {}
-        self._initQueues()
+        self._journals = {}
+        self._generation = 0
+        self._sending = False
+        # fingerprints of the events being sent, by queue
+        self._popped_fingerprints = dict(
+            (name, {}) for name, attr in self.JOURNALED_QUEUES)
+        if journalPath:
+            self.maxqueuelen = options.maxpersistentqueuelen
+            restored = self._loadJournals(journalPath)
+            self._initQueues()
+            self._restoreEvents(journalPath, restored)
+        else:
+            self.maxqueuelen = options.maxqueuelen
+            self._initQueues()
+
+    def _queueType(self):
+        if self.options.deduplicate_events:
+            return DeDupingEventQueue
+        return DequeEventQueue
+
+    def _loadJournals(self, path):
+        queue_type = self._queueType()
+        restored = {}
+        for name, attr in self.JOURNALED_QUEUES:
+            journal = EventJournal(path, name,
+                syncInterval=self.options.eventQueueSyncSeconds)
+            events, generation = journal.load(
+                partial(queue_type, self.maxqueuelen))
+            self._generation = max(self._generation, generation)
+            self._journals[name] = journal
+            restored[name] = events
+        return restored
+
+    def _restoreEvents(self, path, restored):
+        for name, attr in self.JOURNALED_QUEUES:
+            queue = getattr(self, attr)
+            # the restored events are journaled by the snapshot below
+            discarded = queue.queue.extendleft(restored[name])
+            self.discarded_events += len(discarded)
+            if len(queue):
+                self.log.info("Restored %d queued %s from %s", len(queue),
+                              name.replace('_', ' '), path)
+            self._journals[name].compact([(queue.generation, list(queue))])
+
+    def _createQueue(self, queue_type, maxlen, name):
+        if queue_type is DeDupingEventQueue:
+            queue = queue_type(maxlen, self._popped_fingerprints[name])
+        else:
+            queue = queue_type(maxlen)
+        journal = self._journals.get(name)
+        if journal is None:
+            return queue
+        self._generation += 1
+        return PersistentEventQueue(queue, journal, self._generation)
 
     def _initQueues(self):
-        maxlen = self.options.maxqueuelen
-        queue_type = DeDupingEventQueue if self.options.deduplicate_events \
-            else DequeEventQueue
-        self.event_queue = queue_type(maxlen)
-        self.perf_event_queue = queue_type(maxlen)
+        maxlen = self.maxqueuelen
+        queue_type = self._queueType()
+        self.event_queue = self._createQueue(queue_type, maxlen, 'events')
+        self.perf_event_queue = self._createQueue(queue_type, maxlen,
+                                                  'perf_events')
         self.heartbeat_event_queue = collections.deque(maxlen=1)
 
+    def _compactJournals(self):
+        # queues being sent are not part of the snapshot
+        if self._sending:
+            return
+        for name, attr in self.JOURNALED_QUEUES:
+            journal = self._journals.get(name)
+            if journal is not None and journal.shouldCompact():
+                queue = getattr(self, attr)
+                journal.compact([(queue.generation, list(queue))])
+
+    def sync(self):
+        """
+        Write the journaled events to disk.
+        """
+        for journal in self._journals.itervalues():
+            journal.sync()
+
+    def close(self):
+        for journal in self._journals.itervalues():
+            journal.close()
+
     def _transformEvent(self, event):
         for transformer in self.transformers:
             result = transformer.transform(event)
@@ -460,6 +643,8 @@ class EventQueueManager(object):
             self.log.debug("Discarded event - queue overflow: %r", discarded)
             self._removeDiscardedEventFromClearState(discarded)
             self.discarded_events += 1
+        if self._journals:
+            self._compactJournals()
 
     def addEvent(self, event):
         self._addEvent(self.event_queue, event)
@@ -470,6 +655,17 @@ class EventQueueManager(object):
     def addHeartbeatEvent(self, heartbeat_event):
         self.heartbeat_event_queue.append(heartbeat_event)
 
+    def _drain(self, queue):
+        # popping the events remembers their fingerprints
+        events = []
+        while len(queue):
+            events.append(queue.popleft())
+        return events
+
+    def _acknowledge(self, queue, count):
+        if isinstance(queue, PersistentEventQueue):
+            queue.acknowledge(count)
+
     @defer.inlineCallbacks
     def sendEvents(self, event_sender_fn):
         # Create new queues - we will flush the current queues and don't want to
@@ -479,6 +675,7 @@ class EventQueueManager(object):
         prev_perf_event_queue = self.perf_event_queue
         prev_event_queue = self.event_queue
         self._initQueues()
+        self._sending = True
 
         perf_events = []
         events = []
@@ -511,16 +708,18 @@ class EventQueueManager(object):
                     "Sending %d events, %d perf events, %d heartbeats",
                     len(events), len(perf_events), len(heartbeat_events))
                 yield event_sender_fn(heartbeat_events + perf_events + events)
+                self._acknowledge(prev_perf_event_queue, len(perf_events))
+                self._acknowledge(prev_event_queue, len(events))
                 heartbeat_events, perf_events, events = chunk_events()
 
         except Exception:
             # Restore performance events that failed to send
-            perf_events.extend(prev_perf_event_queue)
+            perf_events.extend(self._drain(prev_perf_event_queue))
             discarded_perf_events = self.perf_event_queue.extendleft(perf_events)
             self.discarded_events += len(discarded_perf_events)
 
             # Restore events that failed to send
-            events.extend(prev_event_queue)
+            events.extend(self._drain(prev_event_queue))
             discarded_events = self.event_queue.extendleft(events)
             self.discarded_events += len(discarded_events)
 
@@ -530,6 +729,15 @@ class EventQueueManager(object):
                                discarded)
                 self._removeDiscardedEventFromClearState(discarded)
             raise
+        finally:
+            self._sending = False
+            for popped in self._popped_fingerprints.itervalues():
+                popped.clear()
+            # events left in the previous queues have been put back
+            for queue in (prev_perf_event_queue, prev_event_queue):
+                if isinstance(queue, PersistentEventQueue):
+                    queue.retire()
+            self._compactJournals()
 
     @property
     def event_queue_length(self):
@@ -568,7 +776,16 @@ class PBDaemon(ZenDaemon, pb.Referenceable):
         self.lastStats = 0
         self.perspective = None
         self.services = {}
-        self.eventQueueManager = EventQueueManager(self.options, self.log)
+        journalPath = None
+        if self.options.persistentEventQueue:
+            # same-named daemons of other collectors may share the host
+            name = '%s-events' % self.options.monitor
+            workerId = getattr(self.options, 'workerid', 0)
+            if workerId:
+                name = '%s-%s' % (name, workerId)
+            journalPath = zenPath('var', self.name, name)
+        self.eventQueueManager = EventQueueManager(self.options, self.log,
+                                                   journalPath)
         self.startEvent = startEvent.copy()
         self.stopEvent = stopEvent.copy()
         details = dict(component=self.name, device=self.options.monitor)
@@ -602,9 +819,20 @@ class PBDaemon(ZenDaemon, pb.Referenceable):
                                    "value {port}, defaulting to {default}".
                                    format(port=port, default=publisher.defaultRedisPort))
                 port = publisher.defaultRedisPort
+            spillFile = None
+            if self.options.metricSpillSize > 0:
+                name = '%s-metrics' % self.options.monitor
+                workerId = getattr(self.options, 'workerid', 0)
+                if workerId:
+                    name = '%s-%s' % (name, workerId)
+                spillFile = zenPath('var', self.name, '%s.spill' % name)
             self._publisher = publisher.RedisListPublisher(
                 host, port, self.options.metricBufferSize,
-                channel=self.options.metricsChannel, maxOutstandingMetrics=self.options.maxOutstandingMetrics
+                channel=self.options.metricsChannel, maxOutstandingMetrics=self.options.maxOutstandingMetrics,
+                spillFile=spillFile,
+                maxSpillBytes=self.options.metricSpillSize * 1024 * 1024,
+                maxConcurrentFlushes=self.options.metricFlushConcurrency,
+                encoding=self.options.metricEncoding
             )
         return self._publisher
 
@@ -841,10 +1069,12 @@ class PBDaemon(ZenDaemon, pb.Referenceable):
             else:
                 d = self.pushEvents()
             d.addBoth(lambda unused: self.saveCounters())
+            d.addBoth(lambda unused: self.eventQueueManager.close())
             return d
 
         self.log.debug("No event sent as no EventService available.")
         self.saveCounters()
+        self.eventQueueManager.close()
 
     def sendEvents(self, events):
         map(self.sendEvent, events)
@@ -883,6 +1113,7 @@ class PBDaemon(ZenDaemon, pb.Referenceable):
         """
         reactor.callLater(self.options.eventflushseconds, self.pushEventsLoop)
         yield self.pushEvents()
+        self.eventQueueManager.sync()
    
         # Record the number of events in the queue up to every 2 seconds.
         now = time.time()
@@ -917,8 +1148,8 @@ class PBDaemon(ZenDaemon, pb.Referenceable):
                     'Discarded oldest %d events because maxqueuelen was '
                     'exceeded: %d/%d',
                     discarded_events,
-                    discarded_events + self.options.maxqueuelen,
-                    self.options.maxqueuelen)
+                    discarded_events + self.eventQueueManager.maxqueuelen,
+                    self.eventQueueManager.maxqueuelen)
                 self.counters['discardedEvents'] += discarded_events
                 self.eventQueueManager.discarded_events = 0
 
@@ -1110,6 +1341,27 @@ class PBDaemon(ZenDaemon, pb.Referenceable):
                                type='int',
                                help='Maximum number of events to queue')
 
+        self.parser.add_option('--persistent-event-queue',
+                               dest='persistentEventQueue',
+                               default=False,
+                               action='store_true',
+                               help='Journal queued events on disk, so that '
+                               'they are sent after a restart of the daemon')
+
+        self.parser.add_option('--maxpersistentqueuelen',
+                               dest='maxpersistentqueuelen',
+                               default=100000,
+                               type='int',
+                               help='Maximum number of events to queue with '
+                               '--persistent-event-queue')
+
+        self.parser.add_option('--eventqueuesyncseconds',
+                               dest='eventQueueSyncSeconds',
+                               default=1.,
+                               type='float',
+                               help='Most seconds between writes of the '
+                               'journaled events to disk')
+
         self.parser.add_option('--zenhubpinginterval',
                                dest='zhPingInterval',
                                default=120,
@@ -1142,7 +1394,33 @@ class PBDaemon(ZenDaemon, pb.Referenceable):
                                dest='maxOutstandingMetrics',
                                type='int',
                                default=publisher.defaultMaxOutstandingMetrics,
-                               help='Max Number of metrics to allow in redis')
+                               help='Max Number of metrics to allow in redis. '
+                                    'With the compact encoding redis keeps '
+                                    'only as many batches as hold this many '
+                                    'metrics when full (65536 metrics each)')
+        self.parser.add_option('--metricSpillSize',
+                               dest='metricSpillSize',
+                               type='int',
+                               default=publisher.defaultMetricSpillSize,
+                               help='Megabytes of metrics to spill to disk once '
+                                    'metricBufferSize metrics are buffered, '
+                                    '0 to drop them instead, default: %default')
+        self.parser.add_option('--metricEncoding',
+                               dest='metricEncoding',
+                               type='choice',
+                               choices=[publisher.JSON_ENCODING,
+                                        publisher.COMPACT_ENCODING],
+                               default=publisher.defaultMetricEncoding,
+                               help='Encoding of the metrics published to redis: '
+                                    'one JSON document per metric, or compact '
+                                    'binary batches (the consumer must support '
+                                    'them), default: %default')
+        self.parser.add_option('--metricFlushConcurrency',
+                               dest='metricFlushConcurrency',
+                               type='int',
+                               default=publisher.defaultMaxConcurrentFlushes,
+                               help='Number of metric batches to send to redis '
+                                    'without waiting for replies, default: %default')
         self.parser.add_option('--disable-ping-perspective',
                                dest='pingPerspective',
                                help="Enable or disable ping perspective",
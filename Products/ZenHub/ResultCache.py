@@ -0,0 +1,149 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__ = """ResultCache
+
+Results of the remote method calls zenhub hands to its workers, reused
+until the model objects they were built from change.
+"""
+
+import collections
+
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+DEFAULT_MAX_ENTRIES = 100
+
+
+class ResultCache(object):
+    """
+    Results of the remote method calls of a hub service, by method and
+    serialized arguments.
+
+    Each result records the ids of the devices it was built from, or None
+    when it was built from all the devices of the collector; the service
+    drops the results as it is notified of changes to the model.  Every
+    invalidation increments the serial of the cache: a result is only
+    stored if no invalidation happened while it was computed.  Identical
+    calls arriving while a result is computed wait for that result.
+
+    @param maxEntries: most results kept; 0 disables the cache
+    @type maxEntries: int
+    """
+
+    def __init__(self, maxEntries=DEFAULT_MAX_ENTRIES):
+        self.maxEntries = maxEntries
+        self.serial = 0
+        self.hits = 0
+        self.misses = 0
+        # key -> (devices, result), least recently used first
+        self._entries = collections.OrderedDict()
+        # device id -> keys of the results built from the device
+        self._byDevice = {}
+        # keys of the results built from all the devices
+        self._allDevices = set()
+        # key -> (serial, deferreds waiting for the result being computed)
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def call(self, key, devices, fetch):
+        """
+        Return the result of a call, computing it if it is not cached.
+
+        @param key: method and serialized arguments of the call
+        @type key: hashable
+        @param devices: ids of the devices the result is built from, None
+            for all the devices of the collector
+        @type devices: frozenset
+        @param fetch: computes the result, returning a Deferred
+        @type fetch: callable
+        @return: a Deferred firing with the result
+        @rtype: Deferred
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._entries[key] = entry
+            self.hits += 1
+            return defer.succeed(entry[1])
+        pending = self._pending.get(key)
+        if pending is not None and pending[0] == self.serial:
+            self.hits += 1
+            d = defer.Deferred()
+            pending[1].append(d)
+            return d
+        self.misses += 1
+        pending = self._pending[key] = (self.serial, [])
+
+        def computed(result):
+            if self._pending.get(key) is pending:
+                del self._pending[key]
+            if not isinstance(result, Failure) and pending[0] == self.serial:
+                self._store(key, devices, result)
+            for d in pending[1]:
+                if isinstance(result, Failure):
+                    d.errback(result)
+                else:
+                    d.callback(result)
+            return result
+
+        return fetch().addBoth(computed)
+
+    def _store(self, key, devices, result):
+        if self.maxEntries <= 0:
+            return
+        while len(self._entries) >= self.maxEntries:
+            self._drop(next(iter(self._entries)))
+        self._entries[key] = (devices, result)
+        if devices is None:
+            self._allDevices.add(key)
+        else:
+            for device in devices:
+                self._byDevice.setdefault(device, set()).add(key)
+
+    def _drop(self, key):
+        devices, result = self._entries.pop(key)
+        if devices is None:
+            self._allDevices.discard(key)
+            return
+        for device in devices:
+            keys = self._byDevice.get(device)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._byDevice[device]
+
+    def invalidate(self):
+        """
+        Drop all the results.
+        """
+        self.serial += 1
+        self._entries.clear()
+        self._byDevice.clear()
+        self._allDevices.clear()
+
+    def invalidateDevice(self, deviceId, collectorDevice=True):
+        """
+        Drop the results built from a device.
+
+        @param deviceId: id of the device
+        @type deviceId: string
+        @param collectorDevice: whether the device is, or was until lately,
+            monitored by the collector, so that the results built from all
+            the devices of the collector are dropped as well
+        @type collectorDevice: boolean
+        """
+        self.serial += 1
+        keys = set(self._byDevice.get(deviceId, ()))
+        if collectorDevice:
+            keys.update(self._allDevices)
+        for key in keys:
+            self._drop(key)
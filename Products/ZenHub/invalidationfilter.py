@@ -9,9 +9,12 @@
 
 
 import re
+import cPickle as pickle
 from hashlib import md5
 import logging
 from cStringIO import StringIO
+from Acquisition import aq_base, aq_parent
+from ZODB.utils import z64
 from zope.interface import implements
 from Products.ZenModel.DeviceClass import DeviceClass
 from Products.ZenModel.IpAddress import IpAddress
@@ -22,6 +25,7 @@ from Products.ZenModel.GraphDefinition import GraphDefinition
 from Products.ZenModel.GraphPoint import GraphPoint
 from Products.ZenModel.ProductClass import ProductClass
 from Products.ZenModel.Software import Software
+from Products.ZenUtils.Utils import zenPath, atomicWrite
 from Products.Zuul.interfaces import ICatalogTool
 
 from .interfaces import IInvalidationFilter, FILTER_EXCLUDE, FILTER_CONTINUE
@@ -55,6 +59,75 @@ class IgnorableClassesFilter(object):
         return FILTER_CONTINUE
 
 
+class _UncommittedChanges(Exception):
+    pass
+
+
+def _serial(obj):
+    """
+    Return the serial (transaction id of the last change) of a persistent
+    object, loading it first if it is a ghost.
+
+    @raise _UncommittedChanges: the object has changes that are not committed
+    """
+    obj = aq_base(obj)
+    obj._p_activate()
+    if obj._p_changed or obj._p_serial == z64:
+        raise _UncommittedChanges()
+    return obj._p_serial
+
+
+class OrganizerChecksumStore(object):
+    """
+    On-disk store of organizer checksums keyed by organizer path.  Each
+    checksum is saved with the state it was computed from (the serials of
+    the persistent objects it depends on) and is only reused while that
+    state is unchanged.
+    """
+
+    # bump when the checksum algorithm changes
+    VERSION = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._saved = {}
+        self._current = {}
+
+    def load(self):
+        try:
+            with open(self.filename, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') == self.VERSION:
+                self._saved = data['checksums']
+        except IOError:
+            pass
+        except Exception:
+            log.warn("Unable to read organizer checksums from %s", self.filename)
+        self._current = {}
+
+    def get(self, path, state):
+        """
+        Return the saved checksum of path if it was computed from state.
+        """
+        entry = self._saved.get(path)
+        if entry is not None and entry[0] == state:
+            self._current[path] = entry
+            return entry[1]
+
+    def set(self, path, state, checksum):
+        self._current[path] = (state, checksum)
+
+    def save(self):
+        """
+        Write the checksums set or reused since the last load.
+        """
+        data = pickle.dumps({'version': self.VERSION,
+                             'checksums': self._current},
+                            pickle.HIGHEST_PROTOCOL)
+        atomicWrite(self.filename, data, raiseException=False, createDir=True)
+        self._saved, self._current = self._current, {}
+
+
 class BaseOrganizerFilter(object):
     """
     Base invalidation filter for organizers. Calculates a checksum for
@@ -71,18 +144,54 @@ class BaseOrganizerFilter(object):
     def getRoot(self, context):
         return context.dmd.primaryAq()
 
+    def checksumFile(self):
+        return zenPath('var', 'zenhub', '%s.checksums' % self.__class__.__name__)
+
     def initialize(self, context):
         root = self.getRoot(context)
+        store = OrganizerChecksumStore(self.checksumFile())
+        store.load()
         brains = ICatalogTool(root).search(self._types)
         results = {}
+        reused = 0
         for brain in brains:
+            path = brain.getPath()
             try:
                 obj = brain.getObject()
-                results[brain.getPath()] = self.organizerChecksum(obj)
+                try:
+                    state = self.organizerState(obj, root)
+                except _UncommittedChanges:
+                    state = None
+                checksum = store.get(path, state) if state else None
+                if checksum is None:
+                    checksum = self.organizerChecksum(obj)
+                    if state:
+                        store.set(path, state, checksum)
+                else:
+                    reused += 1
+                results[path] = checksum
             except KeyError:
-                log.warn("Unable to retrieve object: %s", brain.getPath())
+                log.warn("Unable to retrieve object: %s", path)
+        store.save()
+        log.debug("%s: reused %d of %d organizer checksums",
+                  self.__class__.__name__, reused, len(results))
         self.checksum_map = results
 
+    def organizerState(self, organizer, root):
+        """
+        Return the serials of the organizer and of the organizers it
+        acquires z properties from, up to and including root.
+        """
+        state = []
+        obj = organizer
+        rootBase = aq_base(root)
+        while obj is not None:
+            state.append(_serial(obj))
+            if aq_base(obj) is rootBase:
+                break
+            obj = aq_parent(obj)
+        return tuple(state)
+
     def getZorCProperties(self, organizer):
         for zId in sorted(organizer.zenPropertyIds(pfilt=self.iszorcustprop)):
             try:
@@ -138,6 +247,28 @@ class DeviceClassInvalidationFilter(BaseOrganizerFilter):
     def getRoot(self, context):
         return context.dmd.Devices.primaryAq()
 
+    def _templateState(self, obj):
+        # ids and serials of everything contained in a template
+        state = []
+        if not hasattr(aq_base(obj), 'getRelationships'):
+            return ()
+        for rel in obj.getRelationships():
+            if rel.meta_type != 'ToManyContRelationship':
+                continue
+            for child in rel.objectValues():
+                state.append((child.id, _serial(child), self._templateState(child)))
+        return tuple(state)
+
+    def organizerState(self, organizer, root):
+        """
+        Include the locally bound templates and their contents, which
+        change without the device class itself changing.
+        """
+        state = super(DeviceClassInvalidationFilter, self).organizerState(organizer, root)
+        templates = tuple((tpl.id, _serial(tpl), self._templateState(tpl))
+                          for tpl in organizer.rrdTemplates())
+        return state + (templates,)
+
     def generateChecksum(self, organizer, md5_checksum):
         """
         Generate a checksum representing the state of the device class as it
@@ -0,0 +1,170 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Compact binary encoding of a batch of metrics.
+
+Metric names and tag sets repeat across a batch, so each is written once
+and metrics refer to them by index.  All numbers are big-endian.
+
+    header      magic 'ZMB', version (B), flags (B),
+                number of tag sets, names and metrics (I, I, I)
+    tag sets    for each: length (I) and JSON encoded tags
+    names       for each: length (I) and UTF-8 encoded name
+    metrics     tag set indices (I * n), name indices (I * n),
+                timestamps (q * n, or d * n with FLAG_FLOAT_TIMESTAMPS),
+                values (d * n, NaN for a missing value)
+
+decode() is the reference reader of the format.
+"""
+
+import struct
+
+from .compat import json
+
+MAGIC = 'ZMB'
+VERSION = 1
+CONTENT_TYPE = 'application/x-zenoss-metrics'
+
+# timestamps are float64 rather than int64
+FLAG_FLOAT_TIMESTAMPS = 0x01
+
+_HEADER = struct.Struct('!3sBBIII')
+_LENGTH = struct.Struct('!I')
+_NAN = float('nan')
+
+
+def encode(metrics):
+    """
+    Encode a batch of metrics.
+
+    @param metrics: (metric, value, timestamp, tags) tuples; value is a
+        float or None
+    @type metrics: sequence
+    @return: the encoded batch
+    @rtype: string
+    """
+    tagIndex = {}
+    tagSets = []
+    nameIndex = {}
+    names = []
+    tagRefs = []
+    nameRefs = []
+    timestamps = []
+    values = []
+    flags = 0
+    for metric, value, timestamp, tags in metrics:
+        key = tuple(sorted(tags.iteritems())) if tags else ()
+        ref = tagIndex.get(key)
+        if ref is None:
+            ref = tagIndex[key] = len(tagSets)
+            tagSets.append(json.dumps(tags or {}))
+        tagRefs.append(ref)
+        ref = nameIndex.get(metric)
+        if ref is None:
+            ref = nameIndex[metric] = len(names)
+            names.append(metric.encode('utf-8') if isinstance(metric, unicode) else metric)
+        nameRefs.append(ref)
+        if isinstance(timestamp, float):
+            flags |= FLAG_FLOAT_TIMESTAMPS
+        timestamps.append(timestamp)
+        values.append(_NAN if value is None else value)
+
+    n = len(values)
+    chunks = [_HEADER.pack(MAGIC, VERSION, flags, len(tagSets), len(names), n)]
+    for s in tagSets:
+        if isinstance(s, unicode):
+            s = s.encode('utf-8')
+        chunks.append(_LENGTH.pack(len(s)))
+        chunks.append(s)
+    for s in names:
+        chunks.append(_LENGTH.pack(len(s)))
+        chunks.append(s)
+    chunks.append(struct.pack('!%dI' % n, *tagRefs))
+    chunks.append(struct.pack('!%dI' % n, *nameRefs))
+    if flags & FLAG_FLOAT_TIMESTAMPS:
+        chunks.append(struct.pack('!%dd' % n, *timestamps))
+    else:
+        chunks.append(struct.pack('!%dq' % n, *timestamps))
+    chunks.append(struct.pack('!%dd' % n, *values))
+    return ''.join(chunks)
+
+
+def encodeValid(metrics):
+    """
+    Encode a batch of metrics, leaving out the metrics that cannot be
+    encoded (e.g. with a tag value that is not hashable or a timestamp that
+    is not a number).
+
+    @param metrics: metrics, as passed to encode
+    @type metrics: sequence
+    @return: the encoded batch, the metrics encoded and the metrics left out
+    @rtype: tuple
+    """
+    try:
+        return encode(metrics), metrics, []
+    except Exception:
+        pass
+    valid = []
+    invalid = []
+    for metric in metrics:
+        try:
+            encode((metric,))
+        except Exception:
+            invalid.append(metric)
+        else:
+            valid.append(metric)
+    return encode(valid), valid, invalid
+
+
+def _strings(data, offset, count):
+    strings = []
+    for i in xrange(count):
+        length, = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        strings.append(data[offset:offset + length])
+        offset += length
+    return strings, offset
+
+
+def decode(data):
+    """
+    Decode a batch of metrics.
+
+    @param data: a batch returned by encode
+    @type data: string
+    @return: the metrics, as dictionaries with the metric, value,
+        timestamp and tags of each; metrics with the same tags share the
+        tags dictionary
+    @rtype: list
+    """
+    magic, version, flags, tagCount, nameCount, n = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a compact metric batch")
+    if version != VERSION:
+        raise ValueError("Unsupported compact metric batch version %d" % version)
+    offset = _HEADER.size
+    tagSets, offset = _strings(data, offset, tagCount)
+    tagSets = [json.loads(s) for s in tagSets]
+    names, offset = _strings(data, offset, nameCount)
+    names = [s.decode('utf-8') for s in names]
+
+    def array(code):
+        fmt = struct.Struct('!%d%s' % (n, code))
+        return fmt.unpack_from(data, offset), offset + fmt.size
+
+    tagRefs, offset = array('I')
+    nameRefs, offset = array('I')
+    timestamps, offset = array('d' if flags & FLAG_FLOAT_TIMESTAMPS else 'q')
+    values, offset = array('d')
+    return [{"metric": names[nameRefs[i]],
+             "value": None if values[i] != values[i] else values[i],
+             "timestamp": timestamps[i],
+             "tags": tagSets[tagRefs[i]]}
+            for i in xrange(n)]
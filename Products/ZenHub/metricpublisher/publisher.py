@@ -8,14 +8,16 @@
 ##############################################################################
 
 import logging
+import marshal
 import sys
 import os
 
 log = logging.getLogger("zen.publisher")
 
 from .utils import basic_auth_string_content, sanitized_float
+from .spillqueue import SpillQueue
+from . import compact
 from cookielib import CookieJar
-from collections import deque
 from twisted.internet import defer, protocol, reactor
 from twisted.web.client import Agent, CookieAgent
 from twisted.web.iweb import IBodyProducer
@@ -34,6 +36,15 @@ defaultMetricBufferSize = 65536
 defaultPublishFrequency = 1.0
 defaultRedisPort = 6379
 defaultMaxOutstandingMetrics = 864000000
+defaultMaxSpillBytes = 0
+# megabytes of metrics daemons spill to disk
+defaultMetricSpillSize = 100
+defaultMaxConcurrentFlushes = 4
+
+# metric encodings
+JSON_ENCODING = 'json'
+COMPACT_ENCODING = 'compact'
+defaultMetricEncoding = JSON_ENCODING
 
 bufferHighWater = 4096
 HTTP_BATCH = 100
@@ -45,20 +56,65 @@ class BasePublisher(object):
     Publish metrics to redis
     """
 
-    def __init__(self, buflen, pubfreq):
+    def __init__(self, buflen, pubfreq, spillFile=None, maxSpillBytes=0,
+                 encoding=defaultMetricEncoding):
+        if encoding not in (JSON_ENCODING, COMPACT_ENCODING):
+            raise ValueError("Unknown metric encoding %s" % encoding)
         self._buflen = buflen
         self._pubfreq = pubfreq
         self._pubtask = None
-        self._mq = deque(maxlen=buflen)
+        self._encoding = encoding
+        if encoding == COMPACT_ENCODING:
+            # metrics are queued as tuples and encoded a batch at a time
+            self._mq = SpillQueue(buflen, spillFile, maxSpillBytes,
+                                  marshal.dumps, marshal.loads)
+        else:
+            self._mq = SpillQueue(buflen, spillFile, maxSpillBytes)
+
+    @property
+    def queueLength(self):
+        """
+        The number of metrics waiting to be published
+        """
+        return len(self._mq)
+
+    @property
+    def spillBytes(self):
+        """
+        The size of the metrics waiting in the spill file
+        """
+        return self._mq.spillBytes
+
+    @property
+    def droppedMetrics(self):
+        """
+        The number of metrics dropped because the buffer was full
+        """
+        return self._mq.dropped
 
     def build_metric(self, metric, value, timestamp, tags):
         # guarantee value's a float
         _value = sanitized_float(value)
+        if self._encoding == COMPACT_ENCODING:
+            return (metric, _value, timestamp, tags)
         return {"metric": metric,
                 "value": _value,
                 "timestamp": timestamp,
                 "tags": tags}
 
+    def _encodeCompact(self, metrics):
+        """
+        Encode a batch of metrics, dropping the metrics that cannot be
+        encoded rather than failing, and requeuing, the whole batch.
+
+        @return: the encoded batch and the metrics encoded
+        """
+        data, valid, invalid = compact.encodeValid(metrics)
+        if invalid:
+            log.warning("Dropping %d metrics that cannot be encoded, e.g. %r",
+                        len(invalid), invalid[0])
+        return data, valid
+
     def _publish_failed(self, reason, metrics):
         """
         Push as many of the unpublished metrics as possible back into the
@@ -71,8 +127,7 @@ class BasePublisher(object):
         """
         log.info('publishing failed: %s', getattr(reason, 'getErrorMessage', reason.__str__)())
 
-        open_slots = self._mq.maxlen - len(self._mq)
-        self._mq.extendleft(reversed(metrics[-open_slots:]))
+        self._mq.extendleft(reversed(metrics))
 
         return len(self._mq)
 
@@ -119,6 +174,31 @@ class BasePublisher(object):
         else:
             return self._put(False)
 
+    def put_many(self, metrics):
+        """
+        Queue many metrics at once.  Every metric is built before any of
+        them is queued, so the buffer is extended in one step.
+
+        @param metrics: (metric, value, timestamp, tags) tuples, as passed
+        to put
+        @return: a deferred that will return the number of metrics still
+        in the buffer when fired
+        """
+        if not self._pubtask:
+            self._pubtask = reactor.callLater(self._pubfreq, self._put, True)
+
+        build_metric = self.build_metric
+        mvs = [build_metric(*m) for m in metrics]
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("writing %d metrics", len(mvs))
+
+        self._mq.extend(mvs)
+
+        if len(self._mq) < bufferHighWater:
+            return defer.succeed(len(self._mq))
+        else:
+            return self._put(False)
+
 
 class RedisListPublisher(BasePublisher):
     """
@@ -131,15 +211,33 @@ class RedisListPublisher(BasePublisher):
                  buflen=defaultMetricBufferSize,
                  pubfreq=defaultPublishFrequency,
                  channel=defaultMetricsChannel,
-                 maxOutstandingMetrics=defaultMetricBufferSize):
-        super(RedisListPublisher, self).__init__(buflen, pubfreq)
+                 maxOutstandingMetrics=defaultMetricBufferSize,
+                 spillFile=None,
+                 maxSpillBytes=defaultMaxSpillBytes,
+                 maxConcurrentFlushes=defaultMaxConcurrentFlushes,
+                 encoding=defaultMetricEncoding):
+        super(RedisListPublisher, self).__init__(buflen, pubfreq,
+                                                 spillFile, maxSpillBytes,
+                                                 encoding)
         self._batch_size = INITIAL_REDIS_BATCH
         self._host = host
         self._port = port
         self._channel = channel
         self._maxOutstandingMetrics = maxOutstandingMetrics
+        # a batch holds no more metrics than redis is allowed to
+        self._maxBatchSize = max(INITIAL_REDIS_BATCH,
+                                 min(defaultMetricBufferSize, maxOutstandingMetrics))
+        if encoding == COMPACT_ENCODING:
+            # each list element is a whole batch; keep only as many batches
+            # as can hold maxOutstandingMetrics metrics when full
+            self._maxOutstandingElements = max(
+                1, maxOutstandingMetrics // self._maxBatchSize)
+        else:
+            self._maxOutstandingElements = maxOutstandingMetrics
         self._redis = RedisClientFactory()
-        self._flushing = False
+        # number of batches sent to redis and not yet acknowledged
+        self._flushing = 0
+        self._maxConcurrentFlushes = maxConcurrentFlushes
         self._connection = reactor.connectTCP(self._host,
                                               self._port,
                                               self._redis)
@@ -150,6 +248,8 @@ class RedisListPublisher(BasePublisher):
         Override base method to work with strings instead of dicts
         """
         m = BasePublisher.build_metric(self, metric, value, timestamp, tags)
+        if self._encoding == COMPACT_ENCODING:
+            return m
         try:
             return json.dumps(m)
         except (OverflowError, ValueError):
@@ -168,18 +268,19 @@ class RedisListPublisher(BasePublisher):
         """
         log.debug('published %d metrics to redis', metricCount)
         if metricCount >= self._batch_size:
-            # Batch size starts at 2, and doubles on every success, up to 2**16.
+            # Batch size starts at 2, and doubles on every success, up to 2**16
+            # (or maxOutstandingMetrics).
             # On failure, it drops to 2 again to allow redis to recover.
-            self._batch_size = min(2 * self._batch_size,
-                                   defaultMetricBufferSize)
+            self._batch_size = min(2 * self._batch_size, self._maxBatchSize)
 
-        if remaining:
+        if remaining and not self._flushing:
             reactor.callLater(0, self._put, False, False)
         return 0
 
     def _get_batch_size(self):
         """
-        Batch size starts at 2, and doubles on every success, up to 2**16.
+        Batch size starts at 2, and doubles on every success, up to 2**16
+        (or maxOutstandingMetrics).
         On failure, it drops to 2 again to allow redis to recover.
         """
         return self._batch_size
@@ -195,54 +296,62 @@ class RedisListPublisher(BasePublisher):
         if len(self._mq) == 0:
             return defer.succeed(0)
 
-        if self._flushing:
-            #still flushing keep queuing up metrics
-            log.debug("metric flush to redis in progress, skipping _put")
+        if self._flushing >= self._maxConcurrentFlushes:
+            # enough batches in flight; keep queuing up metrics
+            log.debug("%d metric flushes to redis in progress, skipping _put",
+                      self._flushing)
             return defer.succeed(len(self._mq))
 
         if self._connection.state == 'connected':
             log.debug('trying to publish %d metrics', len(self._mq))
 
-            metrics = []
-            for x in xrange(self._get_batch_size()):
-                if not self._mq:
+            # Pipeline batches: redis applies the commands of a connection
+            # in order, so the batches reach the list in queue order.
+            flushes = []
+            while self._mq and self._flushing < self._maxConcurrentFlushes:
+                metrics = []
+                for x in xrange(self._get_batch_size()):
+                    if not self._mq:
+                        break
+                    metrics.append(self._mq.popleft())
+                flushes.append(self._flush(metrics))
+                if self._batch_size == INITIAL_REDIS_BATCH:
+                    # still probing whether redis has recovered
                     break
-                metrics.append(self._mq.popleft())
-            if not metrics:
+            if not flushes:
                 return defer.succeed(None)
-
-            @defer.inlineCallbacks
-            def _flush(metrics):
-                if self._flushing:
-                    #this should never really happen, but here as a safety
-                    log.debug("rescheduling _flush")
-                    num = yield reactor.deferLater(0.25, _flush, metrics)
-                    defer.returnValue(num)
-                log.debug("flushing %s metrics, current batch size %s", len(metrics), self._batch_size)
-                client = self._redis.client
-                try:
-                    self._flushing = True
-                    yield client.multi()
-                    yield client.lpush(self._channel, *metrics)
-                    yield client.ltrim(self._channel, 0, self._maxOutstandingMetrics - 1)
-                    result, _ = yield client.execute()
-                    yield self._metrics_published(
-                        result, metricCount=len(metrics),
-                        remaining=len(self._mq))
-                    defer.returnValue(len(self._mq))
-                except Exception as e:
-                    # since we may be in a mutli redis command state, attempt to discard it
-                    try:
-                        yield client.discard()
-                    except Exception:
-                        pass
-                    # Drop the batch size so it will ramp itself up again
-                    self._batch_size = INITIAL_REDIS_BATCH
-                    self._publish_failed(e, metrics=metrics)
-                finally:
-                    self._flushing = False
-
-            return _flush(metrics)
+            d = defer.gatherResults(flushes)
+            d.addCallback(lambda ignored: len(self._mq))
+            return d
+
+    @defer.inlineCallbacks
+    def _flush(self, metrics):
+        log.debug("flushing %s metrics, current batch size %s", len(metrics), self._batch_size)
+        client = self._redis.client
+        if self._encoding == COMPACT_ENCODING:
+            batch, metrics = self._encodeCompact(metrics)
+            if not metrics:
+                defer.returnValue(len(self._mq))
+        try:
+            self._flushing += 1
+            if self._encoding == COMPACT_ENCODING:
+                # the whole batch is a single list element
+                pushed = client.lpush(self._channel, batch)
+            else:
+                pushed = client.lpush(self._channel, *metrics)
+            trimmed = client.ltrim(self._channel, 0, self._maxOutstandingElements - 1)
+            result = yield pushed
+            yield trimmed
+            self._flushing -= 1
+            yield self._metrics_published(
+                result, metricCount=len(metrics),
+                remaining=len(self._mq))
+        except Exception as e:
+            self._flushing -= 1
+            # Drop the batch size so it will ramp itself up again
+            self._batch_size = INITIAL_REDIS_BATCH
+            self._publish_failed(e, metrics=metrics)
+        defer.returnValue(len(self._mq))
 
     def _shutdown(self):
         def disconnect(c):
@@ -252,6 +361,7 @@ class RedisListPublisher(BasePublisher):
             log.debug('shutting down [disconnected]')
 
         log.debug('shutting down')
+        self._mq.flush()
         if self._connection.state != 'connected':
             log.debug('shutting down [not connected: %s]',
                       self._connection.state)
@@ -277,8 +387,10 @@ class HttpPostPublisher(BasePublisher):
                  password,
                  url='https://localhost:8443/api/metrics/store',
                  buflen=defaultMetricBufferSize,
-                 pubfreq=defaultPublishFrequency):
-        super(HttpPostPublisher, self).__init__(buflen, pubfreq)
+                 pubfreq=defaultPublishFrequency,
+                 encoding=defaultMetricEncoding):
+        super(HttpPostPublisher, self).__init__(buflen, pubfreq,
+                                                encoding=encoding)
         self._username = username
         self._password = password
         self._needsAuth = False
@@ -334,12 +446,19 @@ class HttpPostPublisher(BasePublisher):
         if not metrics:
             return defer.succeed(None)
 
-        serialized_metrics = json.dumps({"metrics": metrics})
+        if self._encoding == COMPACT_ENCODING:
+            serialized_metrics, metrics = self._encodeCompact(metrics)
+            if not metrics:
+                return defer.succeed(None)
+            content_type = compact.CONTENT_TYPE
+        else:
+            serialized_metrics = json.dumps({"metrics": metrics})
+            content_type = 'application/json'
         body_writer = StringProducer(serialized_metrics)
 
         headers = Headers({
             'User-Agent': ['Zenoss Metric Publisher: %s' % self._agent_suffix],
-            'Content-Type': ['application/json']})
+            'Content-Type': [content_type]})
 
         if self._needsAuth and not self._authenticated:
             log.info("Adding auth for metric http post %s", self._url)
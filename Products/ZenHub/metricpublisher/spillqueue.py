@@ -0,0 +1,263 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+"""
+Bounded metric queue that spills to disk.
+
+Up to maxlen metrics are held in memory.  Once memory is full, newer
+metrics are appended to a spill file until the metrics spilled and not yet
+read back reach its size limit, and are read back (through a memory map) in
+the order they were queued as the memory queue drains.  Once more of the
+file has been read than is left to read, the unread metrics are moved to
+the start of the file.  The spill file remembers how far it has been read,
+so metrics still spilled when the daemon stops are published after a
+restart.
+"""
+
+import os
+import mmap
+import struct
+import logging
+from collections import deque
+from itertools import islice
+
+log = logging.getLogger("zen.publisher")
+
+_MAGIC = 'ZMSQ\x01\x00\x00\x00'
+# magic, offset of the first unread record
+_HEADER = struct.Struct('!8sQ')
+# length of the record data
+_RECORD = struct.Struct('!I')
+# bytes copied at a time when compacting the spill file
+_COPY_BYTES = 1024 * 1024
+
+
+class SpillQueue(object):
+    """
+    FIFO queue of metrics.  Without a spill file it behaves like a deque
+    with a maxlen: the oldest metrics are dropped when it is full.  With a
+    spill file, metrics must be strings (or be serialized by dumps and
+    loads), and the newest metrics are dropped when the file is full.
+
+    @param maxlen: number of metrics held in memory
+    @type maxlen: int
+    @param filename: path of the spill file, or None to never spill
+    @type filename: string
+    @param maxSpillBytes: most bytes of metrics spilled and not yet read
+        back
+    @type maxSpillBytes: int
+    @param dumps: converts a metric to the string spilled to the file
+    @type dumps: callable
+    @param loads: converts a spilled string back to a metric
+    @type loads: callable
+    """
+
+    def __init__(self, maxlen, filename=None, maxSpillBytes=0,
+                 dumps=None, loads=None):
+        self._memory = deque()
+        self._dumps = dumps
+        self._loads = loads
+        self._memlen = maxlen
+        self._filename = filename if maxSpillBytes > 0 else None
+        self._maxSpillBytes = maxSpillBytes
+        self._file = None
+        self._readOffset = self._writeOffset = _HEADER.size
+        self._spilled = 0
+        self.dropped = 0
+        if self._filename:
+            self._openSpillFile()
+
+    def _openSpillFile(self):
+        dirName = os.path.dirname(self._filename)
+        if dirName and not os.path.exists(dirName):
+            os.makedirs(dirName)
+        f = open(self._filename, 'a+b')
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(0)
+        header = f.read(_HEADER.size)
+        if len(header) == _HEADER.size and header[:len(_MAGIC)] == _MAGIC:
+            self._readOffset = _HEADER.unpack(header)[1]
+            self._scan(f, size)
+        if not self._spilled:
+            self._readOffset = self._writeOffset = _HEADER.size
+        # write only through an r+b handle so the header can be updated
+        f.close()
+        if self._writeOffset < size or size < _HEADER.size:
+            with open(self._filename, 'r+b') as f:
+                f.truncate(self._writeOffset)
+        self._file = open(self._filename, 'r+b')
+        self._writeHeader()
+        if self._spilled:
+            log.info("Replaying %d metrics spilled to %s",
+                     self._spilled, self._filename)
+
+    def _scan(self, f, size):
+        """
+        Count the records left unread by the last run and drop a record
+        that was only partly written.
+        """
+        offset = self._readOffset
+        count = 0
+        while offset + _RECORD.size <= size:
+            f.seek(offset)
+            length, = _RECORD.unpack(f.read(_RECORD.size))
+            end = offset + _RECORD.size + length
+            if end > size:
+                break
+            offset = end
+            count += 1
+        self._writeOffset = max(offset, _HEADER.size)
+        self._spilled = count
+
+    def _writeHeader(self):
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(_MAGIC, self._readOffset))
+        self._file.flush()
+
+    def _spill(self, items):
+        f = self._file
+        limit = self._readOffset + self._maxSpillBytes
+        chunks = []
+        offset = self._writeOffset
+        dumps = self._dumps
+        for item in items:
+            if dumps is not None:
+                item = dumps(item)
+            elif isinstance(item, unicode):
+                item = item.encode('utf-8')
+            end = offset + _RECORD.size + len(item)
+            if end > limit:
+                self.dropped += 1
+                continue
+            chunks.append(_RECORD.pack(len(item)))
+            chunks.append(item)
+            offset = end
+            self._spilled += 1
+        if chunks:
+            f.seek(self._writeOffset)
+            f.write(''.join(chunks))
+            self._writeOffset = offset
+
+    def _refill(self):
+        """
+        Move spilled metrics back into memory, oldest first.
+        """
+        self._file.flush()
+        m = mmap.mmap(self._file.fileno(), self._writeOffset,
+                      access=mmap.ACCESS_READ)
+        try:
+            offset = self._readOffset
+            memory = self._memory
+            unpack_from = _RECORD.unpack_from
+            loads = self._loads
+            while self._spilled and len(memory) < self._memlen:
+                length, = unpack_from(m, offset)
+                offset += _RECORD.size
+                item = m[offset:offset + length]
+                memory.append(item if loads is None else loads(item))
+                offset += length
+                self._spilled -= 1
+        finally:
+            m.close()
+        if self._spilled:
+            self._readOffset = offset
+            if offset - _HEADER.size >= self._writeOffset - offset:
+                self._compact()
+        else:
+            # drained; start the file over
+            self._readOffset = self._writeOffset = _HEADER.size
+            self._file.truncate(self._writeOffset)
+        self._writeHeader()
+
+    def _compact(self):
+        """
+        Move the unread metrics to the start of the file.  They are no
+        bigger than the part already read, so they are copied without
+        overwriting themselves, and the header still points to them until
+        the copy is complete.
+        """
+        f = self._file
+        src = self._readOffset
+        dst = _HEADER.size
+        while src < self._writeOffset:
+            f.seek(src)
+            data = f.read(min(_COPY_BYTES, self._writeOffset - src))
+            f.seek(dst)
+            f.write(data)
+            src += len(data)
+            dst += len(data)
+        f.flush()
+        self._readOffset = _HEADER.size
+        self._writeOffset = dst
+        self._writeHeader()
+        f.truncate(dst)
+
+    def append(self, item):
+        self.extend((item,))
+
+    def extend(self, items):
+        memory = self._memory
+        if self._file is None:
+            for item in items:
+                if len(memory) >= self._memlen:
+                    memory.popleft()
+                    self.dropped += 1
+                memory.append(item)
+            return
+        items = iter(items)
+        if not self._spilled:
+            # metrics only go to memory while nothing is spilled, to
+            # keep them in order
+            room = self._memlen - len(memory)
+            if room > 0:
+                memory.extend(islice(items, room))
+        self._spill(items)
+
+    def extendleft(self, items):
+        """
+        Put metrics that could not be published back at the front of the
+        queue.  Without a spill file, only as many as fit in memory are
+        kept; otherwise they are all kept in memory.
+        """
+        items = list(items)
+        if self._file is None:
+            openSlots = max(self._memlen - len(self._memory), 0)
+            # items are reversed: the oldest come last
+            self.dropped += max(len(items) - openSlots, 0)
+            items = items[:openSlots]
+        self._memory.extendleft(items)
+
+    def popleft(self):
+        if not self._memory and self._spilled:
+            self._refill()
+        return self._memory.popleft()
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            self._file.close()
+            self._file = None
+
+    @property
+    def spillBytes(self):
+        """
+        Bytes of spilled metrics not yet read back.
+        """
+        return self._writeOffset - self._readOffset
+
+    def __len__(self):
+        return len(self._memory) + self._spilled
+
+    def __nonzero__(self):
+        return bool(self._memory) or bool(self._spilled)
@@ -29,6 +29,7 @@ _ZCOMMAND_USERNAME_NOT_SET = 'zCommandUsername is not set so SSH-based commands
 
 class CommandPerformanceConfig(CollectorConfigService):
     dsType = 'COMMAND'
+    cachedMethods = ('getDeviceConfigs',)
 
     def __init__(self, dmd, instance):
         deviceProxyAttributes = ('zCommandPort',
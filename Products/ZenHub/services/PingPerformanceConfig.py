@@ -71,6 +71,9 @@ pb.setUnjellyableForClass(IpAddressProxy, IpAddressProxy)
 
 
 class PingPerformanceConfig(CollectorConfigService):
+
+    cachedMethods = ('getDeviceConfigs',)
+
     def __init__(self, dmd, instance):
         deviceProxyAttributes = ('zPingMonitorIgnore',)
         CollectorConfigService.__init__(self, dmd, instance,
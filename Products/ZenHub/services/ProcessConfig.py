@@ -63,6 +63,8 @@ pb.setUnjellyableForClass(ProcessProxy, ProcessProxy)
 
 class ProcessConfig(CollectorConfigService):
 
+    cachedMethods = ('getDeviceConfigs',)
+
     def __init__(self, dmd, instance):
         deviceProxyAttributes = ('zMaxOIDPerRequest',)
         CollectorConfigService.__init__(self, dmd, instance, deviceProxyAttributes)
@@ -43,6 +43,9 @@ pb.setUnjellyableForClass(SnmpDeviceProxy, SnmpDeviceProxy)
 
 
 class SnmpPerformanceConfig(CollectorConfigService):
+
+    cachedMethods = ('getDeviceConfigs',)
+
     def __init__(self, dmd, instance):
         deviceProxyAttributes = ('zMaxOIDPerRequest',
                                  'zSnmpMonitorIgnore',
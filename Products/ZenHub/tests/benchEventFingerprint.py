@@ -0,0 +1,87 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+"""
+Measure the events per second fingerprinted by DefaultFingerprintGenerator
+and queued by DeDupingEventQueue, for trap-like events.
+
+    python benchEventFingerprint.py --events 100000 --devices 500
+"""
+
+import random
+import time
+from optparse import OptionParser
+
+import Globals
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+
+from Products.ZenHub.PBDaemon import DefaultFingerprintGenerator, \
+    DeDupingEventQueue
+
+
+def createEvents(count, devices):
+    events = []
+    for i in xrange(count):
+        device = 'device%d' % random.randrange(devices)
+        events.append(dict(
+            device=device,
+            ipAddress='10.0.%d.%d' % (i % 250, i % 200),
+            component='ifIndex%d' % random.randrange(48),
+            eventClass='/Net/Link',
+            eventClassKey='linkDown',
+            eventGroup='trap',
+            agent='zentrap',
+            manager='collector1',
+            monitor='localhost',
+            severity=3,
+            community='public',
+            oid='1.3.6.1.6.3.1.1.5.3',
+            summary='snmp trap linkDown from %s' % device,
+            rcvtime=time.time(),
+        ))
+    return events
+
+
+def report(name, count, elapsed):
+    print "%s: %d events in %.2fs: %d events/s" % (
+        name, count, elapsed, count / elapsed)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--events', type='int', default=100000)
+    parser.add_option('--devices', type='int', default=500)
+    options, args = parser.parse_args()
+
+    events = createEvents(options.events, options.devices)
+
+    generator = DefaultFingerprintGenerator()
+    start = time.time()
+    for evt in events:
+        generator.generate(evt)
+    report("generate", len(events), time.time() - start)
+
+    queue = DeDupingEventQueue(len(events))
+    start = time.time()
+    for evt in events:
+        queue.append(evt)
+    report("append", len(events), time.time() - start)
+
+    # a failed send puts the popped events back on a new queue
+    popped = [queue.popleft() for i in xrange(len(queue))]
+    requeue = DeDupingEventQueue(len(events), queue.popped_fingerprints)
+    start = time.time()
+    requeue.extendleft(popped)
+    report("extendleft", len(popped), time.time() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import struct
+import unittest
+from Products.ZenHub.metricpublisher import compact
+
+
+class CompactMetricsTest(unittest.TestCase):
+    """Tests the compact metric encoding"""
+
+    def testRoundTrip(self):
+        tags = {'contextUUID': 'uuid1', 'key': 'Devices/dev1', 'device': 'dev1'}
+        otherTags = {'contextUUID': 'uuid2', 'key': 'Devices/dev2', 'internal': True}
+        metrics = [
+            ('dev1/cpu_cpu', 1.5, 1460000000, tags),
+            ('dev1/mem_mem', None, 1460000000, dict(tags)),
+            (u'dev2/cpu_cpu', -2.0, 1460000001, otherTags),
+        ]
+        data = compact.encode(metrics)
+        decoded = compact.decode(data)
+        self.assertEqual(decoded, [
+            {'metric': m, 'value': v, 'timestamp': t, 'tags': tg}
+            for m, v, t, tg in metrics])
+        # equal tag sets are written once
+        self.assertTrue(decoded[0]['tags'] is decoded[1]['tags'])
+        self.assertEqual(struct.unpack_from('!3sBBIII', data),
+                         ('ZMB', compact.VERSION, 0, 2, 3, 3))
+
+    def testFloatTimestamps(self):
+        metrics = [('m', 1.0, 1460000000.25, {}), ('m', 2.0, 1460000001, {})]
+        decoded = compact.decode(compact.encode(metrics))
+        self.assertEqual([m['timestamp'] for m in decoded],
+                         [1460000000.25, 1460000001.0])
+        self.assertEqual([m['tags'] for m in decoded], [{}, {}])
+
+    def testEmptyBatch(self):
+        self.assertEqual(compact.decode(compact.encode([])), [])
+
+    def testEncodeValid(self):
+        good = ('m', 1.0, 1, {'a': 'b'})
+        metrics = [good, ('m', 1.0, 'now', {}), ('m', 1.0, 1, {'a': []})]
+        data, valid, invalid = compact.encodeValid(metrics)
+        self.assertEqual(valid, [good])
+        self.assertEqual(invalid, metrics[1:])
+        self.assertEqual([m['tags'] for m in compact.decode(data)],
+                         [{'a': 'b'}])
+
+    def testRejectsUnknownVersion(self):
+        data = compact.encode([('m', 1.0, 1, {})])
+        data = data[:3] + chr(compact.VERSION + 1) + data[4:]
+        self.assertRaises(ValueError, compact.decode, data)
+        self.assertRaises(ValueError, compact.decode, 'XYZ' + data[3:])
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(CompactMetricsTest))
+    return suite
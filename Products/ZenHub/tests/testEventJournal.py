@@ -0,0 +1,98 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import deque
+
+from Products.ZenHub.EventJournal import EventJournal
+
+
+class Queue(deque):
+
+    def extendleft(self, events):
+        deque.extendleft(self, reversed(events))
+        return []
+
+
+class EventJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def createJournal(self, **kwargs):
+        journal = EventJournal(self.path, 'events', **kwargs)
+        events, generation = journal.load(Queue)
+        return journal, events, generation
+
+    def testEmpty(self):
+        journal, events, generation = self.createJournal()
+        self.assertEqual((events, generation), ([], 0))
+        journal.compact([(1, [])])
+        self.assertEqual(os.listdir(self.path), ['events.00000001.log'])
+
+    def testReplay(self):
+        journal, events, generation = self.createJournal()
+        journal.compact([(1, [{'id': 0}])])
+        for i in range(1, 5):
+            journal.append(1, {'id': i})
+        journal.pop(1, 2)
+        # the queue of generation 1 is being sent; new events are queued
+        # in generation 2
+        journal.append(2, {'id': 5})
+        journal.pop(1)
+        journal.extendleft(2, [{'id': 'x'}])
+        journal.close()
+
+        journal, events, generation = self.createJournal()
+        self.assertEqual([e['id'] for e in events], [3, 4, 'x', 5])
+        self.assertEqual(generation, 2)
+
+        journal.retire(1)
+        journal.close()
+        journal, events, generation = self.createJournal()
+        self.assertEqual([e['id'] for e in events], ['x', 5])
+
+    def testCompact(self):
+        journal, events, generation = self.createJournal(compactBytes=1000)
+        journal.compact([(1, [])])
+        for i in range(100):
+            journal.append(1, {'id': i})
+            journal.pop(1)
+        self.assertTrue(journal.shouldCompact())
+        journal.compact([(1, [{'id': 'last'}])])
+        self.assertFalse(journal.shouldCompact())
+        self.assertEqual(os.listdir(self.path), ['events.00000002.log'])
+        journal.close()
+        journal, events, generation = self.createJournal()
+        self.assertEqual(events, [{'id': 'last'}])
+
+    def testDamagedTail(self):
+        journal, events, generation = self.createJournal()
+        journal.compact([(1, [])])
+        journal.append(1, {'id': 1})
+        journal.append(1, {'id': 2})
+        journal.close()
+        filename = os.path.join(self.path, 'events.00000001.log')
+        with open(filename, 'r+b') as f:
+            f.truncate(os.path.getsize(filename) - 3)
+        journal, events, generation = self.createJournal()
+        self.assertEqual(events, [{'id': 1}])
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(EventJournalTest))
+    return suite
@@ -0,0 +1,81 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+import os
+import shutil
+import tempfile
+
+import transaction
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+from Products.ZenHub.interfaces import FILTER_CONTINUE, FILTER_EXCLUDE
+from Products.ZenHub.invalidationfilter import DeviceClassInvalidationFilter
+
+
+class CountingFilter(DeviceClassInvalidationFilter):
+
+    def __init__(self, checksumFile):
+        super(CountingFilter, self).__init__()
+        self._checksumFile = checksumFile
+        self.computed = []
+
+    def checksumFile(self):
+        return self._checksumFile
+
+    def organizerChecksum(self, organizer):
+        self.computed.append('/'.join(organizer.getPrimaryPath()))
+        return super(CountingFilter, self).organizerChecksum(organizer)
+
+
+class TestOrganizerChecksumStore(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestOrganizerChecksumStore, self).afterSetUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.checksumFile = os.path.join(self.tmpdir, 'checksums')
+        self.org = self.dmd.Devices.createOrganizer('/ChecksumTest')
+        transaction.savepoint()
+
+    def beforeTearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(TestOrganizerChecksumStore, self).beforeTearDown()
+
+    def testChecksumsReusedAcrossRestarts(self):
+        root = '/'.join(self.dmd.Devices.getPrimaryPath())
+        first = CountingFilter(self.checksumFile)
+        first.initialize(self.dmd)
+        self.assertTrue(root in first.computed)
+
+        second = CountingFilter(self.checksumFile)
+        second.initialize(self.dmd)
+        self.assertFalse(root in second.computed)
+        self.assertEquals(second.checksum_map, first.checksum_map)
+
+    def testModifiedOrganizerRehashed(self):
+        CountingFilter(self.checksumFile).initialize(self.dmd)
+        # uncommitted changes are never served from the store
+        self.org.setZenProperty('zCommandUsername', 'checksum')
+        self.org.manage_addRRDTemplate('ChecksumTemplate')
+        transaction.savepoint()
+
+        fltr = CountingFilter(self.checksumFile)
+        fltr.initialize(self.dmd)
+        path = '/'.join(self.org.getPrimaryPath())
+        self.assertTrue(path in fltr.computed)
+        self.assertEquals(fltr.include(self.org), FILTER_EXCLUDE)
+        self.org.setZenProperty('zCommandUsername', 'changed')
+        self.assertEquals(fltr.include(self.org), FILTER_CONTINUE)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestOrganizerChecksumStore))
+    return suite
@@ -11,7 +11,10 @@ import unittest
 
 import ujson as json
 
+from twisted.internet import defer
+
 from Products.ZenHub.metricpublisher.publisher import RedisListPublisher, HttpPostPublisher, BasePublisher
+from Products.ZenHub.metricpublisher.publisher import COMPACT_ENCODING
 from Products.ZenHub.metricpublisher.utils import sanitized_float
 
 
@@ -25,6 +28,13 @@ class BasePublisherTestCase(unittest.TestCase):
                 {'metric':'m', 'value':1.0, 'timestamp':1, 'tags':{}},
                 publisher.build_metric( 'm', "1.0", 1, {}))
 
+    def testEncodeCompactDropsBadMetrics(self):
+        publisher = BasePublisher(0, 0, encoding=COMPACT_ENCODING)
+        good = publisher.build_metric('m', 1.0, 1, {})
+        bad = publisher.build_metric('m', 1.0, 'now', {})
+        data, metrics = publisher._encodeCompact([good, bad])
+        self.assertEquals([good], metrics)
+
 class HttpPostPublisherTestCase(unittest.TestCase):
     def testPut(self):
         publisher = HttpPostPublisher(None,None)
@@ -33,10 +43,10 @@ class HttpPostPublisherTestCase(unittest.TestCase):
         self.assertEquals( 2, len(publisher._mq))
         self.assertEquals(
                 {"metric":"m", "value":1.0, "timestamp":1, "tags":{}},
-                publisher._mq.pop())
+                publisher._mq.popleft())
         self.assertEquals(
                 {"metric":"m", "value":1.0, "timestamp":1, "tags":{}},
-                publisher._mq.pop())
+                publisher._mq.popleft())
 
 class RedisPublisherTestCase(unittest.TestCase):
     def testPut(self):
@@ -46,10 +56,57 @@ class RedisPublisherTestCase(unittest.TestCase):
         self.assertEquals( 2, len(publisher._mq))
         self.assertEquals(
                 json.dumps({"metric":"m","value":0.0,"timestamp":1,"tags":{}}),
-                publisher._mq.pop())
+                publisher._mq.popleft())
         self.assertEquals(
                 json.dumps({"metric":"m","value":0.0,"timestamp":1,"tags":{}}),
-                publisher._mq.pop())
+                publisher._mq.popleft())
+
+
+class FakeRedisClient(object):
+
+    def __init__(self):
+        self.pushed = []
+        self.trimmed = []
+
+    def lpush(self, channel, *values):
+        self.pushed.append(values)
+        return defer.succeed(len(self.pushed))
+
+    def ltrim(self, channel, start, end):
+        self.trimmed.append((start, end))
+        return defer.succeed(None)
+
+
+class RedisBoundTestCase(unittest.TestCase):
+
+    def flush(self, publisher, metricCount):
+        client = publisher._redis.client = FakeRedisClient()
+        metrics = [publisher.build_metric('m', 1.0, i, {})
+                   for i in range(metricCount)]
+        publisher._flush(metrics)
+        return client
+
+    def testJsonTrimsMetrics(self):
+        publisher = RedisListPublisher(maxOutstandingMetrics=200000)
+        client = self.flush(publisher, 4)
+        self.assertEquals([(0, 199999)], client.trimmed)
+
+    def testCompactTrimsBatches(self):
+        # no more than 3 full batches of 65536 metrics fit in 200000
+        publisher = RedisListPublisher(maxOutstandingMetrics=200000,
+                                       encoding=COMPACT_ENCODING)
+        client = self.flush(publisher, 4)
+        self.assertEquals(1, len(client.pushed[0]))
+        self.assertEquals([(0, 2)], client.trimmed)
+
+    def testCompactBatchSizeBounded(self):
+        publisher = RedisListPublisher(maxOutstandingMetrics=100,
+                                       encoding=COMPACT_ENCODING)
+        for i in range(10):
+            publisher._metrics_published(0, publisher._batch_size)
+        self.assertEquals(100, publisher._batch_size)
+        client = self.flush(publisher, 100)
+        self.assertEquals([(0, 0)], client.trimmed)
 
 
 class UtilsTestCase(unittest.TestCase):
@@ -102,5 +159,6 @@ def test_suite():
     suite.addTest(unittest.makeSuite(BasePublisherTestCase))
     suite.addTest(unittest.makeSuite(HttpPostPublisherTestCase))
     suite.addTest(unittest.makeSuite(RedisPublisherTestCase))
+    suite.addTest(unittest.makeSuite(RedisBoundTestCase))
     suite.addTest(unittest.makeSuite(UtilsTestCase))
     return suite
@@ -7,7 +7,7 @@
 #
 ##############################################################################
 
-import os, logging
+import os, logging, shutil, tempfile
 
 log = logging.getLogger('zen.testPBDaemon')
 
@@ -16,7 +16,7 @@ import eventlet
 
 from Products.ZenUtils.Utils import unused
 unused(Globals)
-from twisted.internet.defer import failure
+from twisted.internet.defer import Deferred, failure
 from zope.interface import implements
 from zope.component import getGlobalSiteManager
 
@@ -135,6 +135,22 @@ class TestDeDupingEventQueue(BaseEventQueueTest):
         self.assertEquals('dev3', queued[3]['device'])
         self.assertEquals(0, queued[3].get('count', 0))
 
+    def testExtendLeftReusesFingerprints(self):
+        for device in ('dev1', 'dev2'):
+            self.queue.append(createTestEvent(device=device))
+        events = [self.queue.popleft(), self.queue.popleft()]
+        self.queue.append(createTestEvent(device='dev2'))
+        generated = []
+        def fingerprint(event):
+            generated.append(event)
+            return 'unexpected'
+        self.queue._event_fingerprint = fingerprint
+        self.queue.extendleft(events)
+        self.assertEquals([], generated)
+        queued = list(self.queue)
+        self.assertEquals(2, len(queued))
+        self.assertEquals(2, queued[1]['count'])
+
 
 class TestDequeEventQueue(BaseEventQueueTest):
 
@@ -151,7 +167,7 @@ class TestEventQueueManager(BaseTestCase):
 
     def createOptions(self, deduplicate_events=True, maxqueuelen=5000,
                       allowduplicateclears=False, duplicateclearinterval=0,
-                      eventflushchunksize=50):
+                      eventflushchunksize=50, maxpersistentqueuelen=5000):
         class MockOptions(object):
             pass
         options = MockOptions()
@@ -160,6 +176,8 @@ class TestEventQueueManager(BaseTestCase):
         options.allowduplicateclears = allowduplicateclears
         options.duplicateclearinterval = duplicateclearinterval
         options.eventflushchunksize = eventflushchunksize
+        options.maxpersistentqueuelen = maxpersistentqueuelen
+        options.eventQueueSyncSeconds = 1.0
         return options
 
     def testAddEventDroppedTransform(self):
@@ -314,6 +332,89 @@ class TestEventQueueManager(BaseTestCase):
         self.assertEquals(perf_events[5:], list(eqm.perf_event_queue))
         self.assertEquals(events, list(eqm.event_queue))
 
+    def testPersistentQueue(self):
+        path = tempfile.mkdtemp()
+        try:
+            opts = self.createOptions(maxqueuelen=2, maxpersistentqueuelen=10)
+            eqm = EventQueueManager(opts, log, path)
+            events = [createTestEvent(device='dev%d' % i) for i in range(4)]
+            for event in events:
+                eqm.addEvent(event)
+            eqm.addPerformanceEvent(createTestEvent(device='perfdev'))
+            self.assertEquals(0, eqm.discarded_events)
+            eqm.close()
+
+            # the queued events are restored after a restart
+            eqm = EventQueueManager(opts, log, path)
+            self.assertEquals(events, list(eqm.event_queue))
+            self.assertEquals(1, len(eqm.perf_event_queue))
+            sent_events = []
+            eqm.sendEvents(lambda evts: sent_events.extend(evts))
+            self.assertEquals(5, len(sent_events))
+            eqm.close()
+
+            # and not sent again once sent
+            eqm = EventQueueManager(opts, log, path)
+            self.assertEquals(0, eqm.event_queue_length)
+            eqm.close()
+        finally:
+            shutil.rmtree(path)
+
+    def testPersistentQueueFailedSend(self):
+        path = tempfile.mkdtemp()
+        try:
+            opts = self.createOptions(eventflushchunksize=2)
+            eqm = EventQueueManager(opts, log, path)
+            events = [createTestEvent(device='dev%d' % i) for i in range(5)]
+            for event in events[:4]:
+                eqm.addEvent(event)
+
+            def send_events(evts):
+                # queue an event while sending, then fail
+                eqm.addEvent(events[4])
+                raise Exception("Failed on first send.")
+
+            results = []
+            eqm.sendEvents(send_events).addErrback(results.append)
+            self.assertEquals(1, len(results))
+            self.assertEquals(events, list(eqm.event_queue))
+            eqm.close()
+
+            eqm = EventQueueManager(opts, log, path)
+            self.assertEquals(events, list(eqm.event_queue))
+            eqm.close()
+        finally:
+            shutil.rmtree(path)
+
+    def testPersistentQueueCrashWhileSending(self):
+        path = tempfile.mkdtemp()
+        try:
+            opts = self.createOptions(eventflushchunksize=2)
+            eqm = EventQueueManager(opts, log, path)
+            events = [createTestEvent(device='dev%d' % i) for i in range(5)]
+            for event in events[:4]:
+                eqm.addEvent(event)
+
+            sent = []
+            def send_events(evts):
+                sent.append(Deferred())
+                if len(sent) == 2:
+                    # queue an event while the second chunk is in flight
+                    eqm.addEvent(events[4])
+                    eqm.sync()
+                return sent[-1]
+
+            eqm.sendEvents(send_events)
+            sent[0].callback(None)
+            self.assertEquals(2, len(sent))
+
+            # the collector dies before the second chunk is acknowledged
+            eqm = EventQueueManager(opts, log, path)
+            self.assertEquals(events[2:], list(eqm.event_queue))
+            eqm.close()
+        finally:
+            shutil.rmtree(path)
+
     def testRestoreEventsDiscarded(self):
         opts = self.createOptions(eventflushchunksize=5, maxqueuelen=10)
         eqm = EventQueueManager(opts, log)
@@ -362,9 +463,9 @@ class TestDefaultFingerprintGenerator(BaseTestCase):
 
     def testGenerate(self):
         evt = createTestEvent()
-        self.assertEquals('65e9075c8b854688217c45471bb837ede3157d53', self.generator.generate(evt))
+        self.assertEquals('3f550c1e5d1a8138df52718c0d08ae81aeae967c', self.generator.generate(evt))
         del evt['eventKey']
-        self.assertEquals('4f39c417bdee2731336bf6a9f22c89fbe4d987b0', self.generator.generate(evt))
+        self.assertEquals('a0a9c60831d365201380423490e3abff786b161e', self.generator.generate(evt))
 
     def testDeDupingSensitivity(self):
         evt = createTestEvent(device='dev1')
@@ -408,6 +509,12 @@ class TestMetricWriter(BaseTestCase):
         self.metric_writer.write_metric( *metric)
         self.assertEquals( [tuple(metric)], self.daemon._publisher.queue)
 
+    def testWriteMetrics(self):
+        metrics = [("name", 0.0, "now", {}), ("name2", 1.0, "now", {})]
+        self.metric_writer.write_metrics(metrics)
+        self.assertEquals(metrics, self.daemon._publisher.queue)
+        self.assertEquals(2, self.metric_writer.dataPoints)
+
 class TestInternalMetricWriter(BaseTestCase):
     def setUp(self):
         os.environ["CONTROLPLANE"] = "1"
@@ -424,6 +531,13 @@ class TestInternalMetricWriter(BaseTestCase):
         self.assertEquals( [tuple(internal_metric)], self.daemon._internal_publisher.queue)
         self.assertEquals( [tuple(metric), tuple(internal_metric)], self.daemon._publisher.queue)
 
+    def testWriteInternalMetrics(self):
+        metric = ("name", 0.0, "now", {})
+        internal_metric = ("name", 0.0, "now", {"internal":True})
+        self.metric_writer.write_metrics([metric, internal_metric])
+        self.assertEquals([internal_metric], self.daemon._internal_publisher.queue)
+        self.assertEquals([metric, internal_metric], self.daemon._publisher.queue)
+
     def testInternalPublisherIsNone(self):
         self.daemon._internal_publisher = None
         del os.environ["CONTROLPLANE_CONSUMER_URL"]
@@ -0,0 +1,115 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import unittest
+
+from twisted.internet import defer
+
+from Products.ZenHub.ResultCache import ResultCache
+
+
+class Fetcher(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self):
+        d = defer.Deferred()
+        self.calls.append(d)
+        return d
+
+
+def results(d):
+    fired = []
+    d.addBoth(fired.append)
+    return fired
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResultCache()
+        self.fetch = Fetcher()
+
+    def testCached(self):
+        first = results(self.cache.call('a', frozenset(['dev1']), self.fetch))
+        self.fetch.calls[0].callback(['config1'])
+        second = results(self.cache.call('a', frozenset(['dev1']), self.fetch))
+        self.assertEqual(1, len(self.fetch.calls))
+        self.assertEqual([['config1']], first)
+        self.assertEqual([['config1']], second)
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+    def testPendingCallShared(self):
+        first = results(self.cache.call('a', None, self.fetch))
+        second = results(self.cache.call('a', None, self.fetch))
+        self.assertEqual(1, len(self.fetch.calls))
+        self.fetch.calls[0].callback('configs')
+        self.assertEqual(['configs'], first)
+        self.assertEqual(['configs'], second)
+
+    def testFailureNotCached(self):
+        first = results(self.cache.call('a', None, self.fetch))
+        second = results(self.cache.call('a', None, self.fetch))
+        self.fetch.calls[0].errback(Exception('worker died'))
+        self.assertEqual(2, len(first + second))
+        for failure in first + second:
+            failure.trap(Exception)
+        self.assertEqual(0, len(self.cache))
+
+    def testInvalidateDevice(self):
+        self.cache.call('a', frozenset(['dev1']), self.fetch)
+        self.cache.call('b', frozenset(['dev2']), self.fetch)
+        self.cache.call('all', None, self.fetch)
+        for d in self.fetch.calls:
+            d.callback('configs')
+        self.assertEqual(3, len(self.cache))
+        self.cache.invalidateDevice('dev1', collectorDevice=False)
+        self.cache.call('all', None, self.fetch)
+        self.cache.call('b', frozenset(['dev2']), self.fetch)
+        self.assertEqual(3, len(self.fetch.calls))
+        self.cache.invalidateDevice('dev3')
+        self.assertEqual(1, len(self.cache))
+        self.cache.invalidate()
+        self.assertEqual(0, len(self.cache))
+
+    def testInvalidatedWhileComputing(self):
+        first = results(self.cache.call('a', None, self.fetch))
+        self.cache.invalidate()
+        # the pending result may predate the change
+        self.cache.call('a', None, self.fetch)
+        self.assertEqual(2, len(self.fetch.calls))
+        self.fetch.calls[0].callback('stale')
+        self.assertEqual(['stale'], first)
+        self.assertEqual(0, len(self.cache))
+        self.fetch.calls[1].callback('fresh')
+        self.assertEqual(['fresh'], results(self.cache.call('a', None, self.fetch)))
+
+    def testMaxEntries(self):
+        self.cache.maxEntries = 2
+        for key in ('a', 'b', 'c'):
+            self.cache.call(key, frozenset([key]), self.fetch)
+            self.fetch.calls[-1].callback(key)
+        self.assertEqual(2, len(self.cache))
+        self.cache.call('a', frozenset(['a']), self.fetch)
+        self.assertEqual(4, len(self.fetch.calls))
+
+    def testDisabled(self):
+        self.cache.maxEntries = 0
+        self.cache.call('a', None, self.fetch)
+        self.fetch.calls[0].callback('configs')
+        self.cache.call('a', None, self.fetch)
+        self.assertEqual(2, len(self.fetch.calls))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(ResultCacheTest))
+    return suite
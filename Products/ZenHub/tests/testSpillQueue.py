@@ -0,0 +1,110 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+from Products.ZenHub.metricpublisher.spillqueue import SpillQueue
+
+
+def drain(queue):
+    items = []
+    while queue:
+        items.append(queue.popleft())
+    return items
+
+
+class SpillQueueTest(unittest.TestCase):
+    """Tests SpillQueue"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'spill', 'metrics.spill')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testMemoryOnlyDropsOldest(self):
+        queue = SpillQueue(3)
+        queue.extend(['a', 'b', 'c', 'd'])
+        self.assertEqual(queue.dropped, 1)
+        self.assertEqual(queue.spillBytes, 0)
+        self.assertEqual(drain(queue), ['b', 'c', 'd'])
+
+    def testSpillKeepsOrder(self):
+        queue = SpillQueue(2, self.filename, 1024)
+        queue.extend(['m%d' % i for i in range(5)])
+        self.assertEqual(len(queue), 5)
+        self.assertTrue(queue.spillBytes > 0)
+        self.assertEqual(queue.popleft(), 'm0')
+        # memory has room again, but newer metrics queue behind the spill
+        queue.append('m5')
+        self.assertEqual(drain(queue), ['m1', 'm2', 'm3', 'm4', 'm5'])
+        self.assertEqual(queue.spillBytes, 0)
+        self.assertEqual(queue.dropped, 0)
+
+    def testSpillLimitDropsNewest(self):
+        # records take 4 bytes plus their data: two fit
+        queue = SpillQueue(1, self.filename, 24)
+        queue.extend(['a' * 8, 'b' * 8, 'c' * 8, 'd' * 8])
+        self.assertEqual(queue.dropped, 1)
+        self.assertEqual(drain(queue), ['a' * 8, 'b' * 8, 'c' * 8])
+
+    def testSpillLimitCountsUnreadMetrics(self):
+        # room for three 8 byte metrics beyond the one in memory
+        queue = SpillQueue(1, self.filename, 36)
+        queue.extend(['%08d' % i for i in range(3)])
+        for i in range(3, 100):
+            # keep the spill file busy while it is read
+            self.assertEqual(queue.popleft(), '%08d' % (i - 3))
+            queue.append('%08d' % i)
+            self.assertTrue(os.path.getsize(self.filename) <= 16 + 2 * 36)
+        self.assertEqual(queue.dropped, 0)
+        self.assertEqual(drain(queue), ['%08d' % i for i in range(97, 100)])
+        queue.close()
+
+    def testCompactedSpillReplayed(self):
+        queue = SpillQueue(1, self.filename, 1024)
+        queue.extend(['a', 'b', 'c', 'd', 'e'])
+        for item in 'abc':
+            self.assertEqual(queue.popleft(), item)
+        queue.close()
+        queue = SpillQueue(1, self.filename, 1024)
+        self.assertEqual(drain(queue), ['d', 'e'])
+
+    def testRequeue(self):
+        queue = SpillQueue(2, self.filename, 1024)
+        queue.extend(['a', 'b', 'c'])
+        batch = [queue.popleft(), queue.popleft()]
+        queue.extendleft(reversed(batch))
+        self.assertEqual(drain(queue), ['a', 'b', 'c'])
+
+    def testReplayAfterRestart(self):
+        queue = SpillQueue(1, self.filename, 1024)
+        queue.extend(['a', 'b', 'c', u'd'])
+        self.assertEqual(queue.popleft(), 'a')
+        self.assertEqual(queue.popleft(), 'b')
+        queue.close()
+        # half-written record from a crash
+        with open(self.filename, 'ab') as f:
+            f.write('\x00\x00\x00\x09xy')
+
+        queue = SpillQueue(1, self.filename, 1024)
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(drain(queue), ['c', 'd'])
+        queue.close()
+        self.assertEqual(len(SpillQueue(1, self.filename, 1024)), 0)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(SpillQueueTest))
+    return suite
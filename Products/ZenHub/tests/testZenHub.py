@@ -15,15 +15,24 @@ from Products.ZenTestCase.BaseTestCase import ZenossTestCaseLayer, BaseTestCase
 from Products.ZenUtils.Driver import drive
 
 # Import from zenhub before importing twisted.internet.reactor
-from Products.ZenHub.zenhub import ZenHub
+from Products.ZenHub.zenhub import ZenHub, HubWorklistItem, _ZenHubWorklist, \
+    pickleChunks
 from Products.ZenHub.PBDaemon import RemoteException, RemoteConflictError
+from Products.ZenHub.interfaces import IInvalidationProcessor
 
 from twisted.python.failure import Failure
 from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
 from twisted.cred import credentials
 from twisted.spread import pb
 import sys
 import os
+import time
+import logging
+import collections
+from optparse import Values
+from zope.component import getGlobalSiteManager
 
 from Products.ZenMessaging.queuemessaging.interfaces import IQueuePublisher
 from Products.ZenMessaging.queuemessaging.publisher import DummyQueuePublisher, EventPublisher
@@ -224,9 +233,234 @@ class TestInternalMetricWriter(BaseTestCase):
         self.assertEquals( [tuple(internal_metric)], self.internal_publisher.queue)
         self.assertEquals( [tuple(metric), tuple(internal_metric)], self.publisher.queue)
 
+class TestPickleChunks(BaseTestCase):
+
+    def testRoundTrip(self):
+        from Products.ZenHub.zenhub import pickleChunks, unpickleChunks, \
+            PICKLE_CHUNK_SIZE
+        payload = ('x' * (3 * PICKLE_CHUNK_SIZE), range(1000))
+        chunks = pickleChunks(payload)
+        self.assertEquals(4, len(chunks))
+        for chunk in chunks:
+            self.assertIsInstance(chunk, str)
+            self.assertTrue(len(chunk) <= PICKLE_CHUNK_SIZE)
+        self.assertEquals(payload, unpickleChunks(chunks))
+
+    def testJelliedArgs(self):
+        from twisted.spread.jelly import jelly, unjelly, globalSecurity
+        from Products.DataCollector.plugins.DataMaps import ObjectMap
+        from Products.ZenHub.zenhub import pickleChunks, unpickleChunks
+        args = ('device1', [ObjectMap({'id': 'eth0', 'speed': 1000})])
+        jelliedArgs, jelliedKw = unpickleChunks(
+            pickleChunks((jelly(args), jelly({'a': 1}))))
+        device, maps = unjelly(jelliedArgs, globalSecurity)
+        self.assertEquals('device1', device)
+        self.assertIsInstance(maps[0], ObjectMap)
+        self.assertEquals(1000, maps[0].speed)
+        self.assertEquals({'a': 1}, unjelly(jelliedKw, globalSecurity))
+
+
+class MockWorker(object):
+
+    busy = False
+
+    def __init__(self):
+        self.calls = []
+
+    def callRemote(self, method, *args):
+        d = Deferred()
+        self.calls.append((method, args, d))
+        return d
+
+
+class IdleWorkerSelector(object):
+
+    def getCandidateWorkerIds(self, method, workers):
+        return [i for i, worker in enumerate(workers) if not worker.busy]
+
+
+class DispatchHub(ZenHub):
+
+    def __init__(self, workers):
+        # only what dispatching jobs to workers uses
+        self.log = logging.getLogger('zen.ZenHub')
+        self.workers = workers
+        self.workTracker = {}
+        self.inFlight = {}
+        self.executionTimer = collections.defaultdict(lambda: [0, 0.0, 0.0, 0])
+        self.workList = _ZenHubWorklist()
+        self.workList.log = self.log
+        self.workerselector = IdleWorkerSelector()
+        self.counters = collections.Counter()
+        self.shutdown = False
+
+    def addJob(self):
+        job = HubWorklistItem(1, time.time(), Deferred(), 'EventService',
+                              'localhost', 'getDeviceConfigs', ())
+        self.workList.push(job)
+        return job
+
+
+class TestWorkerDispatch(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestWorkerDispatch, self).afterSetUp()
+        self.reactor = Clock()
+        self._reactor = Products.ZenHub.zenhub.reactor
+        Products.ZenHub.zenhub.reactor = self.reactor
+        self.workers = [MockWorker() for i in range(3)]
+        self.hub = DispatchHub(self.workers)
+
+    def beforeTearDown(self):
+        Products.ZenHub.zenhub.reactor = self._reactor
+        super(TestWorkerDispatch, self).beforeTearDown()
+
+    def testIdleWorkersDispatchedTogether(self):
+        for i in range(4):
+            self.hub.addJob()
+        self.hub.giveWorkToWorkers()
+        for worker in self.workers:
+            self.assertEquals(1, len(worker.calls))
+            self.assertTrue(worker.busy)
+        self.assertEquals(3, len(self.hub.inFlight))
+        self.assertEquals(1, len(self.hub.workList))
+
+    def testFinishedWorkerReceivesNextJob(self):
+        for i in range(4):
+            self.hub.addJob()
+        self.hub.giveWorkToWorkers()
+        worker = self.workers[1]
+        job = self.hub.inFlight[worker]
+        results = []
+        job.deferred.addCallback(results.append)
+        worker.calls[0][2].callback(pickleChunks('result'))
+        self.assertEquals(['result'], results)
+        self.assertFalse(worker.busy)
+        self.assertFalse(worker in self.hub.inFlight)
+        self.reactor.advance(0)
+        self.assertEquals(2, len(worker.calls))
+        self.assertEquals(0, len(self.hub.workList))
+
+    def testDisconnectReleasesWorker(self):
+        self.hub.addJob()
+        self.hub.giveWorkToWorkers()
+        worker = self.workers[0]
+        job = self.hub.inFlight[worker]
+        errors = []
+        job.deferred.addErrback(errors.append)
+        worker.calls[0][2].errback(pb.PBConnectionLost('lost'))
+        self.assertFalse(worker.busy)
+        self.assertEquals({}, self.hub.inFlight)
+        self.assertEquals(1, len(errors))
+        self.assertTrue(errors[0].check(pb.PBConnectionLost))
+
+
+class MockStorage(object):
+
+    def __init__(self, *changes):
+        self.changes = list(changes)
+        self.polls = 0
+
+    def poll_invalidations(self):
+        self.polls += 1
+        return self.changes.pop(0) if self.changes else None
+
+
+class MockInvalidationProcessor(object):
+
+    def __init__(self):
+        self.queued = []
+
+    def processQueue(self, oids):
+        d = Deferred()
+        self.queued.append((oids, d))
+        return d
+
+
+class InvalidationHub(ZenHub):
+
+    def __init__(self, storage):
+        # only what polling and filtering invalidations uses
+        self.log = logging.getLogger('zen.ZenHub')
+        self.options = Values({'invalidation_chunk_size': 100,
+                               'invalidation_backlog_limit': 150})
+        self.storage = storage
+        self._invalidations_paused = False
+        self._invalidationFilterBacklog = 0
+        self._invalidationDispatchBacklog = 0
+        self.filtered = []
+
+    def _filter_oids(self, oids):
+        # keep the even oids
+        self.filtered.append(list(oids))
+        return [oid for oid in oids if oid % 2 == 0]
+
+
+class TestInvalidationChunks(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestInvalidationChunks, self).afterSetUp()
+        self.calls = []
+        self._giveTimeToReactor = Products.ZenHub.zenhub.giveTimeToReactor
+        Products.ZenHub.zenhub.giveTimeToReactor = self.giveTimeToReactor
+        self.processor = MockInvalidationProcessor()
+        getGlobalSiteManager().registerUtility(self.processor,
+                                               IInvalidationProcessor)
+
+    def beforeTearDown(self):
+        getGlobalSiteManager().unregisterUtility(self.processor,
+                                                 IInvalidationProcessor)
+        Products.ZenHub.zenhub.giveTimeToReactor = self._giveTimeToReactor
+        super(TestInvalidationChunks, self).beforeTearDown()
+
+    def giveTimeToReactor(self, f, *args):
+        d = Deferred()
+        self.calls.append((d, f, args))
+        return d
+
+    def runReactor(self, turns=1):
+        for i in range(turns):
+            d, f, args = self.calls.pop(0)
+            d.callback(f(*args))
+
+    def testFilteredInChunks(self):
+        hub = InvalidationHub(MockStorage(range(250)))
+        hub.doProcessQueue()
+        # nothing is filtered until the reactor runs
+        self.assertEquals([], hub.filtered)
+        self.assertEquals(250, hub._invalidationFilterBacklog)
+        self.runReactor()
+        self.assertEquals([range(100)], hub.filtered)
+        self.assertEquals(150, hub._invalidationFilterBacklog)
+        self.runReactor(2)
+        self.assertEquals([100, 100, 50], [len(c) for c in hub.filtered])
+        self.assertEquals(0, hub._invalidationFilterBacklog)
+        oids, d = self.processor.queued[0]
+        self.assertEquals(set(range(0, 250, 2)), set(oids))
+        self.assertEquals(125, hub._invalidationDispatchBacklog)
+        d.callback(125)
+        self.assertEquals(0, hub._invalidationDispatchBacklog)
+
+    def testBacklogLimitsPolling(self):
+        storage = MockStorage(range(400), range(2))
+        hub = InvalidationHub(storage)
+        hub.doProcessQueue()
+        self.runReactor(4)
+        self.assertEquals(200, hub._invalidationDispatchBacklog)
+        # too many oids are waiting to be dispatched
+        hub.doProcessQueue()
+        self.assertEquals(1, storage.polls)
+        self.processor.queued[0][1].callback(200)
+        hub.doProcessQueue()
+        self.assertEquals(2, storage.polls)
+
+
 def test_suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TestZenHub))
+    suite.addTest(unittest.makeSuite(TestPickleChunks))
+    suite.addTest(unittest.makeSuite(TestWorkerDispatch))
+    suite.addTest(unittest.makeSuite(TestInvalidationChunks))
     suite.addTest(unittest.makeSuite(TestMetricWriter))
     suite.addTest(unittest.makeSuite(TestInternalMetricWriter))
     return suite
@@ -50,7 +50,7 @@ from ZODB.POSException import POSKeyError
 from Products.DataCollector.Plugins import loadPlugins
 from Products.Five import zcml
 from Products.ZenUtils.ZCmdBase import ZCmdBase
-from Products.ZenUtils.Utils import zenPath, getExitMessage, unused, load_config, load_config_override, ipv6_available, atomicWrite, wait
+from Products.ZenUtils.Utils import zenPath, getExitMessage, unused, load_config, load_config_override, ipv6_available, atomicWrite, giveTimeToReactor
 from Products.ZenUtils.DaemonStats import DaemonStats
 from Products.ZenEvents.Event import Event, EventHeartbeat
 from Products.ZenEvents.ZenEventClasses import App_Start
@@ -93,6 +93,26 @@ HubWorklistItem = collections.namedtuple('HubWorklistItem', 'priority recvtime d
 WorkerStats = collections.namedtuple('WorkerStats', 'status description lastupdate previdle')
 LastCallReturnValue = collections.namedtuple('LastCallReturnValue', 'returnvalue')
 
+# PB has a 640k limit, not bytes but len of sequences. Arguments and results
+# passed between zenhub and its workers are pickled and split into 100k
+# chunks.
+PICKLE_CHUNK_SIZE = 102400
+
+def pickleChunks(obj):
+    """
+    Pickle an object into a list of strings of at most PICKLE_CHUNK_SIZE
+    bytes each.
+    """
+    data = memoryview(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+    return [data[start:start + PICKLE_CHUNK_SIZE].tobytes()
+            for start in xrange(0, len(data), PICKLE_CHUNK_SIZE)]
+
+def unpickleChunks(chunks):
+    """
+    Unpickle an object from the chunks created by pickleChunks.
+    """
+    return pickle.loads(''.join(chunks))
+
 try:
     NICE_PATH = subprocess.check_output('which nice', shell=True).strip()
 except Exception:
@@ -268,28 +288,28 @@ class WorkerInterceptor(pb.Referenceable):
     def __init__(self, zenhub, service):
         self.zenhub = zenhub
         self.service = service
+        if service.cachedMethods:
+            service.resultCache.maxEntries = zenhub.options.resultCacheSize
 
     def remoteMessageReceived(self, broker, message, args, kw):
         """Intercept requests and send them down to workers"""
         svc = str(self.service.__class__).rpartition('.')[0]
         instance = self.service.instance
-        args = broker.unserialize(args)
-        kw = broker.unserialize(kw)
-        # hide the types in the args: subverting the jelly protection mechanism,
-        # but the types just passed through and the worker may not have loaded
-        # the required service before we try passing types for that service
-        # PB has a 640k limit, not bytes but len of sequences. When args are
-        # pickled the resulting string may be larger than 640k, split into
-        # 100k chunks
-        pickledArgs = pickle.dumps( (args, kw), pickle.HIGHEST_PROTOCOL )
-        chunkedArgs=[]
-        chunkSize = 102400
-        while pickledArgs:
-            chunk = pickledArgs[:chunkSize]
-            chunkedArgs.append(chunk)
-            pickledArgs = pickledArgs[chunkSize:]
-
-        deferred = self.zenhub.deferToWorker(svc, instance, message, chunkedArgs)
+        # pass the args through still jellied: the worker unjellies them once
+        # it has loaded the required service, as the types in the args may
+        # belong to that service.  The jellied args only hold lists, strings
+        # and numbers, which are cheap to pickle.
+        chunkedArgs = pickleChunks((args, kw))
+        fetch = lambda: self.zenhub.deferToWorker(svc, instance, message,
+                                                  chunkedArgs)
+        if message in self.service.cachedMethods:
+            # reuse the result of the same call until the model changes
+            devices = self.service.getCachedDevices(message,
+                broker.unserialize(args), broker.unserialize(kw))
+            key = (message, tuple(chunkedArgs))
+            deferred = self.service.resultCache.call(key, devices, fetch)
+        else:
+            deferred = fetch()
         return broker.serialize(deferred, self.perspective)
 
     def __getattr__(self, attr):
@@ -414,6 +434,8 @@ class ZenHub(ZCmdBase):
         # list of remote worker references
         self.workers = []
         self.workTracker = {}
+        # map of remote worker reference -> job currently executing on it
+        self.inFlight = {}
         # zenhub execution stats: [count, idle_total, running_total, last_called_time]
         self.executionTimer = collections.defaultdict(lambda: [0, 0.0, 0.0, 0])
         self.workList = _ZenHubWorklist()
@@ -424,6 +446,12 @@ class ZenHub(ZCmdBase):
         self.shutdown = False
         self.counters = collections.Counter()
         self._invalidations_paused = False
+        # number of polled oids waiting to be filtered
+        self._invalidationFilterBacklog = 0
+        # number of filtered oids waiting to be dispatched to services
+        self._invalidationDispatchBacklog = 0
+        # invalidation filter timings: [calls, total_seconds]
+        self._invalidationFilterTimer = collections.defaultdict(lambda: [0, 0.0])
 
         ZCmdBase.__init__(self)
         import Products.ZenHub
@@ -563,7 +591,7 @@ class ZenHub(ZCmdBase):
             self.log.warn("Unable to poll invalidations, will try again.")
         else:
             try:
-                self.doProcessQueue()
+                yield self.doProcessQueue()
             except Exception, ex:
                 self.log.exception("Unable to poll invalidations.")
         reactor.callLater(self.options.invalidation_poll_interval, self.processQueue)
@@ -599,7 +627,11 @@ class ZenHub(ZCmdBase):
                     else:
                         included = True
                         for fltr in self._invalidation_filters:
+                            start = time.time()
                             result = fltr.include(obj)
+                            timer = self._invalidationFilterTimer[fltr.__class__.__name__]
+                            timer[0] += 1
+                            timer[1] += time.time() - start
                             if result in (FILTER_INCLUDE, FILTER_EXCLUDE):
                                 included = (result == FILTER_INCLUDE)
                                 break
@@ -634,16 +666,58 @@ class ZenHub(ZCmdBase):
         transformed.discard(oid)
         return transformed or (oid,)
 
+    def _filterOidChunk(self, oids):
+        filtered = set(self._filter_oids(oids))
+        self._invalidationFilterBacklog -= len(oids)
+        return filtered
+
+    @defer.inlineCallbacks
+    def _filterOidsInChunks(self, oids):
+        """
+        Filter and transform oids a chunk at a time, giving the reactor a
+        chance to run between chunks.
+
+        @return: a Deferred firing with the set of oids to dispatch
+        """
+        oids = list(oids)
+        chunkSize = max(self.options.invalidation_chunk_size, 1)
+        self._invalidationFilterBacklog += len(oids)
+        filtered = set()
+        try:
+            for start in xrange(0, len(oids), chunkSize):
+                chunk = oids[start:start + chunkSize]
+                result = yield giveTimeToReactor(self._filterOidChunk, chunk)
+                filtered.update(result)
+        finally:
+            self._invalidationFilterBacklog = 0
+        defer.returnValue(filtered)
+
+    @defer.inlineCallbacks
     def doProcessQueue(self):
         """
         Perform one cycle of update notifications.
 
-        @return: None
+        Polled oids are filtered in chunks; the filtered oids are handed to
+        the invalidation processor without waiting for their notifications
+        to be dispatched.  Polling is skipped while more than
+        --invalidation-backlog-limit oids are still waiting to be
+        dispatched; the storage keeps accumulating the changes until the
+        next poll.
+
+        @return: a Deferred firing once the polled oids are filtered
         """
+        if self._invalidationDispatchBacklog > self.options.invalidation_backlog_limit:
+            self.log.debug("%d invalidations waiting to be dispatched, "
+                           "not polling for more",
+                           self._invalidationDispatchBacklog)
+            return
         changes_dict = self.storage.poll_invalidations()
         if changes_dict is not None:
             processor = getUtility(IInvalidationProcessor)
-            d = processor.processQueue(tuple(set(self._filter_oids(changes_dict))))
+            oids = yield self._filterOidsInChunks(changes_dict)
+            oids = tuple(oids)
+            self._invalidationDispatchBacklog += len(oids)
+            d = processor.processQueue(oids)
 
             def done(n):
                 if n == INVALIDATIONS_PAUSED:
@@ -663,6 +737,11 @@ class ZenHub(ZCmdBase):
                         self._invalidations_paused = False
             d.addCallback(done)
 
+            def dispatched(result):
+                self._invalidationDispatchBacklog -= len(oids)
+                return result
+            d.addBoth(dispatched)
+
     def sendEvent(self, **kw):
         """
         Useful method for posting events to the EventManager.
@@ -793,13 +872,14 @@ class ZenHub(ZCmdBase):
     @inlineCallbacks
     def finished(self, job, result, finishedWorker, wId):
         finishedWorker.busy = False
+        self.inFlight.pop(finishedWorker, None)
         error = None
         if isinstance(result, Exception):
             job.deferred.errback(result)
         else:
             try:
                 self.log.debug("worker %s result -> %s", wId, result)
-                result = pickle.loads(''.join(result))
+                result = unpickleChunks(result)
             except Exception as e:
                 error = e
                 self.log.exception("Error un-pickling result from worker")
@@ -817,12 +897,41 @@ class ZenHub(ZCmdBase):
             job.deferred.callback(result)
 
         self.updateStatusAtFinish(wId, job, error)
-        reactor.callLater(0.1, self.giveWorkToWorkers)
+        # a worker just became idle, so hand it the next job right away
+        reactor.callLater(0, self.giveWorkToWorkers)
         yield returnValue(result)
 
-    @inlineCallbacks
+    def _executeJob(self, worker, wId, job):
+        """Send a job to a worker without waiting for it to complete.
+
+        The worker is marked busy until the remote call finishes; the
+        result is delivered through L{finished}, which frees the worker
+        and schedules the next dispatch round.
+        """
+        worker.busy = True
+        self.inFlight[worker] = job
+        self.counters['workerItems'] += 1
+        self.updateStatusAtStart(wId, job)
+
+        def failed(reason):
+            self.log.warning("Failed to execute job on zenhub worker")
+            return reason.value
+
+        d = worker.callRemote('execute', *job.args)
+        d.addErrback(failed)
+        d.addCallback(lambda result: self.finished(job, result, worker, wId))
+        d.addErrback(lambda reason: self.log.error(
+            "Error finishing job %s on worker %s: %s",
+            job.method, wId, reason.getErrorMessage()))
+        return d
+
     def giveWorkToWorkers(self, requeue=False):
-        """Parcel out a method invocation to an available worker process
+        """Parcel out method invocations to all available worker processes
+
+        Jobs are dispatched without waiting for their results, so every
+        idle worker receives work in a single pass.  When all workers are
+        busy the remaining jobs stay queued; each finished job triggers
+        another pass.
         """
         if self.workList:
             self.log.debug("worklist has %d items", len(self.workList))
@@ -830,23 +939,12 @@ class ZenHub(ZCmdBase):
         while self.workList:
             if all(w.busy for w in self.workers):
                 self.log.debug("all workers are busy")
-                yield wait(0.1)
                 break
 
             job = self.workList.pop()
-            candidateWorkers = list(self.workerselector.getCandidateWorkerIds(job.method, self.workers))
+            candidateWorkers = self.workerselector.getCandidateWorkerIds(job.method, self.workers)
             for i in candidateWorkers:
-                worker = self.workers[i]
-                worker.busy = True
-                self.counters['workerItems'] += 1
-                self.updateStatusAtStart(i, job)
-                try:
-                    result = yield worker.callRemote('execute', *job.args)
-                except Exception as ex:
-                    self.log.warning("Failed to execute job on zenhub worker")
-                    result = ex
-                finally:
-                    yield self.finished(job, result, worker, i)
+                self._executeJob(self.workers[i], i, job)
                 break
             else:
                 #could not complete this job, put it back in the queue once
@@ -858,8 +956,8 @@ class ZenHub(ZCmdBase):
             self.workList.push(job)
 
         if incompleteJobs:
+            # these jobs will be retried when one of the busy workers finishes
             self.log.debug("No workers available for %d jobs." % len(incompleteJobs))
-            reactor.callLater(0.1, self.giveWorkToWorkers)
 
         if requeue and not self.shutdown:
             reactor.callLater(5, self.giveWorkToWorkers, True)
@@ -871,6 +969,7 @@ class ZenHub(ZCmdBase):
                  '\tOther:\t%s' % len(self.workList.otherworklist),
                  '\tApplyDataMaps:\t%s' % len(self.workList.applyworklist),
                  '\tTotal:\t%s' % len(self.workList),
+                 '\tIn flight:\t%s' % len(self.inFlight),
                  '\nHub Execution Timings: [method, count, idle_total, running_total, last_called_time]'
                  ]
 
@@ -880,6 +979,12 @@ class ZenHub(ZCmdBase):
                          (method, stats[0], stats[1], stats[2],
                           time.strftime("%Y-%d-%m %H:%M:%S", time.localtime(stats[3]))))
 
+        lines.append('\nInvalidations: %d waiting to be filtered, %d waiting to be dispatched'
+                     % (self._invalidationFilterBacklog, self._invalidationDispatchBacklog))
+        lines.append('Invalidation Filter Timings: [filter, calls, total_time]')
+        for name, stats in sorted(self._invalidationFilterTimer.iteritems(), key=lambda v: -v[1][1]):
+            lines.append(" - %-48s %8d %12.2f" % (name, stats[0], stats[1]))
+
         lines.append('\nWorker Stats:')
         for wId, worker in enumerate(self.workers):
             stat = self.workTracker.get(wId, None)
@@ -981,6 +1086,9 @@ class ZenHub(ZCmdBase):
         r.gauge('services', len(self.services))
         r.counter('totalCallTime', totalTime)
         r.gauge('workListLength', len(self.workList))
+        r.gauge('workersInFlight', len(self.inFlight))
+        r.gauge('invalidationBacklog',
+                self._invalidationFilterBacklog + self._invalidationDispatchBacklog)
         for name, value in self.counters.items():
             r.counter(name, value)
 
@@ -1064,6 +1172,19 @@ class ZenHub(ZCmdBase):
         self.parser.add_option('--invalidation-poll-interval', 
             type='int', default=30,
             help="Interval at which to poll invalidations (default: %default)")
+        self.parser.add_option('--invalidation-chunk-size',
+            type='int', default=100,
+            help="Number of invalidated oids filtered between returns to the "
+                 "event loop (default: %default)")
+        self.parser.add_option('--invalidation-backlog-limit',
+            type='int', default=10000,
+            help="Stop polling invalidations while more than this many are "
+                 "waiting to be dispatched (default: %default)")
+        self.parser.add_option('--result-cache-size', dest='resultCacheSize',
+            type='int', default=100,
+            help="Number of results of configuration calls to workers kept "
+                 "per service until the model changes; 0 disables "
+                 "(default: %default)")
 
         notify(ParserReadyForOptionsEvent(self.parser))
 
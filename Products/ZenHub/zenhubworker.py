@@ -11,7 +11,8 @@
 import Globals
 from Products.DataCollector.Plugins import loadPlugins
 from Products.ZenHub import PB_PORT
-from Products.ZenHub.zenhub import LastCallReturnValue
+from Products.ZenHub.zenhub import LastCallReturnValue, pickleChunks, \
+    unpickleChunks
 from Products.ZenHub.PBDaemon import translateError, RemoteConflictError
 from Products.ZenUtils.Time import isoDateTime
 from Products.ZenUtils.ZCmdBase import ZCmdBase
@@ -23,11 +24,11 @@ unused(DataMaps)
 
 from twisted.cred import credentials
 from twisted.spread import pb
+from twisted.spread.jelly import unjelly, globalSecurity
 from twisted.internet import defer, reactor, error
 from ZODB.POSException import ConflictError
 from collections import defaultdict
 
-import cPickle as pickle
 import time
 import signal
 import os
@@ -167,11 +168,9 @@ class zenhubworker(ZCmdBase, pb.Referenceable):
         @type method: string
         @param method: the name of the called method, like getPingTree
 
-        @type args: tuple
-        @param args: arguments to the method
-
-        @type kw: dictionary
-        @param kw: keyword arguments to the method
+        @type args: list
+        @param args: chunks of the pickled, jellied arguments and keyword
+            arguments to the method, as received by zenhub
         """
         svcstr = service.rpartition('.')[-1]
         self.current = "%s/%s" % (svcstr, method)
@@ -185,8 +184,9 @@ class zenhubworker(ZCmdBase, pb.Referenceable):
         service = self._getService(service, instance)
         m = getattr(service, 'remote_' + method)
         # now that the service is loaded, we can unpack the arguments
-        joinedArgs = "".join(args)
-        args, kw = pickle.loads(joinedArgs)
+        jelliedArgs, jelliedKw = unpickleChunks(args)
+        args = unjelly(jelliedArgs, globalSecurity)
+        kw = unjelly(jelliedKw, globalSecurity)
 
         # see if this is our last call
         self.numCalls += 1
@@ -196,13 +196,7 @@ class zenhubworker(ZCmdBase, pb.Referenceable):
             res = m(*args, **kw)
             if lastCall:
                 res = LastCallReturnValue(res)
-            pickled_res = pickle.dumps(res, pickle.HIGHEST_PROTOCOL)
-            chunkedres=[]
-            chunkSize = 102400
-            while pickled_res:
-                chunkedres.append(pickled_res[:chunkSize])
-                pickled_res = pickled_res[chunkSize:]
-            return chunkedres
+            return pickleChunks(res)
         try:
             for i in range(4):
                 try:
@@ -37,6 +37,33 @@ from Products.ZenRRD.utils import rpneval
 
 NaN = float('nan')
 
+
+def rangeViolation(minimum, maximum, value):
+    """
+    Compare a value with min/max bounds.
+
+    @param minimum: lower bound, or None
+    @param maximum: upper bound, or None
+    @param value: numeric value
+    @return: the violated bound and how it was violated ('exceeded', 'not
+        met' or 'violated'), or (None, None) if the value is within bounds
+    @rtype: tuple
+    """
+    minbounds = minimum is None or value >= minimum
+    maxbounds = maximum is None or value <= maximum
+    outbounds = None not in (minimum, maximum) and minimum > maximum
+
+    if outbounds:
+        if not maxbounds and not minbounds:
+            return maximum, 'violated'
+    else:
+        if not maxbounds:
+            return maximum, 'exceeded'
+        elif not minbounds:
+            return minimum, 'not met'
+    return None, None
+
+
 class MinMaxThreshold(ThresholdClass):
     """
     Threshold class that can evaluate RPNs and Python expressions
@@ -206,27 +233,19 @@ class MinMaxThresholdInstance(MetricThresholdInstance):
         if isinstance(value, basestring):
             value = float(value)
 
-        # Check the boundaries
-        minbounds = self.minimum is None or value >= self.minimum
-        maxbounds = self.maximum is None or value <= self.maximum
-        outbounds = None not in (self.minimum, self.maximum) and \
-                    self.minimum > self.maximum
+        thresh, how = rangeViolation(self.minimum, self.maximum, value)
+        return self.rangeEvents(dp, value, thresh, how)
 
-        thresh = None
-        how = None
-
-        if outbounds:
-            if not maxbounds and not minbounds:
-                thresh = self.maximum
-                how = 'violated'
-        else:
-            if not maxbounds:
-                thresh = self.maximum
-                how = 'exceeded'
-            elif not minbounds:
-                thresh = self.minimum
-                how = 'not met'
+    def rangeEvents(self, dp, value, thresh, how):
+        """
+        Return the events for a value checked against the thresholds bounds.
 
+        @param dp: datapoint name
+        @param value: numeric value
+        @param thresh: the violated bound, or None
+        @param how: how the bound was violated
+        @rtype: list of dictionaries
+        """
         if thresh is not None:
             severity = self.severity
             count = self.incrementCount(dp)
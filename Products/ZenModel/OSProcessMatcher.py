@@ -13,7 +13,10 @@ import os
 import time
 import signal
 from contextlib import contextmanager
+import sre_parse
 from sre_parse import parse_template
+from sre_constants import LITERAL, GROUPREF, GROUPREF_EXISTS, \
+    SRE_FLAG_IGNORECASE
 from md5 import md5
 
 from Products.ZenUtils.Utils import prepId
@@ -45,9 +48,16 @@ class OSProcessClassMatcher(object):
         if not processText: return False
         processText = processText.strip()
         if self._searchIncludeRegex(processText):
-            return not self._searchExcludeRegex(processText)
+            return self._matchesIncluded(processText)
         return False
 
+    def _matchesIncluded(self, processText):
+        """
+        Does the stripped process text, already known to match the
+        includeRegex, match this process matcher?
+        """
+        return not self._searchExcludeRegex(processText)
+
     def generateId(self, processText):
         """
         Generate the unique ID of the OSProcess that the process belongs
@@ -186,8 +196,8 @@ class OSProcessMatcher(OSProcessClassMatcher):
         self.processClassPrimaryUrlPath(): string
         self.generatedId: string
     """
-    def matches(self, processText):
-        if super(OSProcessMatcher, self).matches(processText):
+    def _matchesIncluded(self, processText):
+        if super(OSProcessMatcher, self)._matchesIncluded(processText):
             generatedId = getattr(self,'generatedId',False)
             return self.generateId(processText) == generatedId
         return False
@@ -210,6 +220,180 @@ class OSProcessClassDataMatcher(DataHolder, OSProcessClassMatcher):
 class OSProcessDataMatcher(DataHolder, OSProcessMatcher):
     pass
 
+# most capturing groups in one combined regex; python's re allows 100
+_MAX_COMBINED_GROUPS = 99
+
+def _hasGroupRefs(items):
+    for item in items:
+        if isinstance(item, tuple) and item and item[0] in (GROUPREF, GROUPREF_EXISTS):
+            return True
+        if isinstance(item, (tuple, list, sre_parse.SubPattern)):
+            if _hasGroupRefs(item):
+                return True
+    return False
+
+def _requiredLiteral(parsed):
+    """
+    Return the longest literal text that every match of a parsed regex
+    contains, or None if there is none.
+    """
+    if parsed.pattern.flags & SRE_FLAG_IGNORECASE:
+        return None
+    best = run = ''
+    for op, av in parsed:
+        if op == LITERAL and av < 128:
+            run += chr(av)
+            if len(run) > len(best):
+                best = run
+        else:
+            run = ''
+    return best or None
+
+class _IncludeGroup(object):
+    """
+    Matchers sharing an includeRegex.
+    """
+    __slots__ = ('position', 'regex', 'literal', 'matchers')
+
+    def __init__(self, position, regex, literal):
+        self.position = position
+        self.regex = regex
+        self.literal = literal
+        self.matchers = []
+
+class _Chunk(object):
+    """
+    Include groups searched for at once with a combined regex; regex is None
+    when the groups have to be searched for one by one.
+    """
+    __slots__ = ('regex', 'groups', 'groupByIndex')
+
+    def __init__(self, regex, groups, groupByIndex):
+        self.regex = regex
+        self.groups = groups
+        self.groupByIndex = groupByIndex
+
+class OSProcessMatcherIndex(object):
+    """
+    Finds the first of a sequence of matchers matching a process, as
+    trying each matcher's matches method in turn would, without searching
+    every includeRegex for every process.
+
+    Matchers are grouped by includeRegex, so a regex shared by many matchers
+    is searched for once.  Groups whose regex requires some literal text are
+    skipped for processes without it, and the regexes of the groups are
+    combined into a few alternations, so that one search rules out many
+    groups.  A combined regex reports the group it matched by the capturing
+    group it wraps the group's regex in.
+
+    The index must be rebuilt when the regexes of the matchers change.
+
+    @param matchers: OSProcessClassMatcher or OSProcessMatcher instances,
+        in the order they are tried
+    @type matchers: sequence
+    """
+
+    def __init__(self, matchers):
+        groups = {}
+        self._groups = []
+        combinable = []
+        for position, matcher in enumerate(matchers):
+            regex = matcher._compiledRegex('includeRegex')
+            if regex is None:
+                continue
+            group = groups.get(matcher.includeRegex)
+            if group is None:
+                try:
+                    parsed = sre_parse.parse(matcher.includeRegex)
+                except Exception:
+                    parsed = None
+                literal = _requiredLiteral(parsed) if parsed else None
+                group = _IncludeGroup(position, regex, literal)
+                groups[matcher.includeRegex] = group
+                self._groups.append(group)
+                # inline flags apply to the whole of a combined regex
+                combinable.append(parsed is not None and
+                                  not _hasGroupRefs(parsed) and
+                                  parsed.pattern.flags == 0)
+            group.matchers.append((position, matcher))
+        self._chunks = self._buildChunks(combinable)
+
+    def _buildChunks(self, combinable):
+        chunks = []
+        pending = []
+        groupCount = 0
+        for group, canCombine in zip(self._groups, combinable):
+            if not canCombine:
+                chunks.extend(self._combine(pending))
+                pending = []
+                groupCount = 0
+                chunks.append(_Chunk(None, [group], {}))
+                continue
+            size = group.regex.groups + 1
+            if pending and groupCount + size > _MAX_COMBINED_GROUPS:
+                chunks.extend(self._combine(pending))
+                pending = []
+                groupCount = 0
+            pending.append(group)
+            groupCount += size
+        chunks.extend(self._combine(pending))
+        return chunks
+
+    def _combine(self, groups):
+        if not groups:
+            return []
+        groupByIndex = {}
+        patterns = []
+        index = 1
+        for group in groups:
+            groupByIndex[index] = group
+            patterns.append('(%s)' % group.regex.pattern)
+            index += group.regex.groups + 1
+        if len(groups) > 1 and index - 1 <= _MAX_COMBINED_GROUPS:
+            try:
+                regex = re.compile('|'.join(patterns))
+                return [_Chunk(regex, groups, groupByIndex)]
+            except Exception as e:
+                log.debug("Unable to combine process regexes: %s", e)
+        return [_Chunk(None, [group], {}) for group in groups]
+
+    def match(self, processText):
+        """
+        Return the first matcher matching the process, or None.
+
+        @param processText: the process name and parameters
+        @type processText: string
+        """
+        if not processText:
+            return None
+        processText = processText.strip()
+        best = None
+        for chunk in self._chunks:
+            if best is not None and chunk.groups[0].position > best[0]:
+                break
+            found = None
+            if chunk.regex is not None:
+                m = chunk.regex.search(processText)
+                if m is None:
+                    continue
+                # the regex wrapping a group closes last
+                found = chunk.groupByIndex.get(m.lastindex)
+            for group in chunk.groups:
+                if best is not None and group.position > best[0]:
+                    break
+                if group is not found:
+                    if group.literal is not None and group.literal not in processText:
+                        continue
+                    if not group.regex.search(processText):
+                        continue
+                for position, matcher in group.matchers:
+                    if best is not None and position > best[0]:
+                        break
+                    if matcher._matchesIncluded(processText):
+                        best = (position, matcher)
+                        break
+        return best[1] if best is not None else None
+
 def applyOSProcessClassMatchers(matchers, lines):
     """
     @return (matched, unmatched), where...
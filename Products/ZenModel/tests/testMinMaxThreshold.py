@@ -152,6 +152,32 @@ class TestMinMaxThreshold(ZenModelBaseTest):
         self.assert_(result[0]['current'] == 100)
         self.assert_(result[0]['how'] == 'violated')
 
+    def testCheckBatch(self):
+        from Products.ZenRRD.Thresholds import Thresholds
+        self.threshold.minimum = 10
+        self.threshold.maximum = 100
+        self.threshold.dataPointNames = ['ds_dp']
+        thresholds = Thresholds()
+        thresholds.update(self.threshold)
+        contextKey = self.threshold.context().contextKey
+
+        results = thresholds.checkBatch([
+            (contextKey, 'ds_dp', 0, 50),
+            (contextKey, 'other_dp', 0, 500),
+            (contextKey, 'ds_dp', 0, '500'),
+            (contextKey, 'ds_dp', 0, None),
+            ('unknown', 'ds_dp', 0, 5),
+        ])
+        self.assertEqual([i for i, events in results], [0, 2])
+        self.assertEqual(results[0][1][0]['severity'], Event.Clear)
+        self.assertEqual(results[1][1][0]['how'], 'exceeded')
+        self.assertEqual(results[1][1][0]['current'], 500.0)
+
+        # batches and single checks share threshold state
+        events = thresholds.check(contextKey, 'ds_dp', 0, 5)
+        self.assertEqual(events[0]['how'], 'not met')
+        self.assertEqual(self.threshold.getCount('ds_dp'), 2)
+
 
 def test_suite():
     from unittest import TestSuite, makeSuite
@@ -0,0 +1,122 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import unittest
+from md5 import md5
+
+from Products.ZenModel.OSProcessMatcher import OSProcessDataMatcher, \
+    OSProcessClassDataMatcher, OSProcessMatcherIndex
+
+PROCESSES = [
+    '/usr/bin/python /opt/zenoss/bin/zenping.py --cycle',
+    '/usr/bin/python /opt/zenoss/bin/zenprocess.py --cycle',
+    'java -server -Xmx1g org.zenoss.zep.Main',
+    '/usr/sbin/sshd -D',
+    'sshd: zenoss@pts/0',
+    '/sbin/mingetty tty1',
+    '/sbin/mingetty tty2',
+    'abcabc',
+    'ABC',
+    'SSHD',
+    '  /usr/sbin/httpd -k start  ',
+    '',
+]
+
+
+def processMatcher(name, include, exclude=None, replace='.*', replacement=None):
+    replacement = replacement or name
+    return OSProcessDataMatcher(
+        includeRegex=include,
+        excludeRegex=exclude,
+        replaceRegex=replace,
+        replacement=replacement,
+        primaryUrlPath='url',
+        generatedId='url_' + md5(replacement).hexdigest())
+
+
+def firstMatch(matchers, processText):
+    for matcher in matchers:
+        if matcher.matches(processText):
+            return matcher
+
+
+class OSProcessMatcherIndexTest(unittest.TestCase):
+
+    def assertSameMatches(self, matchers):
+        index = OSProcessMatcherIndex(matchers)
+        for processText in PROCESSES:
+            self.assertTrue(index.match(processText) is
+                            firstMatch(matchers, processText), processText)
+
+    def testSharedIncludeRegex(self):
+        self.assertSameMatches([
+            processMatcher('zenping', 'python', replace=r'.*(zen\w+)\.py.*',
+                           replacement='zenping'),
+            processMatcher('zenprocess', 'python', replace=r'.*(zen\w+)\.py.*',
+                           replacement='zenprocess'),
+            processMatcher('java', 'java', exclude='Main'),
+            processMatcher('any java', r'.*java.*'),
+        ])
+
+    def testFirstMatcherWins(self):
+        matchers = [
+            processMatcher('sshd', 'sshd'),
+            processMatcher('mingetty', 'mingetty'),
+            processMatcher('everything', '.*'),
+            processMatcher('sshd again', r'ss(h)d'),
+        ]
+        self.assertSameMatches(matchers)
+        index = OSProcessMatcherIndex(matchers)
+        self.assertTrue(index.match('sshd: zenoss@pts/0') is matchers[0])
+        self.assertTrue(index.match('/sbin/mingetty tty1') is matchers[1])
+        self.assertTrue(index.match('ABC') is matchers[2])
+
+    def testUncombinableRegexes(self):
+        self.assertSameMatches([
+            processMatcher('backref', r'(abc)\1'),
+            processMatcher('named', r'(?P<x>mingetty)'),
+            processMatcher('named again', r'(?P<x>sshd)'),
+            processMatcher('ignorecase', '(?i)abc'),
+            processMatcher('verbose', '(?x) http d'),
+            processMatcher('invalid', '(unbalanced'),
+        ])
+
+    def testInlineFlagsNotShared(self):
+        matchers = [
+            processMatcher('ignorecase', '(?i)abc'),
+            processMatcher('sshd', 'sshd'),
+            processMatcher('multiline', '(?m)^mingetty'),
+            processMatcher('tty', 'tty$'),
+        ]
+        self.assertSameMatches(matchers)
+        index = OSProcessMatcherIndex(matchers)
+        self.assertTrue(index.match('SSHD') is None)
+        self.assertTrue(index.match('ABC') is matchers[0])
+
+    def testManyRegexes(self):
+        matchers = [processMatcher('tty%d' % i, '(mingetty) (tty%d)$' % i)
+                    for i in range(100)]
+        matchers.append(processMatcher('sshd', 'sshd'))
+        self.assertSameMatches(matchers)
+
+    def testProcessClassMatchers(self):
+        matchers = [
+            OSProcessClassDataMatcher(includeRegex='mingetty', excludeRegex='tty2'),
+            OSProcessClassDataMatcher(includeRegex='tty'),
+        ]
+        index = OSProcessMatcherIndex(matchers)
+        self.assertTrue(index.match('/sbin/mingetty tty1') is matchers[0])
+        self.assertTrue(index.match('/sbin/mingetty tty2') is matchers[1])
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(OSProcessMatcherIndexTest))
+    return suite
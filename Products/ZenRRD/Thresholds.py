@@ -11,6 +11,10 @@
 import logging
 log = logging.getLogger('zen.thresholds')
 
+from Products.ZenModel.MinMaxThreshold import MinMaxThresholdInstance, \
+        rangeViolation
+
+
 class Thresholds:
     "Class for holding multiple Thresholds, used in most collectors"
 
@@ -18,9 +22,11 @@ class Thresholds:
         self.byKey = {}
         self.byContextKey = {}
         self.byDevice = {}
+        # contextKey -> [(threshold, dp, isMinMax)], see _batchEntries
+        self._batchByContextKey = {}
 
     def _contextKey(self, contextKey, dp):
-        return '%s/%s' % (contextKey, dp)
+        return (contextKey, dp)
 
 
     def remove(self, threshold):
@@ -29,6 +35,7 @@ class Thresholds:
             del d[threshold.key()]
         doomed = self.byKey.get(threshold.key(), None)
         if doomed:
+            self._batchByContextKey.clear()
             del self.byKey[doomed.key()]
             ctx = doomed.context()
             for dp in doomed.dataPoints():
@@ -41,6 +48,7 @@ class Thresholds:
         return doomed
 
     def add(self, threshold):
+        self._batchByContextKey.clear()
         self.byKey[threshold.key()] = threshold
         d = self.byDevice.setdefault(threshold.context().deviceName, {})
         d[threshold.key()] = threshold
@@ -86,6 +94,55 @@ class Thresholds:
                     result.extend(events)
         return result
 
+    def _batchEntries(self, contextKey):
+        """
+        Return the thresholds to check for contextKey, flagging the plain
+        min/max thresholds whose bounds can be compared without a call
+        through checkValue.
+        """
+        entries = self._batchByContextKey.get(contextKey)
+        if entries is None:
+            entries = [(t, dp, type(t) is MinMaxThresholdInstance)
+                       for t, dp in self.byContextKey.get(contextKey, ())]
+            self._batchByContextKey[contextKey] = entries
+        return entries
+
+    def checkBatch(self, values):
+        """
+        Check a collection cycle's worth of values.
+
+        @param values: (contextId, datapoint, timeAt, value) tuples
+        @type values: sequence
+        @return: (position in values, events) for every value that
+            produced events
+        @rtype: list of tuples
+        """
+        results = []
+        byContextKey = self.byContextKey
+        for i, (contextId, datapoint, timeAt, value) in enumerate(values):
+            contextKey = (contextId, datapoint)
+            if contextKey not in byContextKey:
+                continue
+            events = []
+            try:
+                for t, dp, isMinMax in self._batchEntries(contextKey):
+                    if not isMinMax:
+                        evts = t.checkValue(dp, timeAt, value)
+                        if evts:
+                            events.extend(evts)
+                    elif value is not None:
+                        number = value
+                        if isinstance(number, basestring):
+                            number = float(number)
+                        thresh, how = rangeViolation(t.minimum, t.maximum, number)
+                        events.extend(t.rangeEvents(dp, number, thresh, how))
+            except Exception:
+                log.exception("Unable to check value %s on %s/%s",
+                              value, contextId, datapoint)
+            if events:
+                results.append((i, events))
+        return results
+
 def test():
     pass
 
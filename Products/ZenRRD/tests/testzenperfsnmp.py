@@ -0,0 +1,108 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+from twisted.internet import defer, error
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+from Products.ZenRRD.zenperfsnmp import SnmpPerformanceCollectionTask
+
+
+class SnmpConnInfo(object):
+    zSnmpTimeout = 2.5
+
+
+class WindowTask(SnmpPerformanceCollectionTask):
+
+    def __init__(self, maxWindow, limiter, maxTimeouts=3):
+        # only what fetching oid chunks uses
+        self._devId = 'device1'
+        self._manageIp = '10.0.0.1'
+        self._snmpConnInfo = SnmpConnInfo()
+        self._maxTimeouts = maxTimeouts
+        self._maxWindow = maxWindow
+        self._window = 1
+        self._requestLimiter = limiter
+        self.requests = []
+
+    def _checkTaskTime(self):
+        pass
+
+    def _fetchPerfChunk(self, oid_chunk):
+        d = defer.Deferred()
+        self.requests.append((oid_chunk, d))
+        return d
+
+
+def results(d):
+    fired = []
+    d.addBoth(fired.append)
+    return fired
+
+
+class TestRequestWindow(BaseTestCase):
+
+    def chunks(self, n):
+        return [['1.3.6.1.2.1.2.2.1.10.%d' % i] for i in range(n)]
+
+    def testWindowGrows(self):
+        task = WindowTask(3, defer.DeferredSemaphore(10))
+        fired = results(task._fetchChunks(self.chunks(6)))
+        self.assertEquals(1, len(task.requests))
+        task.requests[0][1].callback(None)
+        self.assertEquals(2, task._window)
+        self.assertEquals(3, len(task.requests))
+        task.requests[1][1].callback(None)
+        # up to --requestwindow requests are outstanding
+        self.assertEquals(3, task._window)
+        self.assertEquals(5, len(task.requests))
+        for chunk, d in task.requests[2:]:
+            d.callback(None)
+        self.assertEquals(6, len(task.requests))
+        self.assertEquals([], fired)
+        task.requests[5][1].callback(None)
+        self.assertEquals([None], fired)
+        self.assertEquals(3, task._window)
+
+    def testTimeoutsShrinkWindow(self):
+        task = WindowTask(4, defer.DeferredSemaphore(10), maxTimeouts=2)
+        task._window = 4
+        fired = results(task._fetchChunks(self.chunks(6)))
+        self.assertEquals(4, len(task.requests))
+        task.requests[0][1].errback(error.TimeoutError())
+        self.assertEquals(2, task._window)
+        self.assertEquals(4, len(task.requests))
+        task.requests[1][1].errback(error.TimeoutError())
+        self.assertEquals(1, task._window)
+        # no more chunks are sent, but the outstanding requests finish
+        self.assertEquals([], fired)
+        task.requests[2][1].callback(None)
+        task.requests[3][1].callback(None)
+        self.assertEquals(4, len(task.requests))
+        self.assertEquals(1, len(fired))
+        self.assertTrue(fired[0].check(error.TimeoutError))
+
+    def testRequestsLimitedAcrossDevices(self):
+        limiter = defer.DeferredSemaphore(1)
+        task1 = WindowTask(4, limiter)
+        task2 = WindowTask(4, limiter)
+        task1._window = task2._window = 2
+        results(task1._fetchChunks(self.chunks(2)))
+        results(task2._fetchChunks(self.chunks(2)))
+        self.assertEquals(1, len(task1.requests))
+        self.assertEquals(0, len(task2.requests))
+        task1.requests[0][1].callback(None)
+        self.assertEquals(2, len(task1.requests) + len(task2.requests))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestRequestWindow))
+    return suite
@@ -857,6 +857,30 @@ class TestZenprocess(BaseTestCase):
                                             '.1.3.6.1.2.1.25.4.2.1.5.2': 'arbitrary arguments'}}
         self.compareTestData(data, task, self.expected(PROCESSES=18, AFTERBYCONFIG=9, MISSING=0))
 
+    def testMatchCache(self):
+        self.printTestTitle("testMatchCache")
+
+        procDefs = {}
+        self.updateProcDefs(procDefs, 'myapp', 'myapp', 'nothing')
+        task = self.makeTask(procDefs)
+        procs = [(1, '/dummy_processes/myapp arbitrary arguments'),
+                 (2, '/dummy_processes/otherapp arbitrary arguments')]
+
+        deviceStats = task._deviceStats
+        self.assertEqual(deviceStats.matchProcesses(procs).keys(), [1])
+        index = deviceStats._matcherIndex
+        # an unchanged configuration keeps the index and the matches
+        deviceStats.update(TaskConfig(procDefs=procDefs))
+        self.assertEqual(deviceStats.matchProcesses(procs).keys(), [1])
+        self.assertTrue(deviceStats._matcherIndex is index)
+        self.assertEqual(sorted(deviceStats._matchCache), procs)
+
+        # a changed regex matches the processes again
+        self.updateProcDefs(procDefs, 'myapp', 'otherapp', 'nothing')
+        deviceStats.update(TaskConfig(procDefs=procDefs))
+        self.assertEqual(deviceStats.matchProcesses(procs).keys(), [2])
+        self.assertFalse(deviceStats._matcherIndex is index)
+
     def testMapResultsToDicts(self):
 
         values = {'.1.3.6.1.2.1.25.4.2.1.2': {'.1.3.6.1.2.1.25.4.2.1.2.1': 'myapp',
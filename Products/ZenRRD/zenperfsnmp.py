@@ -18,6 +18,7 @@ Gets SNMP performance data and stores it in RRD files.
 from datetime import datetime, timedelta
 from collections import deque
 import random
+import time
 import logging
 log = logging.getLogger("zen.zenperfsnmp")
 
@@ -29,6 +30,7 @@ from twisted.python.failure import Failure
 from pynetsnmp.twistedsnmp import AgentProxy, snmpprotocol, Snmpv3Error
 from pynetsnmp.netsnmp import SnmpTimeoutError, SnmpError
 
+from Products.ZenCollector.badoids import isolateBadOids, getBadOidStore
 from Products.ZenCollector.daemon import CollectorDaemon
 from Products.ZenCollector.interfaces import ICollectorPreferences,\
                                              IDataService,\
@@ -54,6 +56,16 @@ unused(SnmpConnInfo)
 COLLECTOR_NAME = "zenperfsnmp"
 MAX_BACK_OFF_MINUTES = 20
 
+# Limits the number of SNMP requests outstanding across all devices
+_requestLimiter = None
+
+def getRequestLimiter(preferences):
+    global _requestLimiter
+    if _requestLimiter is None:
+        _requestLimiter = defer.DeferredSemaphore(
+            max(1, preferences.options.maxOutstandingRequests))
+    return _requestLimiter
+
 
 class SnmpPerformanceCollectionPreferences(object):
     zope.interface.implements(ICollectorPreferences)
@@ -100,6 +112,19 @@ class SnmpPerformanceCollectionPreferences(object):
                           type='int',
                           help="How many consecutive time outs per cycle before stopping attempts to collect")
 
+        parser.add_option('--requestwindow',
+                          dest='requestWindow',
+                          default=4,
+                          type='int',
+                          help="Maximum number of SNMP requests outstanding to a single device. The number "\
+                                "in use grows while the device answers quickly and shrinks on time outs")
+
+        parser.add_option('--maxoutstandingrequests',
+                          dest='maxOutstandingRequests',
+                          default=1000,
+                          type='int',
+                          help="Maximum number of SNMP requests outstanding across all devices")
+
 
     def postStartup(self):
         pass
@@ -170,11 +195,20 @@ class SnmpPerformanceCollectionTask(BaseTask):
         self._oids = self._device.oids
         self._oidDeque = deque(self._oids.keys())
         self._good_oids = set()
-        #oids not returning data
-        self._bad_oids = set()
+        #oids not returning data, remembered across restarts
+        self._badOidStore = getBadOidStore(COLLECTOR_NAME, self._preferences.options)
+        self._bad_oids = self._badOidStore.get(self._devId) & set(self._oids)
+        self._savedBadOids = set(self._bad_oids)
+        # chunks that returned no data at all during _fetchChunks
+        self._failedChunks = []
         self._snmpPort = snmpprotocol.port()
         self.triesPerCycle = max(2, self._preferences.options.triesPerCycle)
         self._maxTimeouts = self._preferences.options.maxTimeouts
+        # number of requests kept outstanding to the device, adjusted to
+        # its response times and time outs
+        self._maxWindow = max(1, self._preferences.options.requestWindow)
+        self._window = 1
+        self._requestLimiter = getRequestLimiter(self._preferences)
 
         self._lastErrorMsg = ''
         self._cycleExceededCount = 0
@@ -248,37 +282,104 @@ class SnmpPerformanceCollectionTask(BaseTask):
         chunk_size = self._maxOidsPerRequest
         maxTries = self.triesPerCycle
         try_count = 0
-        consecutiveTimeouts = 0
         while oids_to_test and try_count < maxTries:
             try_count += 1
             if try_count > 1:
                 log.debug("%s [%s] some oids still uncollected after %s tries, trying again with chunk size %s", self._devId,
                           self._manageIp, try_count - 1, chunk_size)
             oid_chunks = self.chunk(oids_to_test, chunk_size)
-            for oid_chunk in oid_chunks:
+            # chunks that fail to return data contain one or more bad oids; they are split until the bad oids are
+            # found. Can still have uncollected good oids because of timeouts
+            yield isolateBadOids(oid_chunks, self._fetchChunksFailed)
+            oids_to_test = list(self._uncollectedOids())
+
+    @defer.inlineCallbacks
+    def _fetchChunksFailed(self, oid_chunks):
+        """
+        Fetch oid chunks and return the chunks that returned no data.
+        """
+        self._failedChunks = []
+        try:
+            yield self._fetchChunks(oid_chunks)
+            defer.returnValue(self._failedChunks)
+        finally:
+            self._failedChunks = []
+
+
+
+    def _fetchChunks(self, oid_chunks):
+        """
+        Fetch oid chunks, keeping up to self._window requests outstanding.
+
+        The window grows by one for every chunk answered in less than half
+        the SNMP timeout, up to the --requestwindow limit, and is halved on
+        every time out.  No more chunks are sent once the task runs out of
+        time, on a SnmpTimeoutError or after --maxtimeouts consecutive time
+        outs; the returned Deferred fails with that error once the requests
+        already sent have finished.
+
+        @param oid_chunks: lists of oids to get in one request each
+        @type oid_chunks: sequence
+        @return: Deferred firing when all chunks have been fetched
+        """
+        finished = defer.Deferred()
+        pending = deque(oid_chunks)
+        state = {'outstanding': 0, 'timeouts': 0, 'failure': None}
+        fastResponse = self._snmpConnInfo.zSnmpTimeout / 2.0
+
+        def fetch(oid_chunk):
+            start = time.time()
+            d = self._fetchPerfChunk(oid_chunk)
+            d.addCallback(lambda result: time.time() - start)
+            return d
+
+        def success(latency, oid_chunk):
+            log.debug("Finished fetchPerfChunk call %s [%s] in %.2fs", self._devId, self._manageIp, latency)
+            state['timeouts'] = 0
+            if latency < fastResponse:
+                self._window = min(self._maxWindow, self._window + 1)
+
+        def failed(reason, oid_chunk):
+            if reason.check(error.TimeoutError):
+                log.debug("timeout for %s [%s] oids - %s", self._devId, self._manageIp, oid_chunk)
+                self._window = max(1, self._window // 2)
+                state['timeouts'] += 1
+                if state['timeouts'] < self._maxTimeouts:
+                    return
+                log.debug("%s consecutive timeouts, abandoning run for %s [%s]", state['timeouts'],
+                          self._devId, self._manageIp)
+            elif reason.check(SnmpTimeoutError):
+                # only seem to get these for V3 and subsequent calls throw credential exceptions, so just bail here
+                log.debug("SnmpTimeoutError for %s [%s] oids - %s", self._devId, self._manageIp, oid_chunk)
+            if state['failure'] is None:
+                state['failure'] = reason
+
+        def complete(result):
+            state['outstanding'] -= 1
+            sendMore()
+
+        def sendMore():
+            while pending and state['failure'] is None and state['outstanding'] < self._window:
                 try:
                     self._checkTaskTime()
-                    log.debug("Fetching OID chunk size %s from %s [%s] - %s", chunk_size, self._devId, self._manageIp, oid_chunk)
-                    yield self._fetchPerfChunk(oid_chunk)
-                    consecutiveTimeouts = 0
-                    log.debug("Finished fetchPerfChunk call %s [%s]", self._devId, self._manageIp)
-                except error.TimeoutError as e:
-                    log.debug("timeout for %s [%s] oids - %s", self._devId, self._manageIp, oid_chunk)
-                    consecutiveTimeouts += 1
-                    if consecutiveTimeouts >= self._maxTimeouts:
-                        log.debug("%s consecutive timeouts, abandoning run for %s [%s]", consecutiveTimeouts,
-                                  self._devId, self._manageIp)
-                        raise
-                except SnmpTimeoutError as e:
-                    # only seem to get these for V3 and subsequent calls throw credential exceptions, so just bail here
-                    log.debug("SnmpTimeoutError for %s [%s] oids - %s", self._devId, self._manageIp, oid_chunk)
-                    raise
-            # can still have untested oids from a chunk that failed to return data, one or more of those may be bad.
-            # run with a smaller chunk size to identify bad oid. Can also have uncollected good oids because of timeouts
-            oids_to_test = list(self._uncollectedOids())
-            chunk_size = 1
-    
+                except Exception:
+                    state['failure'] = Failure()
+                    break
+                oid_chunk = pending.popleft()
+                log.debug("Fetching OID chunk size %s from %s [%s] (window %s) - %s", len(oid_chunk), self._devId,
+                          self._manageIp, self._window, oid_chunk)
+                state['outstanding'] += 1
+                d = self._requestLimiter.run(fetch, oid_chunk)
+                d.addCallbacks(success, failed, callbackArgs=(oid_chunk,), errbackArgs=(oid_chunk,))
+                d.addBoth(complete)
+            if state['outstanding'] == 0 and not finished.called:
+                if state['failure'] is not None:
+                    finished.errback(state['failure'])
+                else:
+                    finished.callback(None)
 
+        sendMore()
+        return finished
 
     @defer.inlineCallbacks
     def _fetchPerfChunk(self, oid_chunk):
@@ -310,9 +411,10 @@ class SnmpPerformanceCollectionTask(BaseTask):
                 self._addBadOids(oid_chunk)
                 log.warn("No return result, marking as bad oid: {%s} {%s}" % (self.configId, oid_chunk))
             else:
-                log.warn("No return result, will run in separately to determine which oids are valid: {%s} {%s}" % (
+                log.warn("No return result, will split request to determine which oids are valid: {%s} {%s}" % (
                 self.configId, oid_chunk))
                 self.remove_from_good_oids(oid_chunk)
+                self._failedChunks.append(oid_chunk)
 
         else:
             for oid in oid_chunk:
@@ -322,6 +424,7 @@ class SnmpPerformanceCollectionTask(BaseTask):
                     self._addBadOids([oid])
             self.state=SnmpPerformanceCollectionTask.STATE_STORE_PERF
             try:
+                batch = []
                 for oid, value in update.items():
 
                     if oid not in self._oids:
@@ -341,15 +444,14 @@ class SnmpPerformanceCollectionTask(BaseTask):
                     # An OID's data can be stored multiple times
                     for rrdMeta in self._oids[oid]:
                         contextId, metric, rrdType, rrdCommand, rrdMin, rrdMax, metadata = rrdMeta
-                        path = metadata.get('contextKey')
-                        try:
-                            # see SnmpPerformanceConfig line _getComponentConfig
-                            yield self._dataService.writeMetricWithMetadata(metric,
-                                    value, rrdType, min=rrdMin, max=rrdMax,
-                                    metadata=metadata)
-                        except Exception, e:
-                            log.exception("Failed to write to metric service: {0} {1.__class__.__name__} {1}".format(path, e))
-                            continue
+                        # see SnmpPerformanceConfig line _getComponentConfig
+                        batch.append(dict(metric=metric, value=value,
+                                          metricType=rrdType, min=rrdMin,
+                                          max=rrdMax, metadata=metadata))
+                try:
+                    yield self._dataService.writeMetrics(batch)
+                except Exception, e:
+                    log.exception("Failed to write to metric service: {0} {1.__class__.__name__} {1}".format(self.configId, e))
             finally:
                 self.state = TaskStates.STATE_RUNNING
 
@@ -552,6 +654,13 @@ class SnmpPerformanceCollectionTask(BaseTask):
             log.info("%s: Detected %s bad oids this cycle", self.name, len(newBadOids))
             log.debug("%s: Bad oids detected - %s", self.name, newBadOids)
 
+        if self._bad_oids != self._savedBadOids:
+            try:
+                self._badOidStore.save(self._devId, self._bad_oids)
+                self._savedBadOids = set(self._bad_oids)
+            except Exception:
+                log.exception("%s: Unable to save bad oids", self.name)
+
     def _logOidsNotCollected(self, reason):
         oidsNotCollected = self._uncollectedOids()
         if oidsNotCollected:
@@ -592,6 +701,8 @@ class SnmpPerformanceCollectionTask(BaseTask):
             self.name, self._cycleExceededCount, self._snmpV3ErrorCount, self._stoppedTaskCount)
         display += "%s OIDs configured: %d \n" % (
             self.name, len(self._oids.keys()))
+        display += "%s Request window: %d of %d\n" % (
+            self.name, self._window, self._maxWindow)
         display += "%s Good OIDs: %d - %s\n" % (
             self.name, len(self._good_oids), self._good_oids)
         display += "%s Bad OIDs: %d - %s\n" % (
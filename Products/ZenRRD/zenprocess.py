@@ -26,6 +26,7 @@ import Globals
 import zope.component
 import zope.interface
 
+from Products.ZenCollector.badoids import isolateBadOids
 from Products.ZenCollector.daemon import CollectorDaemon
 from Products.ZenCollector.interfaces import ICollectorPreferences,\
     IScheduledTask, IEventService, IDataService, IConfigurationListener
@@ -34,7 +35,8 @@ from Products.ZenCollector.tasks import SimpleTaskFactory, SimpleTaskSplitter,\
 from Products.ZenEvents import Event
 from Products.ZenEvents.ZenEventClasses import Status_Snmp, Status_OSProcess,\
     Status_Perf
-from Products.ZenModel.OSProcessMatcher import OSProcessMatcher
+from Products.ZenModel.OSProcessMatcher import OSProcessMatcher, \
+    OSProcessMatcherIndex
 from Products.ZenModel.OSProcessState import determineProcessState
 from Products.ZenUtils.observable import ObservableMixin
 from Products.ZenUtils.Utils import prepId as globalPrepId
@@ -140,6 +142,11 @@ class DeviceStats:
         self._processes = {}
         for id, process in deviceProxy.processes.iteritems():
             self._processes[id] = ProcessStats(process)
+        # index of the ProcessStats, built when the processes are matched
+        self._matcherIndex = None
+        self._matcherKey = None
+        # map (pid, name_with_args) to the matching ProcessStats or None
+        self._matchCache = {}
 
     def update(self, deviceProxy):
         unused = set(self._processes)
@@ -157,6 +164,53 @@ class DeviceStats:
                 if value._config.name == id:
                     del self._pidToProcess[key]
 
+    def _matchers(self):
+        return [p for p in self._processes.itervalues()
+                if p._config.name is not None]
+
+    def _getMatcherIndex(self):
+        """
+        Return the index of the ProcessStats, rebuilding it and forgetting
+        the matched processes when the process configuration changed.
+        """
+        matchers = self._matchers()
+        key = tuple((id(p), p.includeRegex, p.excludeRegex, p.replaceRegex,
+                     p.replacement, p.primaryUrlPath, p.generatedId)
+                    for p in matchers)
+        if self._matcherIndex is None or key != self._matcherKey:
+            self._matcherIndex = OSProcessMatcherIndex(matchers)
+            self._matcherKey = key
+            self._matchCache = {}
+        return self._matcherIndex
+
+    def matchProcesses(self, procs):
+        """
+        Find the ProcessStats each running process belongs to.  Processes
+        seen in the previous scan with the same pid and command line are
+        not matched again.
+
+        @parameter procs: list of (pid, name_with_args)
+        @type procs: list of tuples
+        @return: ProcessStats by pid of the processes which matched one
+        @rtype: dictionary
+        """
+        index = self._getMatcherIndex()
+        previous = self._matchCache
+        self._matchCache = cache = {}
+        pidToProcessStats = {}
+        for proc in procs:
+            pid, name_with_args = proc
+            log.debug("pid: %s --- name_with_args: %s", pid, name_with_args)
+            if proc in previous:
+                pStats = previous[proc]
+            else:
+                pStats = index.match(name_with_args)
+            cache[proc] = pStats
+            if pStats is not None:
+                log.debug("Found process %s belonging to %s", name_with_args, pStats._config)
+                pidToProcessStats[pid] = pStats
+        return pidToProcessStats
+
     @property
     def processStats(self):
         """
@@ -586,16 +640,7 @@ class ZenProcessTask(ObservableMixin):
         @type procs: 
         """
         beforePids = set(self._deviceStats.pids)
-        afterPidToProcessStats = {}
-
-        for pid, name_with_args in procs:
-            log.debug("pid: %s --- name_with_args: %s" % (pid, name_with_args))
-            for pStats in self._deviceStats.processStats:
-                if pStats._config.name is not None:
-                    if pStats.matches(name_with_args):
-                        log.debug("Found process %s belonging to %s", name_with_args, pStats._config)
-                        afterPidToProcessStats[pid] = pStats
-                        break
+        afterPidToProcessStats = self._deviceStats.matchProcesses(procs)
 
         afterPids = set(afterPidToProcessStats)
         afterByConfig = reverseDict(afterPidToProcessStats)
@@ -636,24 +681,25 @@ class ZenProcessTask(ObservableMixin):
         for pid in self._deviceStats.pids:
             oids.extend([CPU + str(pid), MEM + str(pid)])
         if oids:
-            singleOids = set()
             results = {}
-            oidsToTest = oids
-            chunkSize = self._maxOidsPerRequest
-            while oidsToTest:
-                for oidChunk in chunk(oidsToTest, chunkSize):
+
+            @defer.inlineCallbacks
+            def fetchChunks(oidChunks):
+                failed = []
+                for oidChunk in oidChunks:
                     try:
                         log.debug("%s fetching oid(s) %s" % (self._devId, oidChunk))
                         result = yield self._get(oidChunk)
                         results.update(result)
                     except (error.TimeoutError, Snmpv3Error) as e:
                         log.debug("error reading oid(s) %s - %s", oidChunk, e)
-                        singleOids.update(oidChunk)
-                oidsToTest = []
-                if singleOids and chunkSize > 1:
-                    chunkSize = 1
-                    log.debug("running oids for %s in single mode %s" % (self._devId, singleOids))
-                    oidsToTest = list(singleOids)
+                        failed.append(oidChunk)
+                defer.returnValue(failed)
+
+            badOids = yield isolateBadOids(
+                chunk(oids, self._maxOidsPerRequest), fetchChunks)
+            if badOids:
+                log.debug("unable to read oids for %s %s" % (self._devId, badOids))
             self._storePerfStats(results)
 
     def _storePerfStats(self, results):
@@ -0,0 +1,280 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__ = """IcmpEngine
+
+Sends ICMP and ICMPv6 echo requests from inside zenping and matches the
+replies to the outstanding requests, on the reactor.
+"""
+
+import os
+import time
+import errno
+import socket
+import logging
+from collections import deque
+
+from zope import interface
+from twisted.internet import defer, reactor
+from twisted.internet.interfaces import IReadDescriptor
+
+from .IcmpPacket import buildEchoRequest, parseEchoReply, packedAddress, \
+    openIcmpSocket
+
+log = logging.getLogger("zen.zenping.icmp")
+
+# echo requests sent per second
+DEFAULT_RATE = 500
+
+# seconds between the sends of a burst of echo requests
+_TICK = 0.01
+
+# most replies read from a socket each time it is readable
+_MAX_READS = 256
+
+_READ_SIZE = 65536
+
+
+class _Probe(object):
+    """
+    An echo request waiting to be sent or answered.
+    """
+    __slots__ = ('ip', 'ipVersion', 'address', 'timeout', 'payload',
+                 'deferred', 'sent', 'timeoutCall')
+
+    def __init__(self, ip, ipVersion, timeout, payload):
+        self.ip = ip
+        self.ipVersion = ipVersion
+        self.address = packedAddress(ipVersion, ip)
+        self.timeout = timeout
+        self.payload = payload
+        self.deferred = defer.Deferred()
+        self.sent = None
+        self.timeoutCall = None
+
+
+class _IcmpReader(object):
+    """
+    Reads the replies arriving on an ICMP socket.
+    """
+    interface.implements(IReadDescriptor)
+
+    def __init__(self, engine, ipVersion, sock, raw):
+        self.engine = engine
+        self.ipVersion = ipVersion
+        self.socket = sock
+        self.raw = raw
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def logPrefix(self):
+        return 'IcmpEngine'
+
+    def doRead(self):
+        for i in xrange(_MAX_READS):
+            try:
+                data, address = self.socket.recvfrom(_READ_SIZE)
+            except socket.error as ex:
+                if ex.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    return
+                log.debug("Error reading ICMPv%d socket: %s", self.ipVersion, ex)
+                return
+            self.engine._received(self, data, address[0])
+
+    def connectionLost(self, reason):
+        self.socket.close()
+
+
+class IcmpEngine(object):
+    """
+    Pings IP addresses with echo requests sent from this process.
+
+    Echo requests are queued and sent in bursts, at most rate per second:
+    a burst is sent right away unless the previous one was sent less than
+    its share of a second ago.  Each one is sent with its own sequence
+    number, so replies are matched to requests by the sequence number and
+    the address they came from.
+
+    @param rate: echo requests sent per second; 0 for no limit
+    @type rate: int
+    """
+
+    def __init__(self, rate=DEFAULT_RATE):
+        self.rate = rate
+        self._ident = os.getpid() & 0xffff
+        self._seq = 0
+        self._readers = {}
+        self._queue = deque()
+        self._outstanding = {}
+        self._sendCall = None
+        self._shutdownTrigger = None
+
+    def available(self, ipVersion):
+        """
+        Whether echo requests can be sent to addresses of ipVersion.
+        """
+        return self._getReader(ipVersion) is not None
+
+    def _getReader(self, ipVersion):
+        if ipVersion not in self._readers:
+            sock, raw = openIcmpSocket(ipVersion)
+            if sock is None:
+                log.info("No ICMPv%d socket available", ipVersion)
+                self._readers[ipVersion] = None
+            else:
+                log.debug("Opened %s ICMPv%d socket", 'raw' if raw else
+                          'datagram', ipVersion)
+                reader = _IcmpReader(self, ipVersion, sock, raw)
+                self._readers[ipVersion] = reader
+                reactor.addReader(reader)
+                if self._shutdownTrigger is None:
+                    self._shutdownTrigger = reactor.addSystemEventTrigger(
+                        'before', 'shutdown', self.close)
+        return self._readers[ipVersion]
+
+    def ping(self, ip, ipVersion=4, timeout=1.5, dataLength=0):
+        """
+        Send an echo request to ip.
+
+        @param ip: the IP address to ping
+        @type ip: string
+        @param ipVersion: 4 or 6
+        @type ipVersion: int
+        @param timeout: seconds to wait for the reply
+        @type timeout: float
+        @param dataLength: bytes of data sent in the echo request
+        @type dataLength: int
+        @return: a Deferred firing with the round trip time in milliseconds,
+            or None if no reply came before the timeout
+        """
+        if self._getReader(ipVersion) is None:
+            return defer.fail(socket.error(
+                "No ICMPv%d socket available" % ipVersion))
+        probe = _Probe(ip, ipVersion, timeout, '\0' * max(dataLength, 0))
+        self._queue.append(probe)
+        if self._sendCall is None:
+            self._sendQueued()
+        return probe.deferred
+
+    def _nextSeq(self, ipVersion):
+        for i in xrange(0x10000):
+            self._seq = (self._seq + 1) & 0xffff
+            if (ipVersion, self._seq) not in self._outstanding:
+                return self._seq
+        return None
+
+    def _sendQueued(self):
+        self._sendCall = None
+        if self.rate > 0:
+            burst = max(1, int(round(self.rate * _TICK)))
+        else:
+            burst = len(self._queue)
+        sent = 0
+        while self._queue and sent < burst:
+            probe = self._queue.popleft()
+            seq = self._nextSeq(probe.ipVersion)
+            if seq is None:
+                # every sequence number is waiting for a reply
+                self._queue.appendleft(probe)
+                break
+            self._send(probe, seq)
+            sent += 1
+        if self.rate > 0 and sent:
+            # pace the next burst, even if nothing is queued for it yet
+            delay = float(sent) / self.rate
+        elif self._queue:
+            # wait for sequence numbers to be freed
+            delay = _TICK
+        else:
+            return
+        self._sendCall = reactor.callLater(delay, self._sendQueued)
+
+    def _send(self, probe, seq):
+        reader = self._readers[probe.ipVersion]
+        packet = buildEchoRequest(probe.ipVersion, self._ident, seq,
+                                  probe.payload)
+        if probe.ipVersion == 4:
+            destination = (probe.ip, 0)
+        else:
+            destination = (probe.ip, 0, 0, 0)
+        key = (probe.ipVersion, seq)
+        probe.sent = time.time()
+        try:
+            reader.socket.sendto(packet, destination)
+        except socket.error as ex:
+            # unreachable networks and the like are a failed ping
+            log.debug("Unable to send echo request to %s: %s", probe.ip, ex)
+            probe.deferred.callback(None)
+            return
+        self._outstanding[key] = probe
+        probe.timeoutCall = reactor.callLater(probe.timeout, self._timedOut, key)
+
+    def _timedOut(self, key):
+        probe = self._outstanding.pop(key, None)
+        if probe is not None:
+            probe.deferred.callback(None)
+
+    def _received(self, reader, data, sender):
+        ipVersion = reader.ipVersion
+        reply = parseEchoReply(ipVersion, data,
+                               ipHeader=reader.raw and ipVersion == 4)
+        if reply is None:
+            return
+        ident, seq = reply
+        # datagram sockets replace the identifier with their own and only
+        # receive their own replies
+        if reader.raw and ident != self._ident:
+            return
+        key = (ipVersion, seq)
+        probe = self._outstanding.get(key)
+        if probe is None:
+            return
+        try:
+            if packedAddress(ipVersion, sender) != probe.address:
+                return
+        except (socket.error, ValueError):
+            return
+        del self._outstanding[key]
+        probe.timeoutCall.cancel()
+        probe.deferred.callback((time.time() - probe.sent) * 1000.0)
+
+    def close(self):
+        """
+        Close the sockets; outstanding and queued pings fire with None.
+        """
+        if self._sendCall is not None:
+            self._sendCall.cancel()
+            self._sendCall = None
+        for reader in self._readers.itervalues():
+            if reader is not None:
+                reactor.removeReader(reader)
+                reader.socket.close()
+        self._readers.clear()
+        probes = list(self._queue) + self._outstanding.values()
+        self._queue.clear()
+        self._outstanding.clear()
+        for probe in probes:
+            if probe.timeoutCall is not None and probe.timeoutCall.active():
+                probe.timeoutCall.cancel()
+            probe.deferred.callback(None)
+
+
+_engine = None
+
+
+def getEngine():
+    """
+    Return the ICMP engine shared by the ping tasks of this process.
+    """
+    global _engine
+    if _engine is None:
+        _engine = IcmpEngine()
+    return _engine
@@ -0,0 +1,110 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__ = """IcmpPacket
+
+Build ICMP and ICMPv6 echo requests, parse echo replies and open the
+sockets to send them with.
+"""
+
+import socket
+import struct
+import logging
+log = logging.getLogger("zen.zenping.icmp")
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+ICMP6_ECHO_REQUEST = 128
+ICMP6_ECHO_REPLY = 129
+
+# type, code, checksum, identifier, sequence number
+_ECHO = struct.Struct('!BBHHH')
+
+_FAMILIES = {
+    4: (socket.AF_INET, socket.IPPROTO_ICMP),
+    6: (socket.AF_INET6, getattr(socket, 'IPPROTO_ICMPV6', 58)),
+}
+
+
+def checksum(data):
+    """
+    Return the internet checksum (RFC 1071) of data.
+    """
+    if len(data) % 2:
+        data += '\0'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def buildEchoRequest(ipVersion, ident, seq, payload):
+    """
+    Return an echo request packet.  The kernel computes the checksum of
+    ICMPv6 packets.
+    """
+    kind = ICMP_ECHO_REQUEST if ipVersion == 4 else ICMP6_ECHO_REQUEST
+    header = _ECHO.pack(kind, 0, 0, ident, seq)
+    if ipVersion == 4:
+        header = _ECHO.pack(kind, 0, checksum(header + payload), ident, seq)
+    return header + payload
+
+
+def parseEchoReply(ipVersion, data, ipHeader=False):
+    """
+    Return the identifier and sequence number of an echo reply, or None if
+    data is any other packet.
+
+    @param ipHeader: data starts with an IPv4 header, as read from raw
+        IPv4 sockets
+    @type ipHeader: boolean
+    """
+    if ipHeader:
+        if not data:
+            return None
+        data = data[(ord(data[0]) & 0x0f) * 4:]
+    if len(data) < _ECHO.size:
+        return None
+    kind, code, csum, ident, seq = _ECHO.unpack_from(data)
+    if kind != (ICMP_ECHO_REPLY if ipVersion == 4 else ICMP6_ECHO_REPLY):
+        return None
+    return ident, seq
+
+
+def packedAddress(ipVersion, address):
+    """
+    Return the binary form of address, for comparing addresses written
+    differently.
+    """
+    # strip the scope of link-local IPv6 addresses
+    address = address.split('%', 1)[0]
+    return socket.inet_pton(_FAMILIES[ipVersion][0], address)
+
+
+def openIcmpSocket(ipVersion):
+    """
+    Open a non-blocking ICMP socket: a raw socket when privileged, otherwise
+    an unprivileged ICMP datagram socket where the system allows them.
+
+    @return: the socket and whether it is raw, or (None, False) if no
+        ICMP socket can be opened
+    @rtype: tuple
+    """
+    family, proto = _FAMILIES[ipVersion]
+    for sockType, raw in ((socket.SOCK_RAW, True), (socket.SOCK_DGRAM, False)):
+        try:
+            sock = socket.socket(family, sockType, proto)
+        except socket.error as ex:
+            log.debug("Unable to open %s ICMPv%d socket: %s",
+                      'raw' if raw else 'datagram', ipVersion, ex)
+            continue
+        sock.setblocking(0)
+        return sock, raw
+    return None, False
@@ -0,0 +1,128 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+__doc__ = """IcmpPingTask
+
+Determines the availability of IP addresses with echo requests sent by
+zenping itself, without running ping or nmap.
+"""
+
+import time
+import logging
+log = logging.getLogger("zen.zenping.icmp")
+
+from twisted.internet import defer
+
+import Globals
+from zope import interface
+
+from Products import ZenStatus
+from Products.ZenStatus.nmap.PingResult import PingResult
+
+from .IcmpEngine import getEngine, DEFAULT_RATE
+
+_NAN = float('nan')
+
+
+class IcmpPingCollectionPreferences(ZenStatus.PingCollectionPreferences):
+
+    def buildOptions(self, parser):
+        super(IcmpPingCollectionPreferences, self).buildOptions(parser)
+        parser.add_option('--icmp-rate',
+            dest='icmpRate',
+            default=DEFAULT_RATE,
+            type='int',
+            help="Most echo requests sent per second by the icmp ping "
+                 "backend, 0 for no limit (default: %default)")
+
+    def postStartup(self):
+        getEngine().rate = self.options.icmpRate
+
+
+class IcmpPingTaskFactory(object):
+    """
+    A Factory to create PingTasks using the ICMP engine.  IPs of a version
+    the engine cannot ping, e.g. because zenping may not open ICMP sockets,
+    are pinged with command line ping instead.
+    """
+    interface.implements(ZenStatus.interfaces.IPingTaskFactory)
+
+    def __init__(self):
+        self.reset()
+        self._warned = set()
+
+    def build(self):
+        ipVersion = self.config.monitoredIps[0].ipVersion
+        if getEngine().available(ipVersion):
+            taskClass = IcmpPingTask
+        else:
+            if ipVersion not in self._warned:
+                self._warned.add(ipVersion)
+                log.warning("Unable to send ICMPv%d echo requests; using "
+                            "command line ping for IPv%d addresses",
+                            ipVersion, ipVersion)
+            # imported here as it looks for the ping commands when loaded
+            from Products.ZenStatus.ping.CmdPingTask import CmdPingTask
+            taskClass = CmdPingTask
+        return taskClass(
+            self.name,
+            self.configId,
+            self.interval,
+            self.config,
+        )
+
+    def reset(self):
+        self.name = None
+        self.configId = None
+        self.interval = None
+        self.config = None
+
+
+class IcmpPingTask(ZenStatus.PingTask):
+    interface.implements(ZenStatus.interfaces.IPingTask)
+
+    def doTask(self):
+        """
+        Contact to one device and return a deferred which gathers data from
+        the device.
+
+        @return: A task to ping the device and any of its interfaces.
+        @rtype: Twisted deferred object
+        """
+        self.resetPingResult()
+        return self._pingIp()
+
+    @defer.inlineCallbacks
+    def _pingIp(self):
+        engine = getEngine()
+        attempts = 0
+        while attempts < self.config.tries:
+            attempts += 1
+            timestamp = time.time()
+            rtt = yield engine.ping(self.config.ip,
+                                    ipVersion=self.config.ipVersion,
+                                    timeout=float(self._preferences.pingTimeOut),
+                                    dataLength=self._daemon.options.dataLength)
+            isUp = rtt is not None
+            pingResult = PingResult(self.config.ip, timestamp, isUp,
+                                    rtt if isUp else _NAN)
+            self.logPingResult(pingResult)
+            if not self.config.points and isUp:
+                # if there are no datapoints to store
+                # and there is at least 1 ping up, then go on
+                break
+
+        if self.isUp:
+            log.debug("%s is up!", self.config.ip)
+            self.sendPingUp()
+        else:
+            log.debug("%s is down", self.config.ip)
+            self.sendPingDown()
+        self.storeResults()
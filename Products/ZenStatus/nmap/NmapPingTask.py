@@ -96,6 +96,12 @@ class NmapPingCollectionPreferences(PingCollectionPreferences):
             default=False,
             action="store_true",
             help="Suppress ping downs using interfaces on a device whose IPs may not be monitored")
+        parser.add_option('--ping-every-try',
+            dest='pingEveryTry',
+            default=False,
+            action="store_true",
+            help="Ping every IP on each of the ping tries, rather than "
+                 "stopping once an IP without datapoints has answered")
 
 class NPingTaskFactory(object):
     """
@@ -311,14 +317,8 @@ class NmapPingTask(BaseTask):
         # only increment if we have tasks to ping
         self._pings += 1
         with tempfile.NamedTemporaryFile(prefix='zenping_nmap_') as tfile:
-            ips = []
             for taskName, ipTask in ipTasks.iteritems():
-                ips.append(ipTask.config.ip)
                 ipTask.resetPingResult() # clear out previous run's results
-            ips.sort()
-            for ip in ips:
-                tfile.write("%s\n" % ip)
-            tfile.flush()
 
             # ping up to self._preferences.pingTries
             tracerouteInterval = self._daemon.options.tracerouteInterval
@@ -331,26 +331,36 @@ class NmapPingTask(BaseTask):
 
             import time
             i = 0
+            pending = ipTasks
             for attempt in range(0, self._daemon._prefs.pingTries):
 
+                # write the IPs to ping on this attempt
+                ips = sorted(set(ipTask.config.ip for ipTask in pending.itervalues()))
+                tfile.seek(0)
+                tfile.truncate()
+                for ip in ips:
+                    tfile.write("%s\n" % ip)
+                tfile.flush()
+
                 start = time.time()
                 results = yield executeNmapCmd(
                     tfile.name,
                     traceroute=doTraceroute,
-                    num_devices=len(ipTasks),
+                    num_devices=len(ips),
                     dataLength=self._daemon.options.dataLength,
                     pingTries=self._daemon._prefs.pingTries,
                     pingTimeOut=self._preferences.pingTimeOut,
                     pingCycleInterval=self._daemon._prefs.pingCycleInterval
                 )
                 elapsed = time.time() - start
-                log.debug("Nmap execution took %f seconds", elapsed)
+                log.debug("Nmap execution took %f seconds for %d IPs",
+                          elapsed, len(ips))
 
                 # only do traceroute on the first ping attempt, if at all
                 doTraceroute = False 
 
                 # record the results!
-                for taskName, ipTask in ipTasks.iteritems():
+                for taskName, ipTask in pending.iteritems():
                     i += 1
                     ip = ipTask.config.ip
                     if ip in results:
@@ -363,6 +373,16 @@ class NmapPingTask(BaseTask):
                     if i % _SENDEVENT_YIELD_INTERVAL:
                         yield twistedTask.deferLater(reactor, 0, lambda: None)
 
+                if not self._daemon.options.pingEveryTry:
+                    # hosts that answered are up whatever later tries say;
+                    # keep pinging those with datapoints to store, so that
+                    # their statistics come from every try
+                    pending = dict((taskName, ipTask)
+                                   for taskName, ipTask in pending.iteritems()
+                                   if not ipTask.isUp or ipTask.config.points)
+                    if not pending:
+                        break
+
             self._cleanupDownCounts()
             dcs = self._down_counts
             delayCount = self._daemon.options.delayCount
@@ -29,23 +29,34 @@ _STATE_TO_STRING_MAP = { True: 'up', False: 'down'}
 _NAN = float('nan')
 _NO_TRACE = tuple()
 
+def iterNmapXml(input):
+    """
+    Parse the XML output of nmap incrementally and yield a PingResult for
+    each host.  Host elements are discarded once parsed, so memory use does
+    not grow with the number of hosts.
+    """
+    for event, hostTree in etree.iterparse(input, events=('end',), tag='host'):
+        parent = hostTree.getparent()
+        if parent is None or parent.tag != 'nmaprun':
+            continue
+        yield PingResult.createNmapResult(hostTree)
+        hostTree.clear()
+        # drop the host elements already parsed
+        while hostTree.getprevious() is not None:
+            del parent[0]
+
 def parseNmapXml(input):
     """
     Parse the XML output of nmap and return a list PingResults.
     """
-    results = []
-    parseTree = etree.parse(input)
-    for hostTree in parseTree.xpath('/nmaprun/host'):
-        result = PingResult.createNmapResult(hostTree)
-        results.append(result)
-    return (results)
+    return list(iterNmapXml(input))
 
 def parseNmapXmlToDict(input):
     """
     Parse the XML output of nmap and return a dict of PingResults indexed by IP.
     """
     rdict = {}
-    for result in parseNmapXml(input):
+    for result in iterNmapXml(input):
         rdict[result.address] = result
     return rdict
 
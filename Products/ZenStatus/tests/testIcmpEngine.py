@@ -0,0 +1,122 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+import unittest
+
+from twisted.internet.task import Clock
+
+from Products.ZenStatus.icmp import IcmpEngine, IcmpPacket
+
+
+class FakeReactor(Clock):
+
+    def addReader(self, reader):
+        pass
+
+    def removeReader(self, reader):
+        pass
+
+    def addSystemEventTrigger(self, *args):
+        return None
+
+
+class FakeSocket(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, packet, destination):
+        self.sent.append((packet, destination[0]))
+
+    def close(self):
+        pass
+
+
+def reply(packet):
+    return chr(IcmpPacket.ICMP_ECHO_REPLY) + packet[1:]
+
+
+def results(d):
+    fired = []
+    d.addCallback(fired.append)
+    return fired
+
+
+class IcmpEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reactor = FakeReactor()
+        self._reactor = IcmpEngine.reactor
+        IcmpEngine.reactor = self.reactor
+        self.socket = FakeSocket()
+
+    def tearDown(self):
+        IcmpEngine.reactor = self._reactor
+
+    def createEngine(self, rate):
+        engine = IcmpEngine.IcmpEngine(rate)
+        self.reader = IcmpEngine._IcmpReader(engine, 4, self.socket, False)
+        engine._readers[4] = self.reader
+        return engine
+
+    def testPacing(self):
+        # one echo request every 0.1 seconds
+        engine = self.createEngine(rate=10)
+        for i in range(4):
+            engine.ping('10.0.0.%d' % i)
+        self.assertEqual(1, len(self.socket.sent))
+        self.reactor.advance(0.1)
+        self.assertEqual(2, len(self.socket.sent))
+        self.reactor.advance(0.1)
+        self.reactor.advance(0.1)
+        self.assertEqual(4, len(self.socket.sent))
+        # the queue is empty, but the last request was sent just now
+        engine.ping('10.0.0.4')
+        self.assertEqual(4, len(self.socket.sent))
+        self.reactor.advance(0.1)
+        self.assertEqual(5, len(self.socket.sent))
+        self.reactor.advance(1)
+        engine.ping('10.0.0.5')
+        self.assertEqual(6, len(self.socket.sent))
+
+    def testMatchReply(self):
+        engine = self.createEngine(rate=0)
+        first = results(engine.ping('10.0.0.1'))
+        second = results(engine.ping('10.0.0.2'))
+        self.assertEqual(2, len(self.socket.sent))
+        packet, ip = self.socket.sent[1]
+        # the sequence number is right, but not the address
+        engine._received(self.reader, reply(packet), '10.0.0.1')
+        self.assertEqual([], first + second)
+        engine._received(self.reader, reply(packet), '10.0.0.2')
+        self.assertEqual([], first)
+        self.assertEqual(1, len(second))
+        self.assertTrue(second[0] >= 0)
+        # only the timeout of the first request is left
+        self.assertEqual(1, len(self.reactor.getDelayedCalls()))
+
+    def testTimeout(self):
+        engine = self.createEngine(rate=0)
+        fired = results(engine.ping('10.0.0.1', timeout=1.5))
+        self.reactor.advance(1)
+        self.assertEqual([], fired)
+        self.reactor.advance(0.5)
+        self.assertEqual([None], fired)
+        # a late reply is ignored
+        packet, ip = self.socket.sent[0]
+        engine._received(self.reader, reply(packet), ip)
+        self.assertEqual([None], fired)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(IcmpEngineTest))
+    return suite
@@ -0,0 +1,84 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+import time
+import select
+import struct
+import unittest
+
+from Products.ZenStatus.icmp import IcmpPacket
+
+
+class IcmpPacketTest(unittest.TestCase):
+
+    def testChecksum(self):
+        packet = IcmpPacket.buildEchoRequest(4, 0x1234, 7, 'abc')
+        # a packet including its checksum sums to zero
+        self.assertEqual(IcmpPacket.checksum(packet), 0)
+        self.assertEqual(IcmpPacket.checksum('\x00\x01\xf2\x03'), 0x0dfb)
+
+    def testParseReply(self):
+        request = IcmpPacket.buildEchoRequest(4, 0x1234, 7, 'data')
+        # a request is not a reply
+        self.assertEqual(IcmpPacket.parseEchoReply(4, request), None)
+        reply = chr(IcmpPacket.ICMP_ECHO_REPLY) + request[1:]
+        self.assertEqual(IcmpPacket.parseEchoReply(4, reply), (0x1234, 7))
+        # raw IPv4 sockets read the IP header too
+        ipHeader = '\x46' + '\0' * 23
+        self.assertEqual(IcmpPacket.parseEchoReply(4, ipHeader + reply, True),
+                         (0x1234, 7))
+        self.assertEqual(IcmpPacket.parseEchoReply(4, reply[:6]), None)
+
+    def testIcmp6(self):
+        request = IcmpPacket.buildEchoRequest(6, 1, 2, '')
+        self.assertEqual(struct.unpack('!BBHHH', request),
+                         (IcmpPacket.ICMP6_ECHO_REQUEST, 0, 0, 1, 2))
+        reply = chr(IcmpPacket.ICMP6_ECHO_REPLY) + request[1:]
+        self.assertEqual(IcmpPacket.parseEchoReply(6, reply), (1, 2))
+        self.assertEqual(IcmpPacket.parseEchoReply(4, reply), None)
+
+    def testPackedAddress(self):
+        self.assertEqual(IcmpPacket.packedAddress(4, '127.0.0.1'),
+                         '\x7f\0\0\x01')
+        self.assertEqual(IcmpPacket.packedAddress(6, 'fe80::1%eth0'),
+                         IcmpPacket.packedAddress(6, 'fe80:0::1'))
+
+    def testLoopback(self):
+        sock, raw = IcmpPacket.openIcmpSocket(4)
+        if sock is None:
+            return
+        try:
+            request = IcmpPacket.buildEchoRequest(4, 0x4321, 99, 'zenping')
+            sock.sendto(request, ('127.0.0.1', 0))
+            deadline = time.time() + 2
+            while time.time() < deadline:
+                select.select([sock], [], [], 0.1)
+                try:
+                    data, address = sock.recvfrom(1024)
+                except IOError:
+                    continue
+                reply = IcmpPacket.parseEchoReply(4, data, ipHeader=raw)
+                if reply is not None:
+                    break
+            else:
+                self.fail("No echo reply from 127.0.0.1")
+            self.assertEqual(address[0], '127.0.0.1')
+            self.assertEqual(reply[1], 99)
+            if raw:
+                self.assertEqual(reply[0], 0x4321)
+        finally:
+            sock.close()
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(IcmpPacketTest))
+    return suite
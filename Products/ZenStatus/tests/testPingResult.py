@@ -108,10 +108,18 @@ class TestPingResult(BaseTestCase):
             os.path.dirname(os.path.realpath(__file__)),
             'nmap_ping.xml'])
         # parse the example nmap output
+        self._nmap_testfile = nmap_testfile
         input = open(nmap_testfile)
         result = PingResult.parseNmapXmlToDict(input)
         # hang it off self for tests to use
         self._result = result
+
+    def testIncrementalParse(self):
+        from lxml import etree
+        hosts = etree.parse(self._nmap_testfile).xpath('/nmaprun/host')
+        results = list(PingResult.iterNmapXml(open(self._nmap_testfile)))
+        self.assertEqual(len(results), len(hosts))
+        self.assertEqual(len(results), len(self._result))
         
     def testHostList(self):
         for o in testObjs:
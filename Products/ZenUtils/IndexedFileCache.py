@@ -0,0 +1,283 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+
+"""
+Single file, append-only key/value cache.
+
+Every write appends a record (the key and the pickled value, or a deletion
+marker) to a log file; an in-memory table maps each live key to the offset
+of its latest value, so values are only read and unpickled when asked for.
+Records superseded by later writes are dropped by compact(), which rewrites
+the live records to a new file.  The cache is thread-safe but expects to be
+the only writer of its file.
+"""
+
+import os
+import struct
+import logging
+import threading
+import tempfile
+import cPickle as pickle
+
+log = logging.getLogger('zen.IndexedFileCache')
+
+_MAGIC = 'ZIFC\x01'
+# record header: record type, key length, value length
+_HEADER = struct.Struct('!BII')
+_PUT = 1
+_DELETE = 2
+
+_DEFAULT_NOT_SPECIFIED = object()
+
+
+def _encode(key):
+    if isinstance(key, unicode):
+        return key.encode('utf-8')
+    return key
+
+
+class IndexedFileCache(object):
+    """
+    Dictionary-like cache stored in one file.
+
+    @param filename: path of the log file; created if it does not exist
+    @type filename: string
+    @param protocol: pickle protocol of the stored values
+    @type protocol: int
+    """
+
+    # compact a file with more dead than live bytes
+    COMPACT_MIN_BYTES = 1 << 20
+
+    def __init__(self, filename, protocol=-1):
+        self.filename = filename
+        self._pickleProtocol = protocol
+        self.lock = threading.Lock()
+        # key -> (offset of value, length of value)
+        self._index = {}
+        self._size = 0
+        dirName = os.path.dirname(filename)
+        if dirName and not os.path.exists(dirName):
+            os.makedirs(dirName)
+        self._file = self._open()
+        if self.shouldCompact():
+            self.compact()
+
+    def _open(self):
+        f = open(self.filename, 'a+b')
+        f.seek(0)
+        if f.read(len(_MAGIC)) != _MAGIC:
+            # new, empty or unreadable file
+            f.seek(0)
+            f.truncate()
+            f.write(_MAGIC)
+            f.flush()
+            self._size = len(_MAGIC)
+            return f
+        self._readIndex(f)
+        return f
+
+    def _readIndex(self, f):
+        index = {}
+        offset = len(_MAGIC)
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(offset)
+        while offset < size:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                break
+            kind, keyLength, valueLength = _HEADER.unpack(header)
+            end = offset + _HEADER.size + keyLength + valueLength
+            if kind not in (_PUT, _DELETE) or end > size:
+                break
+            key = f.read(keyLength)
+            if kind == _PUT:
+                index[key] = (offset + _HEADER.size + keyLength, valueLength)
+            else:
+                index.pop(key, None)
+            f.seek(end)
+            offset = end
+        if offset < size:
+            # a record was only partly written; drop it
+            log.warn("Truncating %d bytes of incomplete data in %s",
+                     size - offset, self.filename)
+            f.truncate(offset)
+        self._index = index
+        self._size = offset
+
+    def garbageBytes(self):
+        """
+        Return the number of bytes taken by superseded records.
+        """
+        live = sum(_HEADER.size + len(key) + length
+                   for key, (offset, length) in self._index.iteritems())
+        return self._size - len(_MAGIC) - live
+
+    def shouldCompact(self):
+        """
+        Does the file hold enough superseded records to be compacted?
+        """
+        garbage = self.garbageBytes()
+        return garbage > self.COMPACT_MIN_BYTES and garbage > self._size - garbage
+
+    def _append(self, records):
+        # encode every record before writing, and index them only once
+        # they are written, so a failure leaves the index as it was
+        offset = self._size
+        chunks = []
+        entries = []
+        for key, value in records:
+            key = _encode(key)
+            if value is _DEFAULT_NOT_SPECIFIED:
+                chunks.append(_HEADER.pack(_DELETE, len(key), 0) + key)
+                entries.append((key, None))
+                offset += _HEADER.size + len(key)
+            else:
+                data = pickle.dumps(value, self._pickleProtocol)
+                chunks.append(_HEADER.pack(_PUT, len(key), len(data)) + key)
+                chunks.append(data)
+                valueOffset = offset + _HEADER.size + len(key)
+                entries.append((key, (valueOffset, len(data))))
+                offset = valueOffset + len(data)
+        f = self._file
+        try:
+            f.seek(0, os.SEEK_END)
+            if f.tell() != self._size:
+                # drop what a failed write left behind
+                f.truncate(self._size)
+            f.write(''.join(chunks))
+            f.flush()
+        except Exception:
+            try:
+                f.truncate(self._size)
+            except Exception:
+                log.exception("Unable to truncate %s", self.filename)
+            raise
+        for key, entry in entries:
+            if entry is None:
+                self._index.pop(key, None)
+            else:
+                self._index[key] = entry
+        self._size = offset
+
+    def _read(self, key):
+        offset, length = self._index[key]
+        self._file.seek(offset)
+        return pickle.loads(self._file.read(length))
+
+    def get(self, key, default=_DEFAULT_NOT_SPECIFIED):
+        key = _encode(key)
+        with self.lock:
+            if key not in self._index:
+                if default is _DEFAULT_NOT_SPECIFIED:
+                    raise KeyError('no such key ' + key)
+                return default
+            return self._read(key)
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self._append(((key, value),))
+
+    def __delitem__(self, key):
+        key = _encode(key)
+        with self.lock:
+            if key not in self._index:
+                raise KeyError('no such key ' + key)
+            self._append(((key, _DEFAULT_NOT_SPECIFIED),))
+
+    def update(self, items):
+        """
+        Store many (key, value) pairs with a single write.
+        """
+        with self.lock:
+            self._append(items)
+
+    def clear(self):
+        with self.lock:
+            self._file.seek(0)
+            self._file.truncate()
+            self._file.write(_MAGIC)
+            self._file.flush()
+            self._index = {}
+            self._size = len(_MAGIC)
+
+    def compact(self):
+        """
+        Rewrite the file with only the latest value of each key.
+        """
+        with self.lock:
+            dirName = os.path.dirname(self.filename) or '.'
+            tempFd, tempFn = tempfile.mkstemp(dir=dirName)
+            try:
+                index = {}
+                with os.fdopen(tempFd, 'wb') as tempF:
+                    tempF.write(_MAGIC)
+                    offset = len(_MAGIC)
+                    # copy in file order to read the old file sequentially
+                    for key, (valueOffset, length) in sorted(
+                            self._index.iteritems(), key=lambda i: i[1][0]):
+                        self._file.seek(valueOffset)
+                        data = self._file.read(length)
+                        tempF.write(_HEADER.pack(_PUT, len(key), length) + key)
+                        tempF.write(data)
+                        offset += _HEADER.size + len(key)
+                        index[key] = (offset, length)
+                        offset += length
+                    tempF.flush()
+                    os.fsync(tempF.fileno())
+                os.rename(tempFn, self.filename)
+            except Exception:
+                if os.path.exists(tempFn):
+                    os.remove(tempFn)
+                raise
+            self._file.close()
+            self._file = open(self.filename, 'a+b')
+            self._index = index
+            self._size = offset
+
+    def close(self):
+        with self.lock:
+            self._file.close()
+
+    def items(self):
+        with self.lock:
+            # read in file order
+            return [(key, self._read(key)) for key, entry in
+                    sorted(self._index.items(), key=lambda i: i[1][0])]
+
+    def keys(self):
+        with self.lock:
+            return self._index.keys()
+
+    def values(self):
+        return [v for k, v in self.items()]
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def __contains__(self, key):
+        return _encode(key) in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __bool__(self):
+        return bool(self._index)
+    __nonzero__ = __bool__
@@ -14,6 +14,17 @@ from Products.ZenRRD.Thresholds import Thresholds
 log = logging.getLogger("zen.MetricWriter")
 
 
+def _put_many(publisher, metrics):
+    """
+    Queue metrics on a publisher, one at a time if it has no put_many.
+    """
+    put_many = getattr(publisher, 'put_many', None)
+    if put_many is not None:
+        return put_many(metrics)
+    return defer.DeferredList([defer.maybeDeferred(publisher.put, *m)
+                               for m in metrics])
+
+
 class MetricWriter(object):
     def __init__(self, publisher):
         self._publisher = publisher
@@ -37,6 +48,22 @@ class MetricWriter(object):
         except Exception as x:
             log.exception(x)
 
+    def write_metrics(self, metrics):
+        """
+        Wraps a single call to a deferred publisher for many metrics
+
+        @param metrics: (metric, value, timestamp, tags) tuples
+        @return deferred: metrics were published or queued
+        """
+        try:
+            metrics = list(metrics)
+            log.debug("publishing %d metrics", len(metrics))
+            val = defer.maybeDeferred(_put_many, self._publisher, metrics)
+            self._datapoints += len(metrics)
+            return val
+        except Exception as x:
+            log.exception(x)
+
     @property
     def dataPoints(self):
         """
@@ -71,6 +98,25 @@ class FilteredMetricWriter(object):
         except Exception as x:
             log.exception(x)
 
+    def write_metrics(self, metrics):
+        """
+        Wraps a single call to a deferred publisher for the metrics that
+        pass the test_filter
+
+        @param metrics: (metric, value, timestamp, tags) tuples
+        @return deferred: metrics were published or queued
+        """
+        try:
+            test_filter = self._test_filter
+            metrics = [m for m in metrics if test_filter(*m)]
+            if metrics:
+                log.debug("publishing %d metrics", len(metrics))
+                val = defer.maybeDeferred(_put_many, self._publisher, metrics)
+                self._datapoints += len(metrics)
+                return val
+        except Exception as x:
+            log.exception(x)
+
     @property
     def dataPoints(self):
         """
@@ -104,6 +150,23 @@ class AggregateMetricWriter(object):
         self._datapoints += 1
         return defer.DeferredList(dList)
 
+    def write_metrics(self, metrics):
+        """
+        Writes many metrics to multiple metric writers
+
+        @param metrics: (metric, value, timestamp, tags) tuples
+        @return deferred: metrics were published or queued
+        """
+        metrics = list(metrics)
+        dList = []
+        for writer in self._writers:
+            try:
+                dList.append(defer.maybeDeferred(writer.write_metrics, metrics))
+            except Exception as x:
+                log.exception(x)
+        self._datapoints += len(metrics)
+        return defer.DeferredList(dList)
+
     @property
     def dataPoints(self):
         """
@@ -223,21 +286,42 @@ class ThresholdNotifier(object):
         @return:
         """
         if self._thresholds and value is not None:
-            if 'eventKey' in thresh_event_data:
-                eventKeyPrefix = [thresh_event_data['eventKey']]
-            else:
-                eventKeyPrefix = [metric]
             for ev in self._thresholds.check(context_uuid, metric, timestamp, value):
-                parts = eventKeyPrefix[:]
-                if 'eventKey' in ev:
-                    parts.append(ev['eventKey'])
-                ev['eventKey'] = '|'.join(parts)
-                # add any additional values for this threshold
-                # (only update if key is not in event, or if
-                # the event's value is blank or None)
-                for key, value in thresh_event_data.items():
-                    if ev.get(key, None) in ('', None):
-                        ev[key] = value
-                if ev.get("component", None):
-                    ev['component_guid'] = context_uuid
-                self._send_callback(ev)
+                self._sendThresholdEvent(ev, context_uuid, metric, thresh_event_data)
+
+    def notifyBatch(self, values):
+        """
+        Check many values against thresholds and send any generated events.
+
+        @param values: (context_uuid, context_id, metric, timestamp, value,
+            thresh_event_data) tuples, as passed to notify
+        @type values: sequence
+        """
+        if not self._thresholds:
+            return
+        values = [v for v in values if v[4] is not None]
+        checked = self._thresholds.checkBatch(
+            [(v[0], v[2], v[3], v[4]) for v in values])
+        for i, events in checked:
+            context_uuid, context_id, metric, timestamp, value, thresh_event_data = values[i]
+            for ev in events:
+                self._sendThresholdEvent(ev, context_uuid, metric, thresh_event_data)
+
+    def _sendThresholdEvent(self, ev, context_uuid, metric, thresh_event_data):
+        if 'eventKey' in thresh_event_data:
+            eventKeyPrefix = [thresh_event_data['eventKey']]
+        else:
+            eventKeyPrefix = [metric]
+        parts = eventKeyPrefix[:]
+        if 'eventKey' in ev:
+            parts.append(ev['eventKey'])
+        ev['eventKey'] = '|'.join(parts)
+        # add any additional values for this threshold
+        # (only update if key is not in event, or if
+        # the event's value is blank or None)
+        for key, value in thresh_event_data.items():
+            if ev.get(key, None) in ('', None):
+                ev[key] = value
+        if ev.get("component", None):
+            ev['component_guid'] = context_uuid
+        self._send_callback(ev)
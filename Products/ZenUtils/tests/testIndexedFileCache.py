@@ -0,0 +1,126 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import os
+import shutil
+import tempfile
+import unittest
+from Products.ZenUtils.IndexedFileCache import IndexedFileCache
+
+
+class IndexedFileCacheTest(unittest.TestCase):
+    """Tests IndexedFileCache"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cache', 'test.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testSetGetDelete(self):
+        cache = IndexedFileCache(self.filename)
+        cache['a'] = 1
+        cache[u'b'] = {'x': 2}
+        cache['a'] = 3
+        self.assertEqual(cache['a'], 3)
+        self.assertEqual(cache['b'], {'x': 2})
+        del cache['b']
+        self.assertFalse('b' in cache)
+        self.assertRaises(KeyError, cache.__getitem__, 'b')
+        self.assertRaises(KeyError, cache.__delitem__, 'b')
+        self.assertEqual(cache.get('b', None), None)
+        self.assertEqual(cache.items(), [('a', 3)])
+
+    def testReopen(self):
+        cache = IndexedFileCache(self.filename)
+        cache.update(('key%d' % i, range(i)) for i in xrange(100))
+        del cache['key5']
+        cache.close()
+
+        cache = IndexedFileCache(self.filename)
+        self.assertEqual(len(cache), 99)
+        self.assertEqual(cache['key42'], range(42))
+        self.assertFalse('key5' in cache)
+
+    def testIncompleteRecordDropped(self):
+        cache = IndexedFileCache(self.filename)
+        cache['a'] = 'value'
+        cache.close()
+        with open(self.filename, 'ab') as f:
+            f.write('\x01\x00\x00\x00')
+
+        cache = IndexedFileCache(self.filename)
+        self.assertEqual(cache.keys(), ['a'])
+        cache['b'] = 'other'
+        cache.close()
+        cache = IndexedFileCache(self.filename)
+        self.assertEqual(sorted(cache.items()), [('a', 'value'), ('b', 'other')])
+
+    def testCompact(self):
+        cache = IndexedFileCache(self.filename)
+        for i in xrange(10):
+            cache['a'] = i
+        cache['b'] = 'b'
+        self.assertTrue(cache.garbageBytes() > 0)
+        size = os.path.getsize(self.filename)
+        cache.compact()
+        self.assertEqual(cache.garbageBytes(), 0)
+        self.assertTrue(os.path.getsize(self.filename) < size)
+        self.assertEqual(cache['a'], 9)
+        cache['c'] = 'c'
+        cache.close()
+        cache = IndexedFileCache(self.filename)
+        self.assertEqual(sorted(cache.items()), [('a', 9), ('b', 'b'), ('c', 'c')])
+
+    def testFailedPickleNotIndexed(self):
+        cache = IndexedFileCache(self.filename)
+        cache['a'] = 1
+        self.assertRaises(Exception, cache.update,
+                          [('a', 2), ('b', lambda: None)])
+        self.assertEqual(cache.items(), [('a', 1)])
+        cache['c'] = 3
+        self.assertEqual(cache['c'], 3)
+
+    def testFailedWriteNotIndexed(self):
+        cache = IndexedFileCache(self.filename)
+        cache['a'] = 'value'
+        cache._file = DiskFullFile(cache._file)
+        self.assertRaises(IOError, cache.update, [('a', 'new'), ('b', 'b')])
+        self.assertEqual(cache.items(), [('a', 'value')])
+        cache._file = cache._file.f
+        cache['c'] = 'c'
+        self.assertEqual(cache.items(), [('a', 'value'), ('c', 'c')])
+        cache.close()
+        cache = IndexedFileCache(self.filename)
+        self.assertEqual(cache.items(), [('a', 'value'), ('c', 'c')])
+
+
+class DiskFullFile(object):
+    """
+    Writes half of what it is given, then fails.
+    """
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, data):
+        self.f.write(data[:len(data) // 2])
+        self.f.flush()
+        raise IOError(28, 'No space left on device')
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+
+def test_suite():
+    return unittest.TestSuite((unittest.makeSuite(IndexedFileCacheTest),))
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='test_suite')